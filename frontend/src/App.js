@@ -1,10 +1,10 @@
-import React, { useState, useCallback } from "react";
+import React, { useState, useCallback, useEffect, useRef } from "react";
 import { App, mainComponents, wrapperComponents, addLangToPathName, removeLangFromPathName } from "logicore-react-pages";
 import { GenericForm as TheGenericForm, submitButtonWidgets } from "logicore-forms";
 import Nav from 'react-bootstrap/Nav';
 import Navbar from 'react-bootstrap/Navbar';
 import NavDropdown from 'react-bootstrap/NavDropdown';
-import { DateTime } from "luxon";
+import { DateTime, Duration } from "luxon";
 import { Link, useLocation, useNavigate } from 'react-router-dom';
 import { Trans } from 'react-i18next';
 import './i18n';
@@ -175,11 +175,44 @@ const WelcomeView = (props) => (
 );
 
 const Game = (props) => {
-  const { pk, onChange, name, index, total, text } = props;
+  const { onChange, events_url } = props;
+  // With events_url, the next question (or the results) is pushed by the server
+  const [question, setQuestion] = useState(props);
+  const [nextQuestion, setNextQuestion] = useState();
   const [selectedAnswer, setSelectedAnswer] = useState();
   const [correctAnswer, setCorrectAnswer] = useState();
   const [navigateTo, setNavigateTo] = useState();
+  const questionPk = useRef(props.pk);
   const navigate = useNavigate();
+  const { pk, name, index, total, text } = question;
+
+  useEffect(() => {
+    questionPk.current = props.pk;
+    setQuestion(props);
+    setNextQuestion(undefined);
+    setSelectedAnswer(undefined);
+    setCorrectAnswer(undefined);
+    setNavigateTo(undefined);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [props.pk]);
+
+  useEffect(() => {
+    if (!events_url) return;
+    const source = new EventSource(events_url);
+    source.addEventListener("answer", (e) => {
+      const data = JSON.parse(e.data);
+      if (data.questionId === questionPk.current) setCorrectAnswer(data.correctAnswer);
+    });
+    source.addEventListener("question", (e) => {
+      const data = JSON.parse(e.data);
+      if (data.pk !== questionPk.current) setNextQuestion(data);
+    });
+    source.addEventListener("results", (e) => {
+      setNextQuestion(JSON.parse(e.data));
+      source.close();
+    });
+    return () => source.close();
+  }, [events_url]);
 
   const handleClick = useCallback((i) => {
     if (selectedAnswer) return;
@@ -192,13 +225,30 @@ const Game = (props) => {
     });
   }, [pk, selectedAnswer, onChange]);
 
+  const handleNext = useCallback(() => {
+    if (!nextQuestion) {
+      navigate(navigateTo);
+      return;
+    }
+    questionPk.current = nextQuestion.pk;
+    setQuestion(nextQuestion);
+    setNextQuestion(undefined);
+    setSelectedAnswer(undefined);
+    setCorrectAnswer(undefined);
+    setNavigateTo(undefined);
+  }, [nextQuestion, navigateTo, navigate]);
+
+  if (question.template === "GameResults") {
+    return <GameResults {...question} />;
+  }
+
   return (
     <div className="container my-3">
       <h3><Trans>The Game</Trans>: «<Trans>{name}</Trans>»</h3>
       <div className="my-5">
         <h5 className="my-2"><Trans>Question</Trans> {index} / {total}</h5>
         <blockquote className="blockquote">{text}</blockquote>
-        <MediaComponent question={props} />
+        <MediaComponent question={question} />
         <div className="d-grid" style={{ gridTemplateColumns: "1fr 1fr", gridGap: 20 }}>
           {[1, 2, 3, 4].map(i => (
             <button
@@ -209,11 +259,11 @@ const Game = (props) => {
               onClick={() => handleClick(i)}
               disabled={!!correctAnswer}
             >
-              {props[`answer${i}`]}
+              {question[`answer${i}`]}
             </button>
           ))}
-          {!!navigateTo && (
-            <button className="btn btn-xl btn-primary" onClick={() => navigate(navigateTo)}>
+          {(!!nextQuestion || !!navigateTo) && (
+            <button className="btn btn-xl btn-primary" onClick={handleNext}>
               <Trans>Next question</Trans>
             </button>
           )}
@@ -224,12 +274,41 @@ const Game = (props) => {
 };
 
 
+const formatDuration = (seconds) => (
+  seconds === null || seconds === undefined ? "-" : Duration.fromMillis(seconds * 1000).toFormat("mm:ss")
+);
+
 const GameResults = (props) => (
   <div className="container my-3">
     <h3><Trans>The game</Trans></h3>
     <h2>«<Trans>{props.name}</Trans>»</h2>
     <div><Trans>Results</Trans></div>
-    TODO
+    <h4 className="my-3">
+      <Trans>Score</Trans>: {props.score} / {props.total}
+      {" · "}
+      <Trans>Time</Trans>: {formatDuration(props.duration)}
+    </h4>
+    <h3 className="mt-5"><Trans>Leaderboard</Trans></h3>
+    <table className="table table-border mt-3">
+      <thead>
+        <tr>
+          <th><Trans>Position</Trans></th>
+          <th><Trans>Name</Trans></th>
+          <th><Trans>Score</Trans></th>
+          <th><Trans>Time</Trans></th>
+        </tr>
+      </thead>
+      <tbody>
+        {props.leaderboard?.map((item, i) => (
+          <tr key={item.player_id}>
+            <td>{i + 1}</td>
+            <td>{item.player_name}</td>
+            <td>{item.score}</td>
+            <td>{formatDuration(item.duration)}</td>
+          </tr>
+        ))}
+      </tbody>
+    </table>
   </div>
 );
 
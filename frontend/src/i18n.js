@@ -29,7 +29,10 @@ i18n
           'Results will be published on': 'Les résultats seront publiés le',
           'Question': 'Question',
           'Start the game': 'Commencer le jeu',
-          'Next question': 'Question suivante'
+          'Next question': 'Question suivante',
+          'Score': 'Score',
+          'Time': 'Temps',
+          'Leaderboard': 'Classement'
         }
       },
       ru: {
@@ -52,7 +55,10 @@ i18n
           'Never': 'Никогда',
           'Position': 'Место',
           'Last start': 'Последний старт',
-          'Next question': 'Следующий вопрос'
+          'Next question': 'Следующий вопрос',
+          'Score': 'Очки',
+          'Time': 'Время',
+          'Leaderboard': 'Таблица лидеров'
         }
       }
     }
@@ -3,6 +3,13 @@ from adminsortable2.admin import SortableStackedInline, SortableAdminBase
 from .models import Collection, Question
 from django import forms
 
+
+def format_rate(stats):
+    if not stats or stats.correct_rate is None:
+        return "-"
+    return f"{stats.correct_rate:.0%} ({stats.correct_count} / {stats.answers_count})"
+
+
 class QuestionForm(forms.ModelForm):
     class Meta:
         model = Question
@@ -14,12 +21,37 @@ class QuestionForm(forms.ModelForm):
 class QuestionInline(SortableStackedInline):
     model = Question
     extra = 0
-    
+    readonly_fields = ["correct_rate", "answer_distribution"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("stats")
+
     def get_formset(self, request, obj=None, **kwargs):
         formset = super().get_formset(request, obj, **kwargs)
         return formset
 
+    @admin.display(description="Correct answers")
+    def correct_rate(self, obj):
+        return format_rate(getattr(obj, "stats", None))
+
+    @admin.display(description="Answers given")
+    def answer_distribution(self, obj):
+        stats = getattr(obj, "stats", None)
+        if not stats or not stats.answers_count:
+            return "-"
+        return ", ".join(
+            f"#{i}: {getattr(stats, f'answer{i}_count')}" for i in range(1, 5)
+        )
+
 class CollectionAdmin(SortableAdminBase, admin.ModelAdmin):
     inlines = [QuestionInline]
+    readonly_fields = ["correct_rate"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("stats")
+
+    @admin.display(description="Correct answers")
+    def correct_rate(self, obj):
+        return format_rate(getattr(obj, "stats", None))
 
 admin.site.register(Collection, CollectionAdmin)
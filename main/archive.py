@@ -0,0 +1,152 @@
+import glob
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import models
+from .stats import WATERMARK_NAME, refresh_stats
+
+ARCHIVE_FILE_NAME = "question_answers-{}.jsonl.gz"
+STATE_FILE_NAME = "state.json"
+
+
+def archivable_games(days):
+    cutoff = timezone.now() - timedelta(days=days)
+    return models.Game.objects.filter(
+        Q(completed_datetime__lt=cutoff) | Q(finished=True, modified_datetime__lt=cutoff)
+    )
+
+
+def read_state(archive_dir):
+    try:
+        with open(os.path.join(archive_dir, STATE_FILE_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_state(archive_dir, state):
+    path = os.path.join(archive_dir, STATE_FILE_NAME)
+    if state is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def recover(archive_dir):
+    """
+    Finishes (or rolls back) a chunk interrupted by a previous run
+    """
+    state = read_state(archive_dir)
+    if not state:
+        return
+    if state["phase"] == "writing":
+        # Some rows may be half-written: cut the files back
+        for path, size in state["files"].items():
+            if os.path.exists(path):
+                with open(path, "ab") as f:
+                    f.truncate(size)
+    elif state["phase"] == "written":
+        models.QuestionAnswer.objects.filter(id__in=state["ids"]).delete()
+    write_state(archive_dir, None)
+
+
+def archive_chunk(archive_dir, answers):
+    by_month = {}
+    for answer in answers:
+        month = answer["created_datetime"].strftime("%Y-%m")
+        by_month.setdefault(month, []).append(
+            {
+                "id": answer["id"],
+                "game_id": answer["game_id"],
+                "question_id": answer["question_id"],
+                "answer": answer["answer"],
+                "correct": answer["correct"],
+                "created": answer["created_datetime"].isoformat(),
+            }
+        )
+    paths = {
+        month: os.path.join(archive_dir, ARCHIVE_FILE_NAME.format(month))
+        for month in by_month
+    }
+    ids = [answer["id"] for answer in answers]
+    write_state(
+        archive_dir,
+        {
+            "phase": "writing",
+            "ids": ids,
+            "files": {
+                path: os.path.getsize(path) if os.path.exists(path) else 0
+                for path in paths.values()
+            },
+        },
+    )
+    for month, rows in by_month.items():
+        # Each chunk becomes a separate gzip member; readers see one stream
+        with gzip.open(paths[month], "at", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, separators=(",", ":")) + "\n")
+        with open(paths[month], "ab") as f:
+            os.fsync(f.fileno())
+    write_state(archive_dir, {"phase": "written", "ids": ids})
+    models.QuestionAnswer.objects.filter(id__in=ids).delete()
+    write_state(archive_dir, None)
+
+
+def archive_answers(days=None, archive_dir=None, chunk_size=None):
+    """
+    Moves the answers of games completed (or finished) more than `days` ago
+    into per-month gzipped JSONL files. Works chunk by chunk and can be
+    interrupted at any point: the next run completes or rolls back the
+    interrupted chunk. Statistics are refreshed first and only answers
+    already counted there are moved, so aggregates stay intact.
+    Returns the number of answers moved
+    """
+    days = settings.ANSWER_ARCHIVE_DAYS if days is None else days
+    archive_dir = archive_dir or settings.ANSWER_ARCHIVE_DIR
+    chunk_size = chunk_size or settings.ANSWER_ARCHIVE_CHUNK_SIZE
+    os.makedirs(archive_dir, exist_ok=True)
+    recover(archive_dir)
+    refresh_stats()
+    counted_id = (
+        models.StatsWatermark.objects.filter(name=WATERMARK_NAME)
+        .values_list("last_id", flat=True)
+        .first()
+        or 0
+    )
+    games = archivable_games(days)
+    # Answers of these games are about to disappear from the live table,
+    # so they can't be resumed as unfinished games any more
+    games.filter(finished=False).update(finished=True)
+    answers = (
+        models.QuestionAnswer.objects.filter(game__in=games, id__lte=counted_id)
+        .order_by("id")
+        .values("id", "game_id", "question_id", "answer", "correct", "created_datetime")
+    )
+    moved = 0
+    while True:
+        chunk = list(answers[:chunk_size])
+        if not chunk:
+            break
+        archive_chunk(archive_dir, chunk)
+        moved += len(chunk)
+    return moved
+
+
+def iter_archived_answers(archive_dir=None, month=None):
+    archive_dir = archive_dir or settings.ANSWER_ARCHIVE_DIR
+    pattern = ARCHIVE_FILE_NAME.format(month or "*")
+    for path in sorted(glob.glob(os.path.join(archive_dir, pattern))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
@@ -0,0 +1,159 @@
+"""
+Async variants of the game views, for the ASGI entry point (milgame/asgi.py).
+
+They share url_path with the views they extend and are routed first by
+milgame/urls.py when settings.ASYNC_VIEWS is on, so they replace them.
+The ORM is used through its async API, the rest of the game logic
+(transactions, cache) through sync_to_async
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from logicore_django_react_pages.views import ApiView
+
+from . import models
+from .game import record_answers, start_game
+from .response_cache import aget_or_compute, get_cache_key
+from .responses import JsonResponse, dumps
+from .views import HomeView, MainView, SimpleGameView, get_user_data
+
+
+class AsyncMainView(MainView):
+    async def dispatch(self, request, *args, **kwargs):
+        self.player = None
+        player_id = await sync_to_async(request.session.get)("PLAYER_ID", None)
+        if player_id:
+            self.player = await models.Player.objects.filter(pk=int(player_id)).afirst()
+        response = ApiView.dispatch(self, request, *args, **kwargs)
+        if not isinstance(response, HttpResponse):
+            response = await response
+        return response
+
+    async def get(self, request, *args, **kwargs):
+        etag = None
+        version = await self.aget_version(request, *args, **kwargs)
+        if version is not None:
+            # request.user is lazy
+            etag = await sync_to_async(self.get_etag)(request, version)
+            response = get_conditional_response(request, etag=etag)
+            if response:
+                return self.set_etag(response, etag)
+        if self.response_cache_vary is None:
+            content = dumps(await self.aget_response_data(request, *args, **kwargs))
+        else:
+            async def compute():
+                return dumps(await self.aget_response_data(request, *args, **kwargs))
+
+            content = await aget_or_compute(
+                await sync_to_async(get_cache_key)(self, request, version),
+                compute,
+                self.response_cache_timeout,
+            )
+        response = HttpResponse(content, content_type="application/json")
+        return self.set_etag(response, etag)
+
+    async def aget_response_data(self, request, *args, **kwargs):
+        data = {
+            "title": self.title,
+            "wrapper": self.WRAPPER,
+            "template": self.TEMPLATE,
+            # request.user is lazy and may query the session and auth tables
+            "user": await sync_to_async(get_user_data)(request),
+        }
+        data.update(await self.aget_data(request, *args, **kwargs))
+        return data
+
+    async def aget_data(self, request, *args, **kwargs):
+        return self.get_data(request, *args, **kwargs)
+
+    async def aget_version(self, request, *args, **kwargs):
+        return await sync_to_async(self.get_version)(request, *args, **kwargs)
+
+
+class AsyncHomeView(AsyncMainView, HomeView):
+    async def aget_data(self, request, *args, **kwargs):
+        if not self.player:
+            return {"navigate": "/welcome/"}
+
+        games_started = {
+            collection_id: last_start
+            async for collection_id, last_start in models.Game.objects.filter(
+                player=self.player
+            )
+            .annotate(last_start=Max("created_datetime"))
+            .values_list("collection_id", "last_start")
+        }
+        my_games = []
+        other_games = []
+        async for item in models.Collection.objects.values("name", "pk"):
+            last_start = games_started.get(item["pk"])
+            if last_start:
+                my_games.append({**item, "last_start": last_start})
+            else:
+                other_games.append(item)
+        return {
+            **MainView.get_data(self, request, *args, **kwargs),
+            "my_games": my_games,
+            "other_games": other_games,
+        }
+
+
+class AsyncSimpleGameView(AsyncMainView, SimpleGameView):
+    async def get_game(self, collection):
+        try:
+            return await models.Game.objects.aget(
+                player=self.player,
+                collection=collection,
+                finished=False,
+            )
+        except models.Game.DoesNotExist:
+            return None
+
+    async def aget_version(self, request, *args, **kwargs):
+        if not self.player:
+            return None
+        return await self.get_game_version_queryset().afirst()
+
+    async def aget_data(self, request, *args, **kwargs):
+        if not self.player:
+            return {"navigate": "/welcome/"}
+
+        collection = await models.Collection.objects.filter(id=self.kwargs["id"]).afirst()
+        if not collection:
+            return {"template": "PageNotFound"}
+
+        game = await self.get_game(collection)
+        if not game:
+            game = await sync_to_async(start_game)(self.player, collection)
+        # The same as SimpleGameView's, which also feeds main/events.py
+        return await sync_to_async(self.get_progress_data)(
+            game, collection, request.build_absolute_uri
+        )
+
+    async def post(self, request, *args, **kwargs):
+        if not self.player:
+            return HttpResponse("Unauthorized", status=401)
+        lang = "/" + request.LANGUAGE_CODE if request.LANGUAGE_CODE != "en" else ""
+
+        collection = await models.Collection.objects.filter(id=self.kwargs["id"]).afirst()
+        if not collection:
+            return HttpResponse("Not found", status=404)
+        game = await self.get_game(collection)
+        if not game:
+            return HttpResponse("Game wasn't started", status=400)
+        data = json.loads(request.body)["data"]
+        [result] = await sync_to_async(record_answers)(
+            game, [{"questionId": data["questionId"], "answer": data["answer"]}]
+        )
+        if result["status"] == "recorded":
+            return JsonResponse({
+                "navigate_url": f"{lang}/simple-game/{collection.id}/",
+                "action": "highlightCorrect",
+                "correctAnswer": result["correctAnswer"],
+            })
+        return JsonResponse({
+            "navigate": f"{lang}/simple-game/{collection.id}/",
+        })
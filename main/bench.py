@@ -0,0 +1,352 @@
+"""
+Helpers shared by the bench_* management commands
+"""
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from importlib import import_module
+
+from django.conf import settings
+from django.core import serializers
+from django.db import connection
+from django.db import models as db_models
+from django.db.models import Max
+from django.utils.crypto import get_random_string
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from . import models
+from .players import hash_player_password
+
+
+@contextmanager
+def benchmark_database(concurrent=False):
+    """
+    Runs the block against a throw-away test database,
+    created straight from the models. With concurrent, an SQLite one is a
+    temporary file: the shared cache of an in-memory database fails
+    concurrent writes ("database table is locked")
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    test_settings["MIGRATE"] = False
+    old_test_name = test_settings.get("NAME")
+    if concurrent and connection.vendor == "sqlite" and not old_test_name:
+        test_settings["NAME"] = os.path.join(
+            tempfile.gettempdir(), "milgame-benchmark.sqlite3"
+        )
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = old_test_name
+        teardown_test_environment()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+def summarize(timings, **extra):
+    """
+    timings: seconds
+    """
+    ms = [t * 1000 for t in timings]
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.mean(ms) if ms else None,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        **extra,
+    }
+
+
+def measure(fn, repeat, warmup=1):
+    """
+    Calls fn() `repeat` times, returns the summary with the number of
+    SQL queries per call
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        queries += len(ctx.captured_queries)
+    return summarize(timings, queries=queries / repeat if repeat else 0)
+
+
+def print_table(stdout, rows, columns):
+    widths = {
+        c: max(len(c), *(len(format_value(row.get(c))) for row in rows)) for c in columns
+    }
+    stdout.write("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        stdout.write(
+            "  ".join(format_value(row.get(c)).ljust(widths[c]) for c in columns)
+        )
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return "-" if value is None else str(value)
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+
+
+def create_player_session(name):
+    """
+    Creates a player logged in to a new session, for clients of running
+    servers (which must share the database and SECRET_KEY).
+    Returns {"cookie": Cookie header, "csrf_token": X-CSRFToken header}
+    """
+    player = models.Player.objects.create(name=name, password="")
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session["PLAYER_ID"] = player.pk
+    session.save()
+    csrf_token = get_random_string(32)
+    return {
+        "cookie": (
+            f"{settings.SESSION_COOKIE_NAME}={session.session_key}; "
+            f"{settings.CSRF_COOKIE_NAME}={csrf_token}"
+        ),
+        "csrf_token": csrf_token,
+    }
+
+
+def make_definition(fields=1000, group_size=10):
+    """
+    A framework form definition of `fields` text and number fields (k
+    "f0", "f1"...), in Fields groups (position_k "p0", "p1"...) of
+    `group_size`, themselves in sections of which every other one has a k
+    (and every fourth one is a ForeignKeyListField)
+    """
+    leaves = [
+        {
+            "type": "TextField" if i % 3 else "NumberField",
+            "k": f"f{i}",
+            "label": f"Field {i}",
+            "required": i % 2 == 0,
+            "validators": (
+                [{"type": "maxLength", "value": 255}]
+                if i % 3
+                else [{"type": "minNumber", "value": 0}, {"type": "maxNumber", "value": 100}]
+            ),
+        }
+        for i in range(fields)
+    ]
+    groups = [
+        {"type": "Fields", "position_k": f"p{j}", "fields": leaves[i : i + group_size]}
+        for j, i in enumerate(range(0, fields, group_size))
+    ]
+    sections = []
+    for j, i in enumerate(range(0, len(groups), group_size)):
+        section = {"type": "Fields", "fields": groups[i : i + group_size]}
+        if j % 2:
+            section["k"] = f"s{j}"
+        if j % 4 == 3:
+            section["type"] = "ForeignKeyListField"
+        sections.append(section)
+    return {"type": "Fields", "fields": sections}
+
+
+def make_game_fixture(players, collections, questions, seed=0, password="secret"):
+    """
+    `players` players (named "player0"... with `password`), `collections`
+    collections of `questions` questions, as a fixture in the shape of
+    user.json (for loaddata), with the pks following the database's ones
+    """
+    rng = random.Random(seed)
+    created = "2023-02-09T06:30:44.560Z"
+    first_pk = {
+        model: (model.objects.aggregate(Max("pk"))["pk__max"] or 0) + 1
+        for model in (models.Player, models.Collection, models.Question)
+    }
+    # Hashed once: the players share it
+    password = hash_player_password(password)
+    objects = [
+        {
+            "model": "main.player",
+            "pk": first_pk[models.Player] + i,
+            "fields": {
+                "created_datetime": created,
+                "modified_datetime": created,
+                "name": f"player{first_pk[models.Player] + i}",
+                "password": password,
+            },
+        }
+        for i in range(players)
+    ]
+    question_pk = first_pk[models.Question]
+    for j in range(collections):
+        collection_pk = first_pk[models.Collection] + j
+        objects.append(
+            {
+                "model": "main.collection",
+                "pk": collection_pk,
+                "fields": {
+                    "created_datetime": created,
+                    "modified_datetime": created,
+                    "name": f"Collection {collection_pk}",
+                },
+            }
+        )
+        for i in range(questions):
+            objects.append(
+                {
+                    "model": "main.question",
+                    "pk": question_pk,
+                    "fields": {
+                        # loaddata doesn't fill the auto_now fields
+                        "created_datetime": created,
+                        "modified_datetime": created,
+                        "collection": collection_pk,
+                        "text": f"Question {i + 1} of collection {collection_pk}",
+                        "order": i + 1,
+                        "answer1": "one",
+                        "answer2": "two",
+                        "answer3": "three",
+                        "answer4": "four",
+                        "correct": rng.randint(1, 4),
+                    },
+                }
+            )
+            question_pk += 1
+    return objects
+
+
+def load_fixture(objects):
+    """
+    Inserts the objects of a fixture with a bulk_create per model
+    (without the signals loaddata would send)
+    """
+    by_model = defaultdict(list)
+    for deserialized in serializers.deserialize("python", objects):
+        by_model[deserialized.object.__class__].append(deserialized.object)
+    for model, instances in by_model.items():
+        model.objects.bulk_create(instances, batch_size=500)
+    return {model._meta.label: len(instances) for model, instances in by_model.items()}
+
+
+def make_node_models(width, depth):
+    """
+    Synthetic models for the framework benchmarks, registered in the main
+    app (for a benchmark_database() created after this call): BenchOption
+    and BenchTag, and BenchNode0...BenchNode<depth> of `width` text fields
+    (f0, f1...), an option (ForeignKey) and tags (ManyToManyField), each
+    level with a parent ForeignKey to the previous one (related_name
+    "children")
+    """
+
+    def make_model(name, fields):
+        meta = type("Meta", (), {"app_label": "main"})
+        attrs = {"__module__": __name__, "Meta": meta, **fields}
+        return type(name, (db_models.Model,), attrs)
+
+    option = make_model("BenchOption", {"name": db_models.CharField(max_length=255)})
+    tag = make_model("BenchTag", {"name": db_models.CharField(max_length=255)})
+    nodes = []
+    for level in range(depth + 1):
+        fields = {
+            f"f{i}": db_models.CharField(max_length=255, blank=True)
+            for i in range(width)
+        }
+        fields["option"] = db_models.ForeignKey(
+            option, on_delete=db_models.CASCADE, null=True, blank=True
+        )
+        fields["tags"] = db_models.ManyToManyField(tag, blank=True)
+        if nodes:
+            fields["parent"] = db_models.ForeignKey(
+                nodes[-1], on_delete=db_models.CASCADE, related_name="children"
+            )
+        nodes.append(make_model(f"BenchNode{level}", fields))
+    return {"option": option, "tag": tag, "nodes": nodes}
+
+
+def make_node_definition(width, depth):
+    """
+    The definition of a BenchNode0 with `width` of its text fields, its
+    option and tags, and its children to `depth` levels (nested
+    ForeignKeyListFields)
+    """
+
+    def level_fields(level):
+        fields = [{"from_field": "id"}]
+        fields += [{"from_field": f"f{i}"} for i in range(width)]
+        fields += [{"from_field": "option"}, {"from_field": "tags"}]
+        if level < depth:
+            fields.append(
+                {
+                    "type": "ForeignKeyListField",
+                    "k": "children",
+                    "fields": level_fields(level + 1),
+                }
+            )
+        return fields
+
+    return {"type": "Fields", "fields": level_fields(0)}
+
+
+def seed_options(bench_models, options=1000, tags=50):
+    """
+    The option set of the SelectFields and the tags of the M2M fields
+    """
+    option_model, tag_model = bench_models["option"], bench_models["tag"]
+    option_model.objects.bulk_create(
+        [option_model(name=f"Option {i}") for i in range(options)], batch_size=500
+    )
+    tag_model.objects.bulk_create([tag_model(name=f"Tag {i}") for i in range(tags)])
+
+
+def seed_nodes(bench_models, width, depth, children=5, seed=0):
+    """
+    A BenchNode0 with `children` children per node down to `depth`, each
+    with an option and 3 tags (see seed_options). Returns the root
+    """
+    rng = random.Random(seed)
+    option_pks = list(bench_models["option"].objects.values_list("pk", flat=True))
+    tag_pks = list(bench_models["tag"].objects.values_list("pk", flat=True))
+
+    def make_node(model, **kwargs):
+        node = model.objects.create(
+            option_id=rng.choice(option_pks),
+            **{f"f{i}": f"value {i}" for i in range(width)},
+            **kwargs,
+        )
+        node.tags.set(rng.sample(tag_pks, min(3, len(tag_pks))))
+        return node
+
+    nodes = bench_models["nodes"]
+    root = make_node(nodes[0])
+    parents = [root]
+    for model in nodes[1 : depth + 1]:
+        parents = [
+            make_node(model, parent=parent)
+            for parent in parents
+            for _ in range(children)
+        ]
+    return root
@@ -0,0 +1,100 @@
+"""
+Publish/subscribe of text messages between the sockets of live rooms.
+
+The backend is settings.ROOM_BROKER; LocalBroker keeps everything in the
+process, which is enough with one ASGI worker. A backend shared by several
+workers (e.g. on Redis) implements the same two methods.
+"""
+import asyncio
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def get_running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Subscription:
+    """
+    Messages of some channels, in order. A subscriber that lets more than
+    `maxsize` messages pile up is dropped (get() then returns None)
+    instead of slowing the publishers down
+    """
+
+    def __init__(self, broker, channels, maxsize=0):
+        self.broker = broker
+        self.channels = channels
+        self.maxsize = maxsize
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.dropped = False
+
+    def put(self, message):
+        if self.loop is not get_running_loop():
+            # Published from a thread, e.g. by a sync view
+            self.loop.call_soon_threadsafe(self.put, message)
+            return
+        if self.dropped:
+            return
+        if self.maxsize and self.queue.qsize() >= self.maxsize:
+            self.dropped = True
+            message = None
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    def publish(self, channel, message):
+        """
+        Can be called from any thread
+        """
+        raise NotImplementedError
+
+    def subscribe(self, *channels, maxsize=0):
+        """
+        Returns a Subscription (of the running event loop),
+        to be closed when done
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    def __init__(self):
+        self.subscriptions = {}
+
+    def publish(self, channel, message):
+        for subscription in list(self.subscriptions.get(channel, ())):
+            subscription.put(message)
+
+    def subscribe(self, *channels, maxsize=0):
+        subscription = Subscription(self, channels, maxsize)
+        for channel in channels:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for channel in subscription.channels:
+            subscriptions = self.subscriptions.get(channel)
+            if subscriptions is None:
+                continue
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.ROOM_BROKER)()
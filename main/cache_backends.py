@@ -0,0 +1,120 @@
+"""
+LocalRedisCache: Django's RedisCache with an in-process stand-in for the
+Redis server, so that the "redis" response cache setup can be run and
+tested without Redis (MILGAME_RESPONSE_CACHE=fakeredis)
+"""
+import threading
+import time
+
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+
+# Like Redis databases: shared by every cache with the same LOCATION
+servers = {}
+servers_lock = threading.Lock()
+
+
+class LocalRedisCacheClient:
+    """
+    The RedisCacheClient methods, over a dict of
+    {key: (serialized value, expiry time or None)}
+    """
+
+    def __init__(self, servers_, **options):
+        with servers_lock:
+            self.data, self.lock = servers.setdefault(
+                tuple(servers_), ({}, threading.Lock())
+            )
+        self.serializer = RedisSerializer()
+
+    def _get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return item[0]
+
+    def _set(self, key, value, timeout):
+        if timeout == 0:
+            self.data.pop(key, None)
+            return
+        expires = None if timeout is None else time.monotonic() + timeout
+        self.data[key] = (self.serializer.dumps(value), expires)
+
+    def add(self, key, value, timeout):
+        with self.lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def get(self, key, default):
+        with self.lock:
+            value = self._get(key)
+        return default if value is None else self.serializer.loads(value)
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self._set(key, value, timeout)
+
+    def touch(self, key, timeout):
+        with self.lock:
+            value = self._get(key)
+            if value is None:
+                return False
+            if timeout == 0:
+                del self.data[key]
+            else:
+                self.data[key] = (
+                    value,
+                    None if timeout is None else time.monotonic() + timeout,
+                )
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            return self.data.pop(key, None) is not None
+
+    def get_many(self, keys):
+        with self.lock:
+            values = {key: self._get(key) for key in keys}
+        return {
+            key: self.serializer.loads(value)
+            for key, value in values.items()
+            if value is not None
+        }
+
+    def has_key(self, key):
+        with self.lock:
+            return self._get(key) is not None
+
+    def incr(self, key, delta):
+        with self.lock:
+            value = self._get(key)
+            if value is None:
+                raise ValueError("Key '%s' not found." % key)
+            value = self.serializer.loads(value) + delta
+            self.data[key] = (self.serializer.dumps(value), self.data[key][1])
+            return value
+
+    def set_many(self, data, timeout):
+        with self.lock:
+            for key, value in data.items():
+                self._set(key, value, timeout)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+        return True
+
+
+class LocalRedisCache(RedisCache):
+    def __init__(self, server, params):
+        super().__init__(server or "local", params)
+        self._class = LocalRedisCacheClient
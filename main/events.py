@@ -0,0 +1,145 @@
+"""
+Server-Sent Events of a solo game, GET /api/simple-game/<id>/events/
+(served by milgame/asgi.py):
+
+- "question": the payload of the current question, as SimpleGameView
+  gives it, first when connecting, then after every answer
+- "answer": {"questionId", "correctAnswer", "correct"} for every answer
+  recorded (by any client of the player)
+- "results": the final score and leaderboard, after which the stream ends
+
+so that the Game page doesn't need a GET per question.
+Answers are announced through the room broker (main/broker.py).
+"""
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import models
+from .broker import get_broker
+from .game import game_channel
+from .responses import dumps
+from .rooms import get_header, get_scope_player
+from .views import SimpleGameView
+
+GAME_EVENTS_PATH = re.compile(r"^(/[a-z]{2})?/api/simple-game/(?P<id>[0-9]+)/events/$")
+
+
+def get_progress_data(player, game_id, build_absolute_uri):
+    game = models.Game.objects.select_related("collection").get(pk=game_id)
+    view = SimpleGameView()
+    view.player = player
+    return view.get_progress_data(game, game.collection, build_absolute_uri)
+
+
+def format_event(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+async def send_text(send, status, text):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        }
+    )
+    await send({"type": "http.response.body", "body": text.encode()})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def game_events_application(scope, receive, send):
+    match = GAME_EVENTS_PATH.match(scope["path"])
+    if scope["method"] != "GET":
+        await send_text(send, 405, "Method not allowed")
+        return
+    player = await sync_to_async(get_scope_player)(scope)
+    if not player:
+        await send_text(send, 401, "Unauthorized")
+        return
+    game = await (
+        models.Game.objects.filter(
+            player=player, collection_id=int(match["id"]), finished=False
+        )
+        .order_by("-pk")
+        .afirst()
+    )
+    if not game:
+        await send_text(send, 400, "Game wasn't started")
+        return
+
+    origin = f"{scope.get('scheme', 'http')}://{get_header(scope, b'host')}"
+
+    def build_absolute_uri(url):
+        return origin + url
+
+    subscription = get_broker().subscribe(game_channel(game.pk))
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    # Don't let nginx buffer the stream
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+
+        async def send_progress():
+            data = await sync_to_async(get_progress_data)(
+                player, game.pk, build_absolute_uri
+            )
+            if data.get("template") == "Game":
+                await send_body(format_event("question", data))
+                return True
+            await send_body(format_event("results", data))
+            return False
+
+        async def send_body(body):
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+
+        await send_body(b"retry: 3000\n\n")
+        more = await send_progress()
+        while more:
+            message = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {message, disconnected},
+                timeout=settings.GAME_EVENTS_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                message.cancel()
+                return
+            if message not in done:
+                message.cancel()
+                await send_body(b": ping\n\n")
+                continue
+            results = json.loads(message.result())["results"]
+            for result in results:
+                await send_body(
+                    format_event(
+                        "answer",
+                        {
+                            "questionId": result["questionId"],
+                            "correctAnswer": result["correctAnswer"],
+                            "correct": result["correct"],
+                        },
+                    )
+                )
+            if results:
+                more = await send_progress()
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        subscription.close()
@@ -1,10 +1,13 @@
-import copy
+import functools
 import itertools
+import re
+import threading
+import time
+import warnings
 from collections import defaultdict
 from decimal import Decimal
 
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.contrib.postgres.fields import ArrayField
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.db import models as db_models
 from django.db.models import (
@@ -19,29 +22,21 @@ from django.db.models import (
 from django.db.models.expressions import Func
 from django.utils.timezone import datetime, timedelta
 
+from . import reference_data, tracing
+from .instrumentation import uninstrumented
 from .utils2 import plural_days
 
 infinite_defaultdict = lambda: defaultdict(infinite_defaultdict)
 
 
-import base64
-
-from django.core.files.base import ContentFile
-
-try:
-    import libcst
-except:
-    libcst = None  # XXX
+from .uploads import decode_data_url
 
 
 def base64_file(data, name=None):
-    if not data:
-        return None
-    _format, _img_str = data.split(";base64,")
-    _name, ext = _format.split("/")
-    if not name:
-        name = _name.split(":")[-1]
-    return ContentFile(base64.b64decode(_img_str), name="{}.{}".format(name, ext))
+    """
+    Decoded chunk by chunk into a temporary file (see main/uploads.py)
+    """
+    return decode_data_url(data, name)
 
 
 class NoFieldFoundError(Exception):
@@ -145,7 +140,9 @@ def level_foreign_key(f, field, model):
         "MAX_LEVEL": f.related_model.MAX_LEVEL,
         "descriptions": {
             l["level"]: l["description"]
-            for l in f.related_model.objects.values("level", "description")
+            for l in reference_data.get_rows(
+                f.related_model.objects.values("level", "description")
+            )
         },
         "validators": [],
     }
@@ -275,7 +272,9 @@ def filter_level_foreign_key(f, field, model):
         "multiple": True,
         "options": [
             {"value": l["level"], "label": l["description"]}
-            for l in f.related_model.objects.values("level", "description")
+            for l in reference_data.get_rows(
+                f.related_model.objects.values("level", "description")
+            )
         ],
         "placeholder": "(любой)",
         "validators": [],
@@ -298,6 +297,15 @@ def json_master_slave(f, field, model):
     }
 
 
+@functools.lru_cache(maxsize=None)
+def get_choice_options(f):
+    """
+    The options of a field's choices, built once per field (shared: they
+    must not be modified)
+    """
+    return [{"value": k, "label": v} for k, v in f.choices]
+
+
 def multiple_choices_select(f, field, model):
     base_field = field.copy()
     del base_field["via"]
@@ -309,7 +317,7 @@ def multiple_choices_select(f, field, model):
         "multiple": True,
         "label": f.verbose_name.capitalize(),
         "required": not f.blank,
-        "options": [{"value": k, "label": v} for k, v in f.base_field.choices],
+        "options": get_choice_options(f.base_field),
         "is_multiple_choices": True,
     }
 
@@ -371,7 +379,7 @@ def field_from_field(f, field, model):
                 "type": "SelectField",
                 "label": f.verbose_name.capitalize(),
                 "required": not f.blank,
-                "options": [{"value": k, "label": v} for k, v in f.choices],
+                "options": get_choice_options(f),
                 "is_choices": True,
             }
         return {
@@ -402,7 +410,7 @@ def field_from_field(f, field, model):
                     "optgroup_label_expr", F(f"{optgroup}__name")
                 ),
             }
-        options = list(
+        options = reference_data.get_rows(
             f.related_model.objects.filter(**field.get("filter_expr", {})).values(
                 value=F("pk"),
                 label=ExpressionWrapper(
@@ -459,7 +467,11 @@ def field_from_field(f, field, model):
             group_level_model = get_field_from_model(
                 option_level_model, optgroup
             ).related_model
-            options = list(
+            # Postgres only, and slow to import: not at startup
+            from django.contrib.postgres.aggregates import ArrayAgg
+            from django.contrib.postgres.fields import ArrayField
+
+            options = reference_data.get_rows(
                 group_level_model.objects.annotate(
                     options=Subquery(
                         option_level_model.objects.filter(
@@ -469,10 +481,13 @@ def field_from_field(f, field, model):
                         .values(s=ArrayAgg(JSONObject(value=F("id"), label=F("name")))),
                         output_field=ArrayField(JSONField()),
                     )
-                ).values("options", label=F("name"))
+                ).values("options", label=F("name")),
+                option_level_model,
             )
         else:
-            options = list(f.related_model.objects.values(value=F("pk"), label=F("name")))
+            options = reference_data.get_rows(
+                f.related_model.objects.values(value=F("pk"), label=F("name"))
+            )
         return {
             "k": f.name,
             "type": "SelectField",
@@ -506,6 +521,10 @@ def field_from_field(f, field, model):
                 boundary_value = integer_type[boundary]
             if boundary_value is not None:
                 validators.append({"type": f"{boundary}Number", "value": boundary_value})
+        if f.choices:
+            validators.append(
+                {"type": "choices", "value": [k for k, _ in f.flatchoices]}
+            )
         return {
             "k": f.name,
             "type": "NumberField",
@@ -515,7 +534,9 @@ def field_from_field(f, field, model):
             "default": f.default,
         }
     if (
-        isinstance(f, ArrayField)
+        # ArrayField, without importing django.contrib.postgres
+        isinstance(f, db_models.Field)
+        and f.get_internal_type() == "ArrayField"
         and isinstance(f.base_field, db_models.CharField)
         and not getattr(f.base_field, "choices", None)
     ):
@@ -570,6 +591,10 @@ def field_from_field(f, field, model):
                 boundary_value = getattr(f, boundary)
             if boundary_value is not None:
                 validators.append({"type": f"{boundary}Number", "value": boundary_value})
+        if f.choices:
+            validators.append(
+                {"type": "choices", "value": [k for k, _ in f.flatchoices]}
+            )
         return {
             "k": f.name,
             "type": "DecimalField",
@@ -598,8 +623,10 @@ def apply_from_field(field, model):
         result = field_from_field(model_field, field, model)
         result.update({k: v for k, v in field.items() if k not in ["create_form"]})
         field = result
-        if from_field == "label":
-            print("IMP", field.get("impositions"))
+        if from_field == "label" and tracing.is_enabled():
+            tracing.event(
+                "apply_from_field.impositions", impositions=field.get("impositions")
+            )
     return field
 
 
@@ -660,23 +687,28 @@ def plain_options(v):
 read_k_fields = None
 
 
+def get_from_json_collection(o, k):
+    return o.get(k, None)
+
+
 def read_field(obj, v, getter=getattr, raw=False):
+    # Follows the foreign key hierarchy and the JSON collection in place,
+    # rather than recursing with copies of v
     original_from_field = v.get("original_from_field")
     if original_from_field and "." in original_from_field:
-        current_model, original_from_field = original_from_field.split(".", 1)
-        print("try to get", obj.__dict__, current_model)
-        new_obj = getattr(obj, current_model, None)
-        if not new_obj:
-            return None
-        return read_field(
-            new_obj, {**v, "original_from_field": original_from_field}, getter, raw
-        )
+        for current_model in original_from_field.split(".")[:-1]:
+            if tracing.is_enabled():
+                tracing.event(
+                    "read_field.follow", k=v["k"], obj=obj, attribute=current_model
+                )
+            obj = getattr(obj, current_model, None)
+            if not obj:
+                return None
     json_collection_k = v.get("json_collection")
     if json_collection_k:
-        vv = {**v}
-        del vv["json_collection"]
-        obj2 = getattr(obj, json_collection_k, None) or {}
-        return read_field(obj2, vv, getter=lambda o, k: o.get(k, None), raw=True)
+        obj = getattr(obj, json_collection_k, None) or {}
+        getter = get_from_json_collection
+        raw = True
     if v["type"] == "SelectField":  # For now foreign key only
         if raw and v.get("multiple"):
             return find_options(
@@ -797,25 +829,26 @@ def read_field(obj, v, getter=getattr, raw=False):
 def read_k_fields(obj, fields):
     data = {}
 
+    def as_fields(struct):
+        return {k: v for k, v in {**struct, "type": "Fields"}.items() if k != "k"}
+
     def walk1(struct, data, obj):
         k = struct.get("k", None)
         if struct.get("type", []) == "ListField":
             data["items"] = []
             the_items = obj["items"]
+            item_struct = as_fields(struct)
             if struct.get("criteria", {}):
                 try:
                     the_items = the_items.filter(**struct.get("criteria", {}))
                 except:
                     # in case it's not a Queryset, e.g. just a list
                     raise Exception("ListField Criteria application error")
-            for i, child in enumerate(list(the_items)):
-                data["items"].append({})
-                # print("will call with", child, type(child))
-                walk1(
-                    {k: v for k, v in {**struct, "type": "Fields"}.items() if k != "k"},
-                    data["items"][i],
-                    child,
-                )
+            with tracing.span("read_fields.rows", k=k):
+                for i, child in enumerate(list(the_items)):
+                    data["items"].append({})
+                    # print("will call with", child, type(child))
+                    walk1(item_struct, data["items"][i], child)
         elif struct.get("type", []) == "ForeignKeyListField":
             if not obj.pk:
                 return []
@@ -824,21 +857,20 @@ def read_k_fields(obj, fields):
             except:
                 pass
             related_attr = obj.__class__._meta.fields_map[k].related_name or f"{k}_set"
-            for i, child in enumerate(getattr(obj, related_attr).all()):
-                data[k].append({})
-                # print("will call with", child, type(child))
-                walk1(
-                    {k: v for k, v in {**struct, "type": "Fields"}.items() if k != "k"},
-                    data[k][i],
-                    child,
-                )
+            item_struct = as_fields(struct)
+            with tracing.span("read_fields.rows", k=k):
+                for i, child in enumerate(getattr(obj, related_attr).all()):
+                    data[k].append({})
+                    # print("will call with", child, type(child))
+                    walk1(item_struct, data[k][i], child)
         elif k:
             data[k] = read_field(obj, struct)
         else:
             for f in struct.get("fields", []):
                 walk1(f, data, obj)
 
-    walk1(fields, data, obj)
+    with tracing.span("read_fields", type=fields["type"]):
+        walk1(fields, data, obj)
 
     return data["items"] if fields["type"] == "ListField" else data
 
@@ -910,8 +942,201 @@ def get_fields_for_fields_options_field(fields, model):
     return hide_from_field(fields), result, required_by_default
 
 
+# Validation of a payload against a definition, before writing it
+
+NOT_REQUIRABLE_TYPES = ["HiddenField", "BooleanField", "SwitchField"]
+LIST_TYPES = ["ListField", "ForeignKeyListField"]
+
+
+def is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+
+def as_number(value):
+    """
+    The number, also from a numeric str (as the model field would take it),
+    None if it's not one
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return value
+    if isinstance(value, str):
+        try:
+            number = Decimal(value.strip())
+        except ArithmeticError:
+            return None
+        return number if number.is_finite() else None
+
+
+def compile_rule(validator):
+    """
+    (value -> is valid) for one of the validators field_from_field emits,
+    None for the ones only the frontend checks
+    """
+    limit = validator.get("value")
+    if validator["type"] == "maxLength":
+        return lambda value: not isinstance(value, str) or len(value) <= limit
+    if validator["type"] == "minNumber":
+        return lambda value: as_number(value) is None or as_number(value) >= limit
+    if validator["type"] == "maxNumber":
+        return lambda value: as_number(value) is None or as_number(value) <= limit
+    if validator["type"] == "choices":
+        return lambda value: as_number(value) is None or as_number(value) in limit
+
+
+def get_selected_values(field, value):
+    """
+    The option values a SelectField payload selects, None if it's malformed
+    """
+    if field.get("multiple") or field.get("is_multiple_choices"):
+        if not isinstance(value, list):
+            return None
+        selected = value
+    elif field.get("is_choices") and isinstance(value, str):
+        return [value]
+    else:
+        selected = [value]
+    if not all(isinstance(option, dict) for option in selected):
+        return None
+    return [option.get("value") for option in selected]
+
+
+def compile_select_validator(field):
+    """
+    The validator of a SelectField: only the values of its options.
+    Compared as str, as the model field would take "1" for 1.
+    """
+    k = field["k"]
+    values = {str(option["value"]) for option in plain_options(field)}
+
+    def validate(value, path, errors):
+        selected = get_selected_values(field, value)
+        if selected is None:
+            errors.append({"path": [*path, k], "type": "invalid"})
+        elif any(v is not None and str(v) not in values for v in selected):
+            errors.append({"path": [*path, k], "type": "choices"})
+
+    return validate
+
+
+def compile_field_validator(field):
+    k = field["k"]
+    required = field.get("required") and field["type"] not in NOT_REQUIRABLE_TYPES
+    expected_type = {"TextField": str, "TextareaField": str, "NumberField": "number"}.get(
+        field["type"]
+    )
+    rules = [
+        (validator, rule)
+        for validator, rule in (
+            (validator, compile_rule(validator))
+            for validator in field.get("validators", [])
+        )
+        if rule
+    ]
+    validate_select = None
+    if field["type"] == "SelectField" and field.get("options") is not None:
+        validate_select = compile_select_validator(field)
+
+    def validate(data, path, errors):
+        value = data.get(k)
+        if is_empty(value):
+            if required:
+                errors.append({"path": [*path, k], "type": "required"})
+            return
+        if (expected_type == "number" and as_number(value) is None) or (
+            expected_type is str and not isinstance(value, str)
+        ):
+            errors.append({"path": [*path, k], "type": "invalid"})
+            return
+        if validate_select:
+            validate_select(value, path, errors)
+        for validator, rule in rules:
+            if not rule(value):
+                errors.append(
+                    {"path": [*path, k], "type": validator["type"], "value": validator["value"]}
+                )
+
+    return validate
+
+
+def compile_validator(fields):
+    """
+    The validator of a definition (with its from_field applied): a function
+    of the payload write_fields would get, returning all its errors, as
+    [{"path": ["question", 0, "text"], "type": "maxLength", "value": 2048}]
+    """
+
+    def compile_node(node):
+        k = node.get("k")
+        if k and not node.get("fields"):
+            return compile_field_validator(node)
+        children = [compile_node(f) for f in node.get("fields", [])]
+
+        def validate_children(data, path, errors):
+            for child in children:
+                child(data, path, errors)
+
+        if node.get("type") in LIST_TYPES:
+
+            def validate_items(items, path, errors):
+                if not isinstance(items, list):
+                    errors.append({"path": path, "type": "invalid"})
+                    return
+                for i, item in enumerate(items):
+                    if not isinstance(item, dict):
+                        errors.append({"path": [*path, i], "type": "invalid"})
+                    else:
+                        validate_children(item, [*path, i], errors)
+
+            if not k:  # the top level ListField of write_fields
+                return validate_items
+
+            def validate_list(data, path, errors):
+                items = data.get(k)
+                if items is None:
+                    if node.get("required"):
+                        errors.append({"path": [*path, k], "type": "required"})
+                    return
+                validate_items(items, [*path, k], errors)
+
+            return validate_list
+
+        if not k:
+            return validate_children
+
+        def validate_nested(data, path, errors):
+            nested = data.get(k)
+            if nested is None:
+                nested = {}
+            if not isinstance(nested, dict):
+                errors.append({"path": [*path, k], "type": "invalid"})
+            else:
+                validate_children(nested, [*path, k], errors)
+
+        return validate_nested
+
+    root_is_list = fields.get("type") == "ListField"
+    # write_fields takes a list for a top level ListField, whatever its k
+    root = compile_node({**fields, "k": None} if root_is_list else fields)
+
+    def validate(data):
+        errors = []
+        if not root_is_list and not isinstance(data, dict):
+            errors.append({"path": [], "type": "invalid"})
+        else:
+            root(data, [], errors)
+        return errors
+
+    return validate
+
+
 def validate_fields(fields, model, data):
-    pass
+    """
+    All the errors of the payload data, [] if write_fields can write it
+    """
+    fields = walk_with_model(fields, apply_from_field, model)
+    return compile_validator(fields)(data)
 
 
 def get_k_fields(fields):
@@ -935,14 +1160,9 @@ def get_k_fields(fields):
             r = r[k]
         if (rk not in p) or not p[rk].keys():
             p[rk] = value
-        if (rk in p) and value.get("type", None) == "ListField":
-            value = copy.deepcopy(value)
-            del value["fields"]
-            p[rk]["_field"] = value
-        if (rk in p) and value.get("type", None) == "ForeignKeyListField":
-            value = copy.deepcopy(value)
-            del value["fields"]
-            p[rk]["_field"] = value
+        if (rk in p) and value.get("type", None) in ("ListField", "ForeignKeyListField"):
+            # The node without its children, which are in p[rk] already
+            p[rk]["_field"] = {k: v for k, v in value.items() if k != "fields"}
         return r
 
     k_fields = infinite_defaultdict()
@@ -956,96 +1176,258 @@ def get_k_fields(fields):
     return k_fields
 
 
-def read_field_into_qs(obj, v):
-    getter = lambda obj, k, default=None: obj.get(k, default) if obj else None
-    qs_k = v.get("qs_k", v["k"])
-    if v["type"] == "SelectField":  # For now foreign key only
-        if v["multiple"]:
-            value = [int(x) for x in (getter(obj, v["k"]) or "").split(",") if x]
-            if value:
-                return {f"{qs_k}__in": value}
+class UnindexedFilterWarning(RuntimeWarning):
+    pass
+
+
+def get_filter_value(GET, k):
+    """
+    The value of the GET parameter k, None when it's repeated (which of the
+    values would be filtered on?)
+    """
+    values = GET.getlist(k) if hasattr(GET, "getlist") else [GET.get(k)]
+    return values[0] if len(values) == 1 else None
+
+
+def compile_filter_field(v, k_path=()):
+    """
+    The function reading the GET parameter of a filter field, as
+    {lookup: value}, or {k: Q} for a text search on several fields, with the
+    lookups prefixed with the k_path of its group. A malformed or repeated
+    parameter is ignored ({}), rather than failing the request
+    """
+    k = v["k"]
+    prefix = "".join(f"{group_k}__" for group_k in k_path)
+    qs_k = prefix + v.get("qs_k", k)
+    if v["type"] == "SelectField":
+        if v.get("multiple"):
+
+            def read(GET):
+                # "1,2", or repeated: "k=1&k=2"
+                values = GET.getlist(k) if hasattr(GET, "getlist") else [GET.get(k)]
+                try:
+                    value = [int(x) for y in values for x in (y or "").split(",") if x]
+                except ValueError:
+                    return {}
+                return {f"{qs_k}__in": value} if value else {}
+
         else:
-            raise NotImplementedError()
+
+            def read(GET):
+                value = get_filter_value(GET, k)
+                return {qs_k: value} if value else {}
+
     elif v["type"] == "DateField":
-        value = getter(obj, v["k"])
-        if value:
-            value = datetime.strptime(value, "%Y-%m-%d").date()
-            return {
-                qs_k: value,
-            }
+
+        def read(GET):
+            value = get_filter_value(GET, k)
+            try:
+                return {qs_k: datetime.strptime(value, "%Y-%m-%d").date()}
+            except (TypeError, ValueError):
+                return {}
+
+    elif v["type"] == "MonthField":
+        base_k = qs_k[: -len("__month")] if qs_k.endswith("__month") else qs_k
+
+        def read(GET):
+            value = get_filter_value(GET, k)
+            try:
+                month = datetime.strptime(value, "%Y-%m")
+            except (TypeError, ValueError):
+                return {}
+            return {f"{base_k}__year": month.year, f"{base_k}__month": month.month}
+
     elif v["type"] == "BooleanField":
-        value = getter(obj, v["k"])
-        value = value == "yes"
-        return {
-            qs_k: value,
-        }
+
+        def read(GET):
+            return {qs_k: GET.get(k) == "yes"}
+
+    elif v["type"] == "TextField":
+        search_fields = [prefix + f for f in v.get("search_fields", [v.get("qs_k", k)])]
+
+        def read(GET):
+            value = (get_filter_value(GET, k) or "").strip()
+            if not value:
+                return {}
+            q = Q()
+            for search_field in search_fields:
+                q |= Q(**{f"{search_field}__icontains": value})
+            return {prefix + k: q}
+
     else:
-        print(f"No read_field_into_qs implementation for field {v['k']}")
-        return {}
-    return {}
+        raise ImproperlyConfigured(f"No filter for the {v['type']} field {k}")
+    return read
 
 
 def walk_the_tree(tree, f, parents=None):
+    """
+    f(node, parents) returns the node, or a changed copy of it (it must not
+    modify it): only the nodes on the path to a change are copied, the
+    unchanged subtrees are shared with `tree`
+    """
     if not parents:
         parents = []
     fields = tree.get("fields")
-    tree = {k: v for k, v in tree.items()}
     if fields:
-        tree["fields"] = [walk_the_tree(field, f, [*parents, tree]) for field in fields]
+        child_parents = [*parents, tree]
+        new_fields = [walk_the_tree(field, f, child_parents) for field in fields]
+        if any(new is not old for new, old in zip(new_fields, fields)):
+            tree = {**tree, "fields": new_fields}
     return f(tree, parents)
 
 
-def read_filter_fields(fields, GET, model):
+def compile_filters(fields, model):
+    """
+    The plan of a filter definition: its fields applied to the model and
+    made not required, and the readers of its GET parameters
+    """
+    # walk_with_model assigns the fields in place: on a copy
+    fields = walk_the_tree(fields, lambda node, _: {**node})
     fields = walk_with_model(fields, apply_from_field, model)
-    # print(json.dumps(fields, default=repr, ensure_ascii=False))
+
     def make_not_required(field, _):
         if field.get("required"):
-            print(field, " is required")
-            field["required"] = False
+            field = {**field, "required": False}
         return field
 
     fields = walk_the_tree(fields, make_not_required)
-    data = {}
-    # data, filter_expr
-    filters = {}
+    plan = {
+        "fields": fields,
+        "model": model,
+        "groups": [],
+        "leaves": [],
+        "transformers": [],
+        "explained": set(),
+    }
 
-    def walk1(struct, data, obj, k_path=None):
-        if not k_path:
-            k_path = []
+    def walk1(struct, k_path):
         k = struct.get("k", None)
         fields = struct.get("fields", [])
         if fields:
             if k:
-                data[k] = {}
-                data = data[k]
                 k_path = [*k_path, k]
+                plan["groups"].append(k_path)
             for f in fields:
-                walk1(f, data, obj, k_path=k_path)
+                walk1(f, k_path)
             transformer = struct.get("transformer")
             if transformer:
-                FILTER_TRANSFORMERS[transformer](
-                    filters, "__".join([*k_path, struct["from_field"]]), struct
+                plan["transformers"].append(
+                    (
+                        FILTER_TRANSFORMERS[transformer],
+                        "__".join([*k_path, struct["from_field"]]),
+                        struct,
+                    )
                 )
         elif k:
-            data[k] = read_field(
-                obj,
-                struct,
-                getter=lambda obj, k, default=None: obj.get(k, default) if obj else None,
-                raw=True,
+            plan["leaves"].append(
+                (k_path, struct, compile_filter_field(struct, k_path))
             )
-            filters.update(
-                {
-                    "__".join([*k_path, k]): v
-                    for k, v in read_field_into_qs(obj, struct).items()
-                }
+
+    walk1(fields, [])
+    return plan
+
+
+# Filter plans by definition, rebuilt with their options when the reference
+# data changes. Keyed by the identity of the definition: it must be built
+# once (at import, or with functools.cache) and not be modified afterwards.
+# A definition built per request is compiled every time, and pushes the
+# others out
+FILTER_PLANS_SIZE = 128
+filter_plans = {}
+filter_plans_lock = threading.Lock()
+
+
+def get_filter_plan(fields, model):
+    key = (id(fields), model)
+    entry = filter_plans.get(key)
+    if (
+        entry
+        and entry[0] is fields
+        and entry[1] == reference_data.version
+        and entry[2] > time.monotonic()
+    ):
+        return entry[3]
+    plan = compile_filters(fields, model)
+    with filter_plans_lock:
+        if key not in filter_plans and len(filter_plans) >= FILTER_PLANS_SIZE:
+            del filter_plans[next(iter(filter_plans))]
+        filter_plans[key] = (
+            fields,
+            reference_data.version,
+            time.monotonic() + settings.REFERENCE_DATA_TIMEOUT,
+            plan,
+        )
+    return plan
+
+
+def check_filter_indexes(plan, filters, q):
+    """
+    In DEBUG: warns (UnindexedFilterWarning) when the database would scan
+    the whole table of the model for these filters, once per set of filters
+    """
+    lookups = frozenset(filters)
+    if lookups in plan["explained"]:
+        return
+    plan["explained"].add(lookups)
+    model = plan["model"]
+    table = re.escape(model._meta.db_table)
+    full_scan = re.compile(rf"\bSCAN (TABLE )?{table}\b(?! USING)|Seq Scan on {table}\b")
+    try:
+        # Not counted in the query_budget of the view
+        with uninstrumented():
+            explained = model._default_manager.filter(q).explain()
+    except Exception:  # EXPLAIN isn't supported by every database
+        return
+    for line in explained.splitlines():
+        if full_scan.search(line):
+            warnings.warn(
+                f"Filtering {model._meta.label} on {', '.join(sorted(lookups))} "
+                f"scans the whole table ({line.strip()})",
+                UnindexedFilterWarning,
             )
+            return
 
-    walk1(fields, data, GET)
 
+def read_filter_fields(fields, GET, model):
+    """
+    ({"fields", "data"} of the filter form, the Q of GET), to be given to
+    filter() (the filters dict it used to return is gone). fields must be
+    a definition built once (see filter_plans), a field type that can't be
+    filtered on raises ImproperlyConfigured
+    """
+    plan = get_filter_plan(fields, model)
+    if tracing.is_enabled():
+        tracing.event(
+            "read_filter_fields", model=model._meta.label, params=list(GET or {})
+        )
+    data = {}
+    for k_path in plan["groups"]:
+        target = data
+        for k in k_path:
+            target = target.setdefault(k, {})
+    filters = {}
+    getter = lambda obj, k, default=None: obj.get(k, default) if obj else None
+    for k_path, struct, read in plan["leaves"]:
+        target = data
+        for k in k_path:
+            target = target[k]
+        try:
+            target[struct["k"]] = read_field(GET, struct, getter=getter, raw=True)
+        except ValueError:
+            # e.g. "kind=a,b" for a multiple SelectField, which read() ignores
+            target[struct["k"]] = None
+        filters.update(read(GET or {}))
+    for transformer, prefix, struct in plan["transformers"]:
+        transformer(filters, prefix, struct)
+    q = Q()
+    for k, v in filters.items():
+        q &= v if isinstance(v, Q) else Q(**{k: v})
+    if settings.DEBUG and filters:
+        check_filter_indexes(plan, filters, q)
     return {
-        "fields": fields,
+        "fields": plan["fields"],
         "data": data,
-    }, filters
+    }, q
 
 
 def do_write_fields(fields, obj, data, files=None):
@@ -1182,6 +1564,8 @@ def do_write_fields(fields, obj, data, files=None):
         for k, v in items.items():
             # if not isinstance(v, dict) or not 'type' in v:
             #    continue
+            if k == "_field":
+                continue
             path2 = [*path, k]
             if (
                 "_field" not in v
@@ -1224,7 +1608,7 @@ def do_write_fields(fields, obj, data, files=None):
                         "document": file,
                     }
                 )
-                print("doc id", doc.id)
+                tracing.event("write_fields.attachment", k=k, document_id=doc.id)
                 manager.add(doc)
             # m2m_field.related_model
         # print(obj, obj.__dict__)
@@ -1249,7 +1633,6 @@ def do_write_fields(fields, obj, data, files=None):
                 ).delete()
                 for j, x in enumerate(updated_items):
                     id_ = x.get("id", None)
-                    print("aaa", id_)
                     if id_:
                         try:
                             child = fk_field.model.objects.get(pk=id_)
@@ -1260,9 +1643,11 @@ def do_write_fields(fields, obj, data, files=None):
                     setattr(child, fk_field.name, obj)
                     if v["_field"].get("ordered"):
                         set_by_path(data, [*path2, j, "order"], j + 1)
-                    walk2(v, child, [*path2, j])
+                    with tracing.span("write_fields.row", k=k, index=j, id=id_):
+                        walk2(v, child, [*path2, j])
 
-    walk2(k_fields, obj)
+    with tracing.span("write_fields", model=obj.__class__.__name__, pk=obj.pk):
+        walk2(k_fields, obj)
     return obj
 
 
@@ -1299,7 +1684,10 @@ def write_fields(fields, obj, data, files=None):
 def apply_fields_included_and_required(
     definition, fields_included_and_required, required_by_default
 ):
-    newDefinition = copy.deepcopy(definition)
+    """
+    The definition, with only the included fields, and their "required"
+    set. The unchanged subtrees are shared with `definition`
+    """
     isIncluded = lambda k: k and (
         k in required_by_default
         or fields_included_and_required.get(k, {}).get("available")
@@ -1311,14 +1699,13 @@ def apply_fields_included_and_required(
 
     def spreadRequired(node, required):
         if node.get("fields"):
-            return {
-                **node,
-                "fields": [spreadRequired(f, required) for f in node["fields"]],
-            }
-        else:
-            if node:
-                node["required"] = required
+            fields = [spreadRequired(f, required) for f in node["fields"]]
+            if all(new is old for new, old in zip(fields, node["fields"])):
+                return node
+            return {**node, "fields": fields}
+        if not node or ("required" in node and node["required"] == required):
             return node
+        return {**node, "required": required}
 
     def walk(node):
         k = node.get("k")
@@ -1332,9 +1719,13 @@ def apply_fields_included_and_required(
             return spreadRequired(node, isRequired(k))
 
         if fields:
-            fields = [f for f in [walk(f) for f in fields] if f]
-            if not fields:
+            new_fields = [f for f in [walk(f) for f in fields] if f]
+            if not new_fields:
                 return None
-            return {**node, "fields": fields}
+            if len(new_fields) == len(fields) and all(
+                new is old for new, old in zip(new_fields, fields)
+            ):
+                return node
+            return {**node, "fields": new_fields}
 
-    return walk(newDefinition)
+    return walk(definition)
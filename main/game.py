@@ -0,0 +1,200 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import models
+from .broker import get_broker
+from .game_state import PackedGameState, get_game_state
+
+CORRECT_ANSWERS_CACHE_KEY = "main:correct-answers:{}"
+GAME_CHANNEL = "game:{}"
+
+
+def get_correct_answers(collection_id):
+    """
+    {question_id: correct} for every question of the collection,
+    cached until a question of the collection is saved or deleted
+    """
+    key = CORRECT_ANSWERS_CACHE_KEY.format(collection_id)
+    answers = cache.get(key)
+    if answers is None:
+        answers = dict(
+            models.Question.objects.filter(collection_id=collection_id).values_list(
+                "pk", "correct"
+            )
+        )
+        cache.set(key, answers, settings.CORRECT_ANSWERS_CACHE_TIMEOUT)
+    return answers
+
+
+def invalidate_correct_answers(*collection_ids):
+    cache.delete_many(
+        [CORRECT_ANSWERS_CACHE_KEY.format(pk) for pk in collection_ids if pk]
+    )
+
+
+def start_game(player, collection):
+    game = models.Game(
+        player=player,
+        collection=collection,
+        finished=False,
+        answer_storage=settings.GAME_ANSWER_STORAGE,
+    )
+    if game.answer_storage == "packed":
+        PackedGameState.start(
+            game,
+            list(collection.question_set.order_by("order").values_list("pk", flat=True)),
+        )
+    game.save()
+    return game
+
+
+def record_answers(game, items):
+    """
+    Checks [{"questionId", "answer", "clientSeq"}, ...] against the cached
+    correct answers and stores the new ones in one write (whatever the answer
+    storage of the game is), keeping the score counters of the game (and
+    the leaderboard) up to date.
+    Returns a result per item, in the same order
+    """
+    correct_answers = get_correct_answers(game.collection_id)
+    with transaction.atomic():
+        # Serialises concurrent submissions for the same game,
+        # so that the counters always match the stored answers
+        locked = models.Game.objects.select_for_update().get(pk=game.pk)
+        state = get_game_state(locked)
+        answered = state.answered()
+        results = []
+        new_answers = []
+        for item in items:
+            question_id = item.get("questionId")
+            answer = item.get("answer")
+            result = {"clientSeq": item.get("clientSeq"), "questionId": question_id}
+            results.append(result)
+            if (
+                type(question_id) is not int
+                or question_id not in correct_answers
+                or not state.accepts(question_id)
+                # Not True or 1.0
+                or type(answer) is not int
+                or not 1 <= answer <= 4
+            ):
+                result["status"] = "invalid"
+                continue
+            result["correctAnswer"] = correct_answers[question_id]
+            if question_id in answered:
+                result["status"] = "duplicate"
+                result["correct"] = answered[question_id]
+                continue
+            correct = correct_answers[question_id] == answer
+            answered[question_id] = correct
+            new_answers.append((question_id, answer, correct))
+            result["status"] = "recorded"
+            result["correct"] = correct
+        if new_answers:
+            now = timezone.now()
+            state_fields, skipped = state.add(new_answers, now)
+            if skipped:
+                for result in results:
+                    question_id = result["questionId"]
+                    if result["status"] == "recorded" and question_id in skipped:
+                        result["status"] = "duplicate"
+                        result["correct"] = skipped[question_id]
+                new_answers = [a for a in new_answers if a[0] not in skipped]
+            update_fields = [
+                *state_fields,
+                "answered_count",
+                "score",
+                "modified_datetime",
+            ]
+            locked.answered_count += len(new_answers)
+            locked.score += sum(1 for _, _, correct in new_answers if correct)
+            if (
+                not locked.completed_datetime
+                and locked.answered_count >= state.question_count(correct_answers)
+            ):
+                locked.completed_datetime = now
+                update_fields.append("completed_datetime")
+            locked.save(update_fields=update_fields)
+            for field in update_fields:
+                setattr(game, field, getattr(locked, field))
+            if "completed_datetime" in update_fields:
+                update_leaderboard(game)
+            transaction.on_commit(lambda: publish_game_event(game, results))
+    return results
+
+
+def game_channel(game_id):
+    return GAME_CHANNEL.format(game_id)
+
+
+def publish_game_event(game, results):
+    """
+    Tells the event streams of the game (main/events.py) about new answers
+    """
+    get_broker().publish(
+        game_channel(game.pk),
+        json.dumps(
+            {
+                "type": "answers",
+                "results": [r for r in results if r["status"] == "recorded"],
+            }
+        ),
+    )
+
+
+def update_leaderboard(game):
+    entry = (
+        models.LeaderboardEntry.objects.select_for_update()
+        .filter(collection_id=game.collection_id, player_id=game.player_id)
+        .first()
+    )
+    if not entry:
+        entry = models.LeaderboardEntry(
+            collection_id=game.collection_id, player_id=game.player_id
+        )
+    elif not entry.is_beaten_by(game.score, game.duration):
+        return entry
+    entry.game = game
+    entry.score = game.score
+    entry.duration = game.duration
+    entry.save()
+    return entry
+
+
+def get_leaderboard(collection_id, limit=None):
+    return list(
+        models.LeaderboardEntry.objects.filter(collection_id=collection_id)
+        .order_by("-score", "duration")
+        .values("score", "duration", "player_id", player_name=F("player__name"))[
+            : limit or settings.LEADERBOARD_SIZE
+        ]
+    )
+
+
+def get_question_data(question, build_absolute_uri=None):
+    """
+    What a player sees of a question (media as absolute urls when
+    build_absolute_uri, usually request.build_absolute_uri, is given)
+    """
+    def media_url(file):
+        if not file:
+            return None
+        return build_absolute_uri(file.url) if build_absolute_uri else file.url
+
+    return {
+        "pk": question.pk,
+        "text": question.text,
+        "answer1": question.answer1,
+        "answer2": question.answer2,
+        "answer3": question.answer3,
+        "answer4": question.answer4,
+        "question_type": question.question_type,
+        "photo_file": media_url(question.photo_file),
+        "audio_file": media_url(question.audio_file),
+        "video_file": media_url(question.video_file),
+    }
@@ -0,0 +1,310 @@
+"""
+Two interchangeable ways of storing the answers of a game:
+
+- "rows": one QuestionAnswer row per answer (the original log)
+- "packed": bitmaps on the Game row itself, indexed by the position of the
+  question in the game's manifest (question ids, in collection order,
+  frozen when the game starts), plus an optional array of answer times
+"""
+import sys
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import models
+from .stats import WATERMARK_NAME
+
+PACKED_FIELDS = [
+    "question_ids",
+    "answered_bits",
+    "correct_bits",
+    "answer_bits",
+    "answer_times",
+    "counted_bits",
+]
+
+
+class AnswersNotCounted(Exception):
+    """
+    The game has answers refresh_stats hasn't counted yet: packing would
+    lose them from the statistics
+    """
+
+
+def get_bit(bits, i):
+    return bool(bits[i >> 3] & (1 << (i & 7)))
+
+
+def set_bit(bits, i, value=True):
+    if value:
+        bits[i >> 3] |= 1 << (i & 7)
+    else:
+        bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+
+def get_answer(bits, i):
+    # 4 bits per question, 0 for an unknown answer
+    return (bits[i >> 1] >> ((i & 1) * 4)) & 0xF or None
+
+
+def set_answer(bits, i, answer):
+    shift = (i & 1) * 4
+    bits[i >> 1] = (bits[i >> 1] & ~(0xF << shift) & 0xFF) | ((answer or 0) << shift)
+
+
+def unpack_array(typecode, data):
+    result = array(typecode)
+    result.frombytes(bytes(data or b""))
+    if sys.byteorder == "big":
+        result.byteswap()
+    return result
+
+
+def pack_array(values):
+    values = array(values.typecode, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+class RowGameState:
+    def __init__(self, game):
+        self.game = game
+
+    def answered(self):
+        """
+        {question_id: correct}
+        """
+        return dict(self.game.questionanswer_set.values_list("question_id", "correct"))
+
+    def accepts(self, question_id):
+        return True
+
+    def question_count(self, correct_answers):
+        return len(correct_answers)
+
+    def unanswered_questions(self, collection, correct_answers):
+        answered_ids = self.game.questionanswer_set.values_list("question_id", flat=True)
+        return collection.question_set.filter(~Q(pk__in=answered_ids)).order_by("order")
+
+    def add(self, answers, now):
+        """
+        answers: [(question_id, answer, correct), ...]
+        Returns the Game fields to be saved, and {question_id: correct} of
+        the answers which were stored already (by a concurrent writer)
+        """
+        rows = [
+            models.QuestionAnswer(
+                game=self.game, question_id=question_id, answer=answer, correct=correct
+            )
+            for question_id, answer, correct in answers
+        ]
+        models.QuestionAnswer.objects.bulk_create(rows, ignore_conflicts=True)
+        # ignore_conflicts skips our row when another one got in first: ours
+        # has the created_datetime the insert gave it, the other one doesn't
+        created = {row.question_id: row.created_datetime for row in rows}
+        stored = self.game.questionanswer_set.filter(
+            question_id__in=list(created)
+        ).values_list("question_id", "created_datetime", "correct")
+        skipped = {
+            question_id: correct
+            for question_id, created_datetime, correct in stored
+            if created_datetime != created[question_id]
+        }
+        return [], skipped
+
+
+class PackedGameState:
+    def __init__(self, game):
+        self.game = game
+        self.question_ids = unpack_array("q", game.question_ids)
+        self.positions = {pk: i for i, pk in enumerate(self.question_ids)}
+        size = len(self.question_ids)
+        self.answered_bits = bytearray(game.answered_bits or bytes((size + 7) // 8))
+        self.correct_bits = bytearray(game.correct_bits or bytes((size + 7) // 8))
+        self.answer_bits = bytearray(game.answer_bits or bytes((size + 1) // 2))
+        self.counted_bits = bytearray(game.counted_bits or bytes((size + 7) // 8))
+        self.answer_times = (
+            unpack_array("I", game.answer_times) if game.answer_times else None
+        )
+
+    @classmethod
+    def start(cls, game, question_ids):
+        """
+        question_ids: the manifest, in collection order
+        """
+        game.question_ids = pack_array(array("q", question_ids))
+        game.answered_bits = game.correct_bits = game.answer_bits = None
+        game.counted_bits = None
+        game.answer_times = (
+            pack_array(array("I", [0] * len(question_ids)))
+            if settings.GAME_ANSWER_TIMINGS
+            else None
+        )
+        return cls(game)
+
+    def answered(self):
+        return {
+            pk: get_bit(self.correct_bits, i)
+            for i, pk in enumerate(self.question_ids)
+            if get_bit(self.answered_bits, i)
+        }
+
+    def accepts(self, question_id):
+        return question_id in self.positions
+
+    def question_count(self, correct_answers):
+        # Questions deleted after the game started don't count
+        return sum(1 for pk in self.question_ids if pk in correct_answers)
+
+    def unanswered_questions(self, collection, correct_answers):
+        return collection.question_set.filter(
+            pk__in=[
+                pk
+                for i, pk in enumerate(self.question_ids)
+                if pk in correct_answers and not get_bit(self.answered_bits, i)
+            ]
+        ).order_by("order")
+
+    def add(self, answers, now):
+        # The Game row is locked: nothing is stored concurrently
+        for question_id, answer, correct in answers:
+            self.set(self.positions[question_id], answer, correct, now)
+        return self.save_to(self.game), {}
+
+    def set(self, i, answer, correct, answered_datetime):
+        set_bit(self.answered_bits, i)
+        set_bit(self.correct_bits, i, correct)
+        set_answer(self.answer_bits, i, answer)
+        if self.answer_times is not None:
+            # Milliseconds since the start of the game, 0 for "not answered"
+            elapsed = (answered_datetime - self.game.created_datetime).total_seconds()
+            self.answer_times[i] = max(int(elapsed * 1000), 1)
+
+    def answers(self):
+        """
+        [(question_id, answer, correct, answered_datetime or None, counted), ...]
+        """
+        result = []
+        for i, pk in enumerate(self.question_ids):
+            if not get_bit(self.answered_bits, i):
+                continue
+            answered_datetime = None
+            if self.answer_times is not None and self.answer_times[i]:
+                answered_datetime = self.game.created_datetime + timedelta(
+                    milliseconds=self.answer_times[i]
+                )
+            result.append(
+                (
+                    pk,
+                    get_answer(self.answer_bits, i),
+                    get_bit(self.correct_bits, i),
+                    answered_datetime,
+                    get_bit(self.counted_bits, i),
+                )
+            )
+        return result
+
+    def save_to(self, game):
+        game.question_ids = pack_array(self.question_ids)
+        game.answered_bits = bytes(self.answered_bits)
+        game.correct_bits = bytes(self.correct_bits)
+        game.answer_bits = bytes(self.answer_bits)
+        game.counted_bits = bytes(self.counted_bits)
+        game.answer_times = (
+            pack_array(self.answer_times) if self.answer_times is not None else None
+        )
+        return list(PACKED_FIELDS)
+
+
+GAME_STATES = {
+    "rows": RowGameState,
+    "packed": PackedGameState,
+}
+
+
+def get_game_state(game):
+    return GAME_STATES[game.answer_storage](game)
+
+
+def pack_game(game):
+    """
+    Moves the QuestionAnswer rows of a game into its packed representation.
+    Only rows counted in the statistics can go: raises AnswersNotCounted
+    when refresh_stats hasn't reached some of them yet
+    """
+    with transaction.atomic():
+        game = models.Game.objects.select_for_update().get(pk=game.pk)
+        if game.answer_storage == "packed":
+            return game
+        counted_id = (
+            models.StatsWatermark.objects.filter(name=WATERMARK_NAME)
+            .values_list("last_id", flat=True)
+            .first()
+            or 0
+        )
+        if game.questionanswer_set.filter(id__gt=counted_id, counted=False).exists():
+            raise AnswersNotCounted(f"Game {game.pk} has answers not counted yet")
+        answers = list(
+            game.questionanswer_set.values(
+                "question_id", "answer", "correct", "created_datetime"
+            )
+        )
+        question_ids = list(
+            models.Question.objects.filter(collection_id=game.collection_id)
+            .order_by("order")
+            .values_list("pk", flat=True)
+        )
+        known = set(question_ids)
+        question_ids += [a["question_id"] for a in answers if a["question_id"] not in known]
+        state = PackedGameState.start(game, question_ids)
+        for a in answers:
+            state.set(
+                state.positions[a["question_id"]],
+                a["answer"],
+                a["correct"],
+                a["created_datetime"],
+            )
+            set_bit(state.counted_bits, state.positions[a["question_id"]])
+        game.answer_storage = "packed"
+        game.save(update_fields=["answer_storage", *state.save_to(game)])
+        game.questionanswer_set.all().delete()
+    return game
+
+
+def unpack_game(game):
+    """
+    Turns a packed game back into QuestionAnswer rows
+    """
+    with transaction.atomic():
+        game = models.Game.objects.select_for_update().get(pk=game.pk)
+        if game.answer_storage == "rows":
+            return game
+        state = PackedGameState(game)
+        answers = [
+            models.QuestionAnswer(
+                game=game,
+                question_id=question_id,
+                answer=answer,
+                correct=correct,
+                # The new ids are above the watermark: without this, the
+                # answers packed by pack_game would be counted twice
+                counted=counted,
+            )
+            for question_id, answer, correct, _, counted in state.answers()
+        ]
+        models.QuestionAnswer.objects.bulk_create(answers, ignore_conflicts=True)
+        # created_datetime is auto_now_add: restore the recorded times afterwards
+        for question_id, _, _, answered_datetime, _ in state.answers():
+            if answered_datetime:
+                game.questionanswer_set.filter(question_id=question_id).update(
+                    created_datetime=answered_datetime
+                )
+        game.answer_storage = "rows"
+        for field in PACKED_FIELDS:
+            setattr(game, field, None)
+        game.save(update_fields=["answer_storage", *PACKED_FIELDS])
+    return game
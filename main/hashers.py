@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class PlayerPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the iteration count tuned for player sign-in latency
+    (PLAYER_PASSWORD_ITERATIONS, see the bench_login command)
+    """
+
+    algorithm = "player_pbkdf2_sha256"
+
+    @property
+    def iterations(self):
+        return settings.PLAYER_PASSWORD_ITERATIONS
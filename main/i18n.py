@@ -0,0 +1,213 @@
+"""
+Translation catalogues and per-language memoisation of translated payloads.
+
+- compile_catalogues() compiles locale/*/LC_MESSAGES/django.po into the
+  django.mo next to it, without GNU gettext (manage.py
+  compile_translations). The .mo files are committed, since the serverless
+  build only ships the repository, and nothing is compiled at startup:
+  Django loads the catalogue of a language on its first request.
+  `compile_translations --check` (and TranslationTests) fails when a .po
+  isn't the one whose sha256 is recorded in the header of its .mo
+  (X-Po-Sha256). A hash rather than the mtimes, which a git checkout
+  doesn't preserve.
+- per_language() memoises a function building translated payload
+  fragments, with the lazy translations resolved to str, once per language.
+"""
+import ast
+import functools
+import gettext
+import hashlib
+import os
+import struct
+
+from django.conf import settings
+from django.utils.functional import Promise
+from django.utils.translation import get_language, trans_real
+
+MO_MAGIC = 0x950412DE
+CONTEXT_SEPARATOR = "\x04"
+HASH_HEADER = "X-Po-Sha256"
+
+
+def read_po(path):
+    """
+    {msgid: msgstr} of a .po file, in the keys and values of a .mo file:
+    "context\\x04msgid" for a msgctxt, "msgid\\x00msgid_plural" and the
+    plural forms joined with \\x00 for plurals. Fuzzy and untranslated
+    entries are left out, except the header.
+    """
+    messages = {}
+
+    def add(entry, fuzzy):
+        msgid = entry["msgid"]
+        if "msgid_plural" in entry:
+            msgid += "\x00" + entry["msgid_plural"]
+            msgstr = "\x00".join(entry[k] for k in sorted(entry) if isinstance(k, int))
+        else:
+            msgstr = entry.get("msgstr", "")
+        if "msgctxt" in entry:
+            msgid = entry["msgctxt"] + CONTEXT_SEPARATOR + msgid
+        # msgfmt keeps the header (msgid "") even when it's marked fuzzy
+        if msgstr.strip("\x00") and (not fuzzy or not msgid):
+            messages[msgid] = msgstr
+
+    def in_msgstr(section):
+        return section == "msgstr" or isinstance(section, int)
+
+    entry = {}
+    fuzzy = False
+    section = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                if in_msgstr(section):
+                    add(entry, fuzzy)
+                    entry, fuzzy, section = {}, False, None
+                if line.startswith("#,") and "fuzzy" in line:
+                    fuzzy = True
+                continue
+            if line.startswith('"'):
+                entry[section] += ast.literal_eval(line)
+                continue
+            keyword, _, value = line.partition(" ")
+            if keyword.startswith("msgstr["):
+                keyword = int(keyword[7:-1])
+            if keyword in ("msgctxt", "msgid") and in_msgstr(section):
+                add(entry, fuzzy)
+                entry, fuzzy = {}, False
+            section = keyword
+            entry[section] = ast.literal_eval(value)
+    if in_msgstr(section):
+        add(entry, fuzzy)
+    return messages
+
+
+def mo_bytes(messages):
+    """
+    The GNU .mo file of {msgid: msgstr}, as msgfmt writes it (without the
+    optional hash table)
+    """
+    keys = sorted(messages)
+    ids = b""
+    strs = b""
+    offsets = []
+    for key in keys:
+        msgid = key.encode()
+        msgstr = messages[key].encode()
+        offsets.append((len(ids), len(msgid), len(strs), len(msgstr)))
+        ids += msgid + b"\x00"
+        strs += msgstr + b"\x00"
+    count = len(keys)
+    keys_start = 7 * 4
+    values_start = keys_start + count * 8
+    ids_start = values_start + count * 8
+    strs_start = ids_start + len(ids)
+    key_table = []
+    value_table = []
+    for id_offset, id_length, str_offset, str_length in offsets:
+        key_table += [id_length, ids_start + id_offset]
+        value_table += [str_length, strs_start + str_offset]
+    return (
+        struct.pack("Iiiiiii", MO_MAGIC, 0, count, keys_start, values_start, 0, 0)
+        + struct.pack(f"{len(key_table)}i", *key_table)
+        + struct.pack(f"{len(value_table)}i", *value_table)
+        + ids
+        + strs
+    )
+
+
+def get_po_paths(language=None):
+    for locale_path in settings.LOCALE_PATHS:
+        if not os.path.isdir(locale_path):
+            continue
+        for name in sorted(os.listdir(locale_path)):
+            if language and name != trans_real.to_locale(language):
+                continue
+            path = os.path.join(locale_path, name, "LC_MESSAGES", "django.po")
+            if os.path.exists(path):
+                yield path
+
+
+def po_hash(po_path):
+    with open(po_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compile_po(po_path):
+    """
+    The .mo of a .po, with the sha256 of the .po in its header
+    """
+    messages = read_po(po_path)
+    header = messages.get("", "")
+    if header and not header.endswith("\n"):
+        header += "\n"
+    messages[""] = header + f"{HASH_HEADER}: {po_hash(po_path)}\n"
+    return mo_bytes(messages)
+
+
+def is_stale(po_path):
+    """
+    Whether the .mo next to the .po wasn't compiled from this .po
+    """
+    mo_path = po_path[:-3] + ".mo"
+    if not os.path.exists(mo_path):
+        return True
+    with open(mo_path, "rb") as f:
+        try:
+            info = gettext.GNUTranslations(f).info()
+        except OSError:
+            return True
+    return info.get(HASH_HEADER.lower()) != po_hash(po_path)
+
+
+def compile_catalogues(force=False, dry_run=False):
+    """
+    Writes the .mo of every stale .po of settings.LOCALE_PATHS (unless
+    dry_run), returns their paths
+    """
+    compiled = []
+    for po_path in get_po_paths():
+        if not force and not is_stale(po_path):
+            continue
+        mo_path = po_path[:-3] + ".mo"
+        if not dry_run:
+            with open(mo_path, "wb") as f:
+                f.write(compile_po(po_path))
+        compiled.append(mo_path)
+    return compiled
+
+
+def resolve(data):
+    """
+    data with the lazy translations replaced with str
+    """
+    if isinstance(data, Promise):
+        return str(data)
+    if isinstance(data, dict):
+        return {k: resolve(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [resolve(v) for v in data]
+    return data
+
+
+def per_language(func):
+    """
+    Memoises func() for the active language, with the translations resolved.
+    The result is shared: it must not be modified.
+    """
+    results = {}
+
+    @functools.wraps(func)
+    def wrapper():
+        language = get_language()
+        try:
+            return results[language]
+        except KeyError:
+            result = results[language] = resolve(func())
+            return result
+
+    wrapper.cache_clear = results.clear
+    return wrapper
@@ -0,0 +1,231 @@
+"""
+Instrumentation of the views (InstrumentationMiddleware): the SQL queries,
+database time, JSON serialisation time (main/responses.py) and total
+latency of every request, by view and method
+
+- in a Server-Timing header of the response (SERVER_TIMING)
+- summed up per process, at /metrics/ in the Prometheus text format
+  (metrics_view)
+
+A view can declare a query_budget, a number of queries or
+{"GET": ..., "POST": ...}. A request over it is logged, or raises
+QueryBudgetExceeded when QUERY_BUDGETS_ENFORCED (as main/tests.py does),
+failing the test.
+"""
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger("main.instrumentation")
+
+# Upper bounds of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current_metrics = contextvars.ContextVar("request_metrics", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.query_budget = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper of the database connections
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+@contextlib.contextmanager
+def uninstrumented():
+    """
+    The queries run within it aren't counted in the request's metrics (nor
+    its query_budget): the diagnostics of DEBUG
+    """
+    token = _current_metrics.set(None)
+    try:
+        yield
+    finally:
+        _current_metrics.reset(token)
+
+
+def record_serialization(seconds):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.serialization_time += seconds
+
+
+def get_query_budget(view_class, method):
+    budget = getattr(view_class, "query_budget", None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+class Registry:
+    """
+    The metrics of the requests served by this process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.views = defaultdict(
+            lambda: {
+                "requests": 0,
+                "queries": 0,
+                "db_seconds": 0.0,
+                "serialization_seconds": 0.0,
+                "duration_seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "over_budget": 0,
+            }
+        )
+
+    def add(self, metrics, method, duration, over_budget):
+        with self.lock:
+            view = self.views[metrics.view, method]
+            view["requests"] += 1
+            view["queries"] += metrics.queries
+            view["db_seconds"] += metrics.db_time
+            view["serialization_seconds"] += metrics.serialization_time
+            view["duration_seconds"] += duration
+            view["over_budget"] += over_budget
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    view["buckets"][i] += 1
+
+    def render(self):
+        """
+        The Prometheus text exposition format
+        """
+        with self.lock:
+            views = {
+                k: {**v, "buckets": list(v["buckets"])} for k, v in self.views.items()
+            }
+        lines = []
+        counters = [
+            ("requests", "milgame_requests_total", "Requests served"),
+            ("queries", "milgame_queries_total", "SQL queries"),
+            ("db_seconds", "milgame_db_seconds_total", "Time in the database"),
+            (
+                "serialization_seconds",
+                "milgame_serialization_seconds_total",
+                "Time encoding JSON",
+            ),
+            (
+                "over_budget",
+                "milgame_query_budget_exceeded_total",
+                "Requests over their view's query budget",
+            ),
+        ]
+        for key, name, help_text in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (view, method), values in sorted(views.items()):
+                labels = f'view="{view}",method="{method}"'
+                lines.append(f"{name}{{{labels}}} {values[key]}")
+        name = "milgame_request_duration_seconds"
+        lines += [f"# HELP {name} Request latency", f"# TYPE {name} histogram"]
+        for (view, method), values in sorted(views.items()):
+            labels = f'view="{view}",method="{method}"'
+            for bound, count in zip(LATENCY_BUCKETS, values["buckets"]):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {values["requests"]}')
+            lines.append(f"{name}_sum{{{labels}}} {values['duration_seconds']}")
+            lines.append(f"{name}_count{{{labels}}} {values['requests']}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        # The connections of this thread, where the views run their queries
+        for connection in connections.all():
+            if record_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(record_query)
+        request.metrics = RequestMetrics()
+        _current_metrics.set(request.metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", view_func)
+        request.metrics.view = view_class.__name__
+        request.metrics.query_budget = get_query_budget(view_class, request.method)
+
+    def process_response(self, request, response):
+        metrics = getattr(request, "metrics", None)
+        if metrics is None:
+            return response
+        _current_metrics.set(None)
+        duration = time.perf_counter() - metrics.started
+        if metrics.view is None:
+            metrics.view = "unresolved"
+        over_budget = (
+            metrics.query_budget is not None and metrics.queries > metrics.query_budget
+        )
+        registry.add(metrics, request.method, duration, over_budget)
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = ", ".join(
+                [
+                    f"db;dur={metrics.db_time * 1000:.1f}"
+                    f';desc="{metrics.queries} queries"',
+                    f"serialize;dur={metrics.serialization_time * 1000:.1f}",
+                    f"total;dur={duration * 1000:.1f}",
+                ]
+            )
+        if over_budget:
+            message = (
+                f"{metrics.view} ({request.method} {request.path}) ran "
+                f"{metrics.queries} queries, over its budget of {metrics.query_budget}"
+            )
+            if settings.QUERY_BUDGETS_ENFORCED:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def metrics_view(request):
+    """
+    The metrics of this process, with "Authorization: Bearer <METRICS_TOKEN>",
+    or without it in DEBUG when no token is set
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            raise Http404()
+    elif not settings.DEBUG:
+        raise Http404()
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
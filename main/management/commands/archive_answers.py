@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.archive import archive_answers
+
+
+class Command(BaseCommand):
+    help = (
+        "Move answers of games completed more than N days ago from the "
+        "QuestionAnswer table into per-month gzipped JSONL archive files. "
+        "Safe to interrupt and re-run"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ANSWER_ARCHIVE_DAYS)
+        parser.add_argument("--archive-dir", default=settings.ANSWER_ARCHIVE_DIR)
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        moved = archive_answers(
+            days=options["days"],
+            archive_dir=options["archive_dir"],
+            chunk_size=options["chunk_size"],
+        )
+        self.stdout.write(f"Archived {moved} answer(s) to {options['archive_dir']}")
@@ -0,0 +1,193 @@
+import copy
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from main import framework, reference_data
+from main.bench import (
+    benchmark_database,
+    make_node_definition,
+    make_node_models,
+    print_table,
+    seed_nodes,
+    seed_options,
+    summarize,
+    write_json,
+)
+from main.utils2 import recursive_merge_dict
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting the queries (CaptureQueriesContext keeps
+    9000 at most)
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run(setup, operation, repeat):
+    """
+    Times operation(*setup()) `repeat` times (setup() isn't timed),
+    with the queries per call and the memory one call allocates
+    """
+    operation(*setup())
+    timings = []
+    counter = QueryCounter()
+    for _ in range(repeat):
+        args = setup()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            operation(*args)
+            timings.append(time.perf_counter() - started)
+    args = setup()
+    tracemalloc.start()
+    operation(*args)
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return summarize(timings, queries=counter.count / repeat, allocated_kb=allocated / 1024)
+
+
+def get_operations(root, width, depth):
+    """
+    {name: (setup, operation)}
+    """
+    model = root.__class__
+
+    def definition():
+        # walk_with_model assigns the fields of the definition it's given
+        return make_node_definition(width, depth)
+
+    def fresh_root():
+        # Without the related objects cached by previous reads
+        return model.objects.get(pk=root.pk)
+
+    data = framework.read_fields(definition(), fresh_root())["data"]
+
+    def cold_options():
+        reference_data.clear()
+        return definition(), model
+
+    def write(fields, obj, data):
+        with transaction.atomic():
+            framework.write_fields(fields, obj, data)
+
+    return {
+        "walk_with_model (cold options)": (
+            cold_options,
+            framework.apply_model_to_fields,
+        ),
+        "walk_with_model": (
+            lambda: (definition(), model),
+            framework.apply_model_to_fields,
+        ),
+        "get_k_fields": (
+            lambda: (framework.apply_model_to_fields(definition(), model),),
+            framework.get_k_fields,
+        ),
+        "read_fields": (
+            lambda: (definition(), fresh_root()),
+            framework.read_fields,
+        ),
+        "write_fields": (
+            lambda: (definition(), fresh_root(), copy.deepcopy(data)),
+            write,
+        ),
+        "recursive_merge_dict": (
+            lambda: (data, copy.deepcopy(data)),
+            recursive_merge_dict,
+        ),
+    }
+
+
+def find_regressions(previous, results, tolerance):
+    """
+    The operations slower (p50) or allocating more than `tolerance` % over
+    a previous run, or running more queries
+    """
+    before = {(r["case"], r["operation"]): r for r in previous}
+    regressions = []
+    for row in results:
+        old = before.get((row["case"], row["operation"]))
+        if not old:
+            continue
+        for column in ["p50_ms", "allocated_kb"]:
+            if old[column] and row[column] > old[column] * (1 + tolerance / 100):
+                regressions.append(
+                    f"{row['case']} {row['operation']}: {column} "
+                    f"{old[column]:.3f} -> {row[column]:.3f}"
+                )
+        if row["queries"] > old["queries"]:
+            regressions.append(
+                f"{row['case']} {row['operation']}: queries "
+                f"{old['queries']:.1f} -> {row['queries']:.1f}"
+            )
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the framework's read/write engine (walk_with_model, "
+        "get_k_fields, read_fields, write_fields, recursive_merge_dict) on "
+        "synthetic models and definitions of several widths and depths: "
+        "nested ForeignKeyListFields, a SelectField of --options options and "
+        "an M2M on every level, in a throw-away database. Reports the time, "
+        "queries and allocations of each operation; with --compare, fails "
+        "on regressions against a previous --json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--widths", type=int, nargs="+", default=[10, 50])
+        parser.add_argument("--depths", type=int, nargs="+", default=[1, 2, 3])
+        parser.add_argument("--children", type=int, default=5, help="Per node")
+        parser.add_argument("--options", type=int, default=1000)
+        parser.add_argument("--tags", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--json", help="Write the results to this file")
+        parser.add_argument("--compare", help="The results of a previous run")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=25,
+            help="% slower or more allocations than --compare that fails",
+        )
+
+    def handle(self, *args, **options):
+        bench_models = make_node_models(max(options["widths"]), max(options["depths"]))
+        results = []
+        with benchmark_database():
+            seed_options(bench_models, options["options"], options["tags"])
+            for width in options["widths"]:
+                for depth in options["depths"]:
+                    root = seed_nodes(bench_models, width, depth, options["children"])
+                    operations = get_operations(root, width, depth)
+                    for name, (setup, operation) in operations.items():
+                        results.append(
+                            {
+                                "case": f"w{width}-d{depth}",
+                                "operation": name,
+                                **run(setup, operation, options["repeat"]),
+                            }
+                        )
+        print_table(
+            self.stdout,
+            results,
+            ["case", "operation", "mean_ms", "p50_ms", "p95_ms", "queries", "allocated_kb"],
+        )
+        if options["json"]:
+            write_json(options["json"], results)
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+            regressions = find_regressions(previous, results, options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions:\n" + "\n".join(regressions))
+            self.stdout.write(f"No regression against {options['compare']}")
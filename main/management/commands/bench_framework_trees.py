@@ -0,0 +1,83 @@
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from main import framework
+from main.bench import make_definition, print_table, summarize, write_json
+
+
+def make_not_required(field, _):
+    # As read_filter_fields does
+    if field.get("required"):
+        return {**field, "required": False}
+    return field
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the framework's tree transforms on a large form definition, "
+        "and the memory each call allocates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fields", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        definition = make_definition(options["fields"])
+        leaves = [
+            {**field, "json_collection": "extra"}
+            for section in definition["fields"]
+            for group in section["fields"]
+            for field in group["fields"]
+        ]
+        obj = SimpleNamespace(extra={field["k"]: "value" for field in leaves})
+        # A few fields made available, as a typical fields_included_and_required
+        included = {
+            field["k"]: {"available": True, "required": i % 2 == 0}
+            for i, field in enumerate(leaves[::10])
+        }
+        operations = {
+            "walk_the_tree (unchanged)": lambda: framework.walk_the_tree(
+                definition, lambda node, parents: node
+            ),
+            "walk_the_tree (not required)": lambda: framework.walk_the_tree(
+                definition, make_not_required
+            ),
+            "apply_fields_included_and_required": lambda: (
+                framework.apply_fields_included_and_required(definition, included, [])
+            ),
+            "get_k_fields": lambda: framework.get_k_fields(definition),
+            "read_field (json_collection) x fields": lambda: [
+                framework.read_field(obj, field) for field in leaves
+            ],
+        }
+        results = []
+        for name, operation in operations.items():
+            operation()
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                operation()
+                timings.append(time.perf_counter() - started)
+            tracemalloc.start()
+            operation()
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append(
+                {
+                    "operation": name,
+                    **summarize(timings),
+                    "allocated_kb": allocated / 1024,
+                }
+            )
+        print_table(
+            self.stdout,
+            results,
+            ["operation", "mean_ms", "p95_ms", "allocated_kb"],
+        )
+        if options["json"]:
+            write_json(options["json"], results)
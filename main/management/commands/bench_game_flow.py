@@ -0,0 +1,243 @@
+import json
+import random
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from main import models
+from main.bench import (
+    benchmark_database,
+    load_fixture,
+    make_game_fixture,
+    print_table,
+    summarize,
+    write_json,
+)
+
+STEPS = ["login", "catalogue", "game", "answer"]
+# Compared with --compare
+COMPARED = ["p50_ms", "p95_ms", "p99_ms", "queries"]
+
+re_queries = re.compile(r'desc="(\d+) queries"')
+
+
+def get_queries(response):
+    """
+    The queries of the request, from its Server-Timing header
+    (see main/instrumentation.py)
+    """
+    match = re_queries.search(response.get("Server-Timing", ""))
+    return int(match.group(1)) if match else None
+
+
+class FlowError(Exception):
+    pass
+
+
+def play(player, password, collection_pks, seed):
+    """
+    Signs in, loads the catalogue and answers every question of a
+    collection. Returns {step: [(seconds, queries)]} and {step: errors}:
+    a failed request ends the player's game
+    """
+    rng = random.Random(seed)
+    # An address per player, for the sign in rate limit
+    address = ".".join(str(player.pk >> shift & 255) for shift in (16, 8, 0))
+    client = Client(raise_request_exception=False, REMOTE_ADDR=f"10.{address}")
+    steps = defaultdict(list)
+    errors = defaultdict(int)
+
+    def request(step, method, url, data=None):
+        started = time.perf_counter()
+        if method == "post":
+            response = client.post(
+                url, json.dumps({"data": data}), content_type="application/json"
+            )
+        else:
+            response = client.get(url)
+        steps[step].append((time.perf_counter() - started, get_queries(response)))
+        if response.status_code != 200:
+            errors[step] += 1
+            raise FlowError()
+        return response.json()
+
+    try:
+        credentials = {"name": player.name, "password": password}
+        request("login", "post", "/api/welcome/", credentials)
+        catalogue = request("catalogue", "get", "/api/")
+        if "navigate" in catalogue:
+            raise CommandError(f"{player.name} isn't signed in")
+        collection_pk = rng.choice(collection_pks)
+        url = f"/api/simple-game/{collection_pk}/"
+        page = request("game", "get", url)
+        while page.get("template") == "Game":
+            answer = {"questionId": page["pk"], "answer": rng.randint(1, 4)}
+            request("answer", "post", url, answer)
+            page = request("game", "get", url)
+        if page.get("template") != "GameResults":
+            raise CommandError(f"Unexpected page {page}")
+    except FlowError:
+        pass
+    finally:
+        connection.close()
+    return steps, errors
+
+
+def compare(stdout, previous, results):
+    rows = []
+    for step, values in results["steps"].items():
+        before = previous.get("steps", {}).get(step)
+        if not before:
+            continue
+        for column in COMPARED:
+            if before.get(column) is None or values.get(column) is None:
+                continue
+            change = (
+                (values[column] - before[column]) / before[column] * 100
+                if before[column]
+                else None
+            )
+            rows.append(
+                {
+                    "step": step,
+                    "metric": column,
+                    "before": before[column],
+                    "after": values[column],
+                    "change_%": change,
+                }
+            )
+    for column in ["requests_per_second", "games_per_second"]:
+        before = previous.get("overall", {}).get(column)
+        after = results["overall"][column]
+        if before:
+            rows.append(
+                {
+                    "step": "overall",
+                    "metric": column,
+                    "before": before,
+                    "after": after,
+                    "change_%": (after - before) / before * 100,
+                }
+            )
+    print_table(stdout, rows, ["step", "metric", "before", "after", "change_%"])
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the game flow on a throw-away database seeded like the "
+        "seed command: concurrent players sign in, load the catalogue and "
+        "answer every question of a collection, through the test client. "
+        "Reports the latency percentiles and queries of each step and the "
+        "throughput, as JSON comparable between runs (--json, --compare). "
+        "On SQLite, concurrent answers fail with \"database is locked\" "
+        "(counted as errors): --workers defaults to 1 there, compare workers > 1 "
+        "on PostgreSQL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--players", type=int, default=50)
+        parser.add_argument("--collections", type=int, default=5)
+        parser.add_argument("--questions", type=int, default=20, help="Per collection")
+        parser.add_argument(
+            "--workers", type=int, help="Concurrent players, 4 (1 on SQLite)"
+        )
+        parser.add_argument("--random-seed", type=int, default=0)
+        parser.add_argument("--json", help="Write the results to this file")
+        parser.add_argument("--compare", help="The results of a previous run")
+
+    def handle(self, *args, **options):
+        password = "secret"
+        if options["workers"] is None:
+            options["workers"] = 1 if connection.vendor == "sqlite" else 4
+        elif options["workers"] > 1 and connection.vendor == "sqlite":
+            self.stderr.write(
+                "SQLite: the concurrent answers will fail with \"database is locked\""
+            )
+        with benchmark_database(concurrent=True), override_settings(SERVER_TIMING=True):
+            load_fixture(
+                make_game_fixture(
+                    options["players"],
+                    options["collections"],
+                    options["questions"],
+                    seed=options["random_seed"],
+                    password=password,
+                )
+            )
+            players = list(models.Player.objects.order_by("pk"))
+            collection_pks = list(
+                models.Collection.objects.values_list("pk", flat=True)
+            )
+            connection.close()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options["workers"]) as executor:
+                runs = list(
+                    executor.map(
+                        lambda player: play(
+                            player,
+                            password,
+                            collection_pks,
+                            f"{options['random_seed']}-{player.pk}",
+                        ),
+                        players,
+                    )
+                )
+            total = time.perf_counter() - started
+
+        steps = {}
+        requests = 0
+        for step in STEPS:
+            samples = [sample for run, _ in runs for sample in run[step]]
+            queries = [q for _, q in samples if q is not None]
+            requests += len(samples)
+            steps[step] = summarize(
+                [seconds for seconds, _ in samples],
+                queries=sum(queries) / len(queries) if queries else None,
+                max_queries=max(queries, default=None),
+                errors=sum(errors[step] for _, errors in runs),
+            )
+        completed = sum(1 for _, errors in runs if not any(errors.values()))
+        results = {
+            "config": {
+                k: options[k]
+                for k in [
+                    "players", "collections", "questions", "workers", "random_seed"
+                ]
+            },
+            "steps": steps,
+            "overall": {
+                "requests": requests,
+                "errors": sum(values["errors"] for values in steps.values()),
+                "seconds": total,
+                "requests_per_second": requests / total,
+                "games_per_second": completed / total,
+            },
+        }
+        print_table(
+            self.stdout,
+            [{"step": step, **values} for step, values in steps.items()],
+            [
+                "step", "n", "p50_ms", "p95_ms", "p99_ms",
+                "queries", "max_queries", "errors",
+            ],
+        )
+        self.stdout.write("")
+        print_table(
+            self.stdout,
+            [results["overall"]],
+            [
+                "requests", "errors", "seconds",
+                "requests_per_second", "games_per_second",
+            ],
+        )
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+            self.stdout.write("")
+            compare(self.stdout, previous, results)
+        if options["json"]:
+            write_json(options["json"], results)
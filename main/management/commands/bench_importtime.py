@@ -0,0 +1,112 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.bench import print_table, summarize, write_json
+
+# What a cold start of the lambda runs before answering its first request
+COLD_START = (
+    "import django.urls, milgame.wsgi; "
+    "django.urls.get_resolver().url_patterns"
+)
+
+MODES = {
+    "full": {"MILGAME_LEAN_API": "0"},
+    "lean": {"MILGAME_LEAN_API": "1"},
+}
+
+
+def parse_importtime(output):
+    """
+    The `python -X importtime` report, as
+    [(self µs, cumulative µs, module, depth)]
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(self_us), int(cumulative_us), name.strip(), depth))
+    return modules
+
+
+def run_cold_start(env):
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", COLD_START],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+    modules = parse_importtime(process.stderr)
+    if process.returncode:
+        raise CommandError(process.stderr[-2000:])
+    return wall, modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cold start of the WSGI lambda, full and lean "
+        "(MILGAME_LEAN_API): run Django's setup and URLconf loading in fresh "
+        "interpreters with -X importtime, and report the time and the "
+        "heaviest top-level packages"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        env = {"DJANGO_SETTINGS_MODULE": os.environ["DJANGO_SETTINGS_MODULE"]}
+        results = []
+        packages = []
+        for mode, mode_env in MODES.items():
+            walls = []
+            imports = []
+            package_times = defaultdict(list)
+            for _ in range(options["repeat"]):
+                wall, modules = run_cold_start({**env, **mode_env})
+                walls.append(wall)
+                imports.append(sum(m[1] for m in modules if m[3] == 0) / 1e6)
+                run_packages = defaultdict(int)
+                for self_us, _, name, _ in modules:
+                    run_packages[name.split(".")[0]] += self_us
+                for name, us in run_packages.items():
+                    package_times[name].append(us / 1000)
+            results.append(
+                {
+                    "mode": mode,
+                    "modules": len(modules),
+                    **summarize(walls),
+                    "imports_ms": statistics.median(imports) * 1000,
+                }
+            )
+            for name, times in package_times.items():
+                packages.append(
+                    {"mode": mode, "package": name, "self_ms": statistics.median(times)}
+                )
+        print_table(
+            self.stdout,
+            results,
+            ["mode", "modules", "p50_ms", "mean_ms", "imports_ms"],
+        )
+        self.stdout.write("")
+        top = []
+        for mode in MODES:
+            rows = [p for p in packages if p["mode"] == mode]
+            top += sorted(rows, key=lambda p: -p["self_ms"])[: options["top"]]
+        print_table(self.stdout, top, ["mode", "package", "self_ms"])
+        if options["json"]:
+            write_json(options["json"], {"cold_starts": results, "packages": packages})
@@ -0,0 +1,127 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from logicore_django_react_pages.views import JsonResponse as LibraryJsonResponse
+
+from main import models, responses, views
+from main.bench import benchmark_database, print_table, summarize, write_json
+from main.framework import read_fields
+from main.middleware import brotli, compress
+
+
+class Command(BaseCommand):
+    help = (
+        "Encode typical API payloads with the library JsonResponse, the stdlib "
+        "and orjson paths of main.responses, and compare the time and the "
+        "bytes on the wire, raw, gzip and brotli"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--collections", type=int, default=200)
+        parser.add_argument("--questions", type=int, default=200)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            payloads = self.get_payloads(options)
+        encoders = {
+            "library": lambda data: LibraryJsonResponse(data, safe=False).content,
+            "stdlib": responses.dumps_stdlib,
+        }
+        if responses.orjson:
+            encoders["orjson"] = responses.dumps
+        results = []
+        for payload_name, data in payloads.items():
+            for encoder_name, encode in encoders.items():
+                content = encode(data)
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    encode(data)
+                    timings.append(time.perf_counter() - started)
+                results.append(
+                    {
+                        "payload": payload_name,
+                        "encoder": encoder_name,
+                        **summarize(timings),
+                        "bytes": len(content),
+                        "gzip_bytes": len(compress(content, "gzip")),
+                        "br_bytes": len(compress(content, "br")) if brotli else None,
+                    }
+                )
+        print_table(
+            self.stdout,
+            results,
+            ["payload", "encoder", "mean_ms", "p95_ms", "bytes", "gzip_bytes", "br_bytes"],
+        )
+        if options["json"]:
+            write_json(options["json"], results)
+
+    def get_payloads(self, options):
+        now = timezone.now()
+        home = {
+            "title": "Home",
+            "player_name": "bench",
+            "my_games": [
+                {"name": f"Collection {i}", "pk": i, "last_start": now}
+                for i in range(options["collections"] // 2)
+            ],
+            "other_games": [
+                {"name": f"Collection {i}", "pk": i}
+                for i in range(options["collections"] // 2, options["collections"])
+            ],
+        }
+        welcome = views.WelcomeView()
+        welcome.player = None
+        collection = models.Collection.objects.create(name="Benchmark")
+        models.Question.objects.bulk_create(
+            [
+                models.Question(
+                    collection=collection,
+                    order=i,
+                    text=f"Question {i} " * 10,
+                    answer1="First answer",
+                    answer2="Second answer",
+                    answer3="Third answer",
+                    answer4="Fourth answer",
+                    correct=1 + i % 4,
+                )
+                for i in range(options["questions"])
+            ]
+        )
+        collection_fields = read_fields(
+            {
+                "type": "Fields",
+                "fields": [
+                    {"from_field": "name"},
+                    {
+                        "type": "ForeignKeyListField",
+                        "k": "question",
+                        "fields": [
+                            {"from_field": "text"},
+                            {"from_field": "answer1"},
+                            {"from_field": "answer2"},
+                            {"from_field": "answer3"},
+                            {"from_field": "answer4"},
+                            {"from_field": "correct"},
+                            {"from_field": "order"},
+                        ],
+                    },
+                ],
+            },
+            collection,
+        )
+        payloads = {
+            "home": home,
+            "welcome": welcome.get_data(None),
+            "read_fields": collection_fields,
+        }
+        # The fast path must give the same JSON as the library
+        for name, data in payloads.items():
+            assert json.loads(responses.dumps(data)) == json.loads(
+                LibraryJsonResponse(data, safe=False).content
+            ), name
+        return payloads
@@ -0,0 +1,87 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from main import models
+from main.bench import benchmark_database, print_table, summarize, write_json
+from main.players import hash_player_password
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the player password hash cost for several iteration counts, "
+        "and sign-in latency under a burst of concurrent logins"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            nargs="*",
+            default=[60000, 120000, 250000, 390000],
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--burst", type=int, default=50)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        results = {"hash": [], "burst": None}
+        for iterations in options["iterations"]:
+            with override_settings(PLAYER_PASSWORD_ITERATIONS=iterations):
+                encoded = make_password("secret", hasher=settings.PLAYER_PASSWORD_HASHER)
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    check_password("secret", encoded)
+                    timings.append(time.perf_counter() - started)
+            results["hash"].append({"iterations": iterations, **summarize(timings)})
+        print_table(self.stdout, results["hash"], ["iterations", "mean_ms", "p95_ms"])
+
+        with benchmark_database():
+            players = [
+                models.Player.objects.create(
+                    name=f"player{i}", password=hash_player_password("secret")
+                )
+                for i in range(options["burst"])
+            ]
+
+            def login(i):
+                client = Client(REMOTE_ADDR=f"10.0.{i // 256}.{i % 256}")
+                started = time.perf_counter()
+                response = client.post(
+                    "/api/welcome/",
+                    json.dumps({"data": {"name": players[i].name, "password": "secret"}}),
+                    content_type="application/json",
+                )
+                elapsed = time.perf_counter() - started
+                connection.close()
+                assert response.status_code == 200, response.content
+                return elapsed
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options["workers"]) as executor:
+                timings = list(executor.map(login, range(options["burst"])))
+            total = time.perf_counter() - started
+        burst = summarize(
+            timings,
+            iterations=settings.PLAYER_PASSWORD_ITERATIONS,
+            workers=options["workers"],
+            logins_per_second=len(timings) / total,
+            budget_ms=settings.PLAYER_LOGIN_LATENCY_BUDGET_MS,
+        )
+        burst["within_budget"] = burst["p95_ms"] <= burst["budget_ms"]
+        results["burst"] = burst
+        print_table(
+            self.stdout,
+            [burst],
+            ["iterations", "workers", "n", "p50_ms", "p95_ms", "p99_ms", "logins_per_second", "within_budget"],
+        )
+        if options["json"]:
+            write_json(options["json"], results)
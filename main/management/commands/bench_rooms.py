@@ -0,0 +1,137 @@
+import asyncio
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.crypto import get_random_string
+from websockets.asyncio.client import connect
+
+from main import models
+from main.bench import create_player_session, print_table, summarize, write_json
+
+
+class Command(BaseCommand):
+    help = (
+        "Play a live room with many players against a running ASGI server "
+        "sharing this database and SECRET_KEY (python -m milgame.asgi_server): "
+        "time to broadcast each question to every socket, answer round trips, "
+        "and check that every answer was written"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="ws://127.0.0.1:8000")
+        parser.add_argument("--players", type=int, default=1000)
+        parser.add_argument("--questions", type=int, default=10)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        prefix = f"bench-{get_random_string(6)}"
+        collection = models.Collection.objects.create(name="Benchmark")
+        models.Question.objects.bulk_create(
+            [
+                models.Question(
+                    collection=collection,
+                    order=i,
+                    text=f"Question {i}",
+                    answer1="1",
+                    answer2="2",
+                    answer3="3",
+                    answer4="4",
+                    correct=1 + i % 4,
+                )
+                for i in range(options["questions"])
+            ]
+        )
+        try:
+            host = create_player_session(f"{prefix}-host")
+            room = models.Room.objects.create(
+                code=prefix.replace("-", ""),
+                collection=collection,
+                host=models.Player.objects.get(name=f"{prefix}-host"),
+            )
+            players = [
+                create_player_session(f"{prefix}-{i}") for i in range(options["players"])
+            ]
+            result = asyncio.run(
+                play_room(
+                    f"{options['url'].rstrip('/')}/ws/rooms/{room.code}/",
+                    host,
+                    players,
+                    options["questions"],
+                )
+            )
+            result["answers_written"] = models.QuestionAnswer.objects.filter(
+                game__room=room
+            ).count()
+            result["answers_expected"] = options["players"] * options["questions"]
+        finally:
+            models.Player.objects.filter(name__startswith=prefix).delete()
+            collection.delete()
+        rows = [
+            {"timing": name, **result[name]} for name in ["broadcast", "answer"]
+        ]
+        print_table(self.stdout, rows, ["timing", "n", "p50_ms", "p95_ms", "p99_ms"])
+        print_table(
+            self.stdout,
+            [result],
+            ["players", "connect_s", "answers_expected", "answers_written"],
+        )
+        if options["json"]:
+            write_json(options["json"], result)
+
+
+async def receive(socket, message_type):
+    while True:
+        message = json.loads(await socket.recv())
+        if message["type"] == message_type:
+            return message
+
+
+async def play_room(url, host, players, questions):
+    started = time.perf_counter()
+    host_socket = await connect(url, additional_headers={"Cookie": host["cookie"]})
+    sockets = []
+    for i in range(0, len(players), 100):
+        sockets += await asyncio.gather(
+            *(
+                connect(url, additional_headers={"Cookie": p["cookie"]}, open_timeout=60)
+                for p in players[i : i + 100]
+            )
+        )
+    # Every player has joined
+    while (await receive(host_socket, "stats"))["players"] < len(players):
+        pass
+    connect_time = time.perf_counter() - started
+
+    broadcast = []
+    answers = []
+
+    async def answer(socket):
+        question = await receive(socket, "question")
+        broadcast.append(time.perf_counter() - sent)
+        answered = time.perf_counter()
+        await socket.send(
+            json.dumps(
+                {"type": "answer", "questionId": question["pk"], "answer": random.randint(1, 4)}
+            )
+        )
+        reply = await receive(socket, "answer")
+        assert reply["status"] == "recorded", reply
+        answers.append(time.perf_counter() - answered)
+
+    for _ in range(questions):
+        sent = time.perf_counter()
+        await host_socket.send(json.dumps({"type": "next"}))
+        await asyncio.gather(*(answer(s) for s in sockets))
+    await host_socket.send(json.dumps({"type": "finish"}))
+    finished = await asyncio.gather(*(receive(s, "finished") for s in sockets))
+    assert all(m["players"] == len(players) for m in finished)
+    for socket in [host_socket, *sockets]:
+        await socket.close()
+    return {
+        "players": len(players),
+        "connect_s": connect_time,
+        "broadcast": summarize(broadcast),
+        "answer": summarize(answers),
+    }
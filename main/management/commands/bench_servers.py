@@ -0,0 +1,183 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+
+from main import models
+from main.bench import create_player_session, print_table, summarize, write_json
+
+QUESTIONS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Play games against running servers with many slow clients and compare "
+        "the latency and throughput, e.g. WSGI and ASGI. The servers must share "
+        "this database, settings and SECRET_KEY:\n"
+        "  gunicorn milgame.wsgi -w 1 --threads 4 -b 127.0.0.1:8001\n"
+        "  MILGAME_ASGI_PORT=8002 python -m milgame.asgi_server\n"
+        "  ./manage.py bench_servers --url wsgi=http://127.0.0.1:8001 "
+        "--url asgi=http://127.0.0.1:8002"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", action="append", required=True, help="name=http://host:port"
+        )
+        parser.add_argument("--clients", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=20, help="Per client")
+        parser.add_argument(
+            "--write-delay",
+            type=float,
+            default=0.2,
+            help="Seconds a client takes to send each request (slow network)",
+        )
+        parser.add_argument("--timeout", type=float, default=60)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        targets = []
+        for value in options["url"]:
+            name, sep, url = value.partition("=")
+            if not sep:
+                raise CommandError(f"Expected name=url, got {value}")
+            targets.append((name, url.rstrip("/")))
+
+        collection = models.Collection.objects.create(name="Benchmark")
+        models.Question.objects.bulk_create(
+            [
+                models.Question(
+                    collection=collection,
+                    order=i,
+                    text=f"Question {i}",
+                    answer1="1",
+                    answer2="2",
+                    answer3="3",
+                    answer4="4",
+                    correct=1 + i % 4,
+                )
+                for i in range(QUESTIONS)
+            ]
+        )
+        prefix = f"bench-{get_random_string(6)}"
+        results = []
+        try:
+            for name, url in targets:
+                cookies = [
+                    create_player_session(f"{prefix}-{name}-{i}") for i in range(options["clients"])
+                ]
+                results.append(
+                    {
+                        "server": name,
+                        "clients": options["clients"],
+                        **asyncio.run(run_clients(url, collection.pk, cookies, options)),
+                    }
+                )
+        finally:
+            models.Player.objects.filter(name__startswith=prefix).delete()
+            collection.delete()
+        print_table(
+            self.stdout,
+            results,
+            ["server", "clients", "n", "errors", "p50_ms", "p95_ms", "p99_ms", "requests_per_second"],
+        )
+        if options["json"]:
+            write_json(options["json"], results)
+
+
+async def run_clients(url, collection_id, cookies, options):
+    timings = []
+    errors = []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            play(url, collection_id, c, options, timings, errors)
+            for c in cookies
+        )
+    )
+    total = time.perf_counter() - started
+    return summarize(
+        timings,
+        errors=len(errors),
+        requests_per_second=len(timings) / total if total else None,
+    )
+
+
+async def play(url, collection_id, cookies, options, timings, errors):
+    """
+    Alternates loading the question and answering it, like the game page
+    """
+    path = f"/api/simple-game/{collection_id}/"
+    question = None
+    for _ in range(options["requests"]):
+        if question:
+            body = json.dumps({"data": {"questionId": question, "answer": 1}})
+            method = "POST"
+        else:
+            body = ""
+            method = "GET"
+        started = time.perf_counter()
+        try:
+            status, data = await asyncio.wait_for(
+                request(url, method, path, body, cookies, options["write_delay"]),
+                options["timeout"],
+            )
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            errors.append(repr(e))
+            question = None
+            continue
+        if status != 200:
+            errors.append(status)
+            question = None
+            continue
+        timings.append(time.perf_counter() - started)
+        question = data.get("pk") if method == "GET" and data.get("template") == "Game" else None
+
+
+async def request(url, method, path, body, cookies, write_delay):
+    """
+    A request on a fresh connection, sent in two halves write_delay apart,
+    returns (status, json data)
+    """
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        body = body.encode()
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            f"Cookie: {cookies['cookie']}\r\n"
+            f"X-CSRFToken: {cookies['csrf_token']}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).encode() + body
+        writer.write(head[: len(head) // 2])
+        await writer.drain()
+        await asyncio.sleep(write_delay)
+        writer.write(head[len(head) // 2 :])
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    header, _, content = response.partition(b"\r\n\r\n")
+    status = int(header.split(b" ", 2)[1])
+    if b"transfer-encoding: chunked" in header.lower():
+        content = unchunk(content)
+    return status, json.loads(content) if status == 200 else None
+
+
+def unchunk(content):
+    result = b""
+    while content:
+        size, _, content = content.partition(b"\r\n")
+        size = int(size, 16)
+        if not size:
+            break
+        result += content[:size]
+        content = content[size + 2 :]
+    return result
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from main import models
+from main.bench import benchmark_database, measure, print_table, write_json
+
+ENGINES = ["db", "cached_db", "cache", "file", "signed_cookies"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare session engines: SQL queries and latency per request "
+        "for the catalogue and game pages of a logged in player"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--engine", nargs="*", choices=ENGINES, default=ENGINES)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database():
+            collection = models.Collection.objects.create(name="Benchmark")
+            for i in range(10):
+                models.Question.objects.create(
+                    collection=collection,
+                    order=i,
+                    text=f"Question {i}",
+                    answer1="1",
+                    answer2="2",
+                    answer3="3",
+                    answer4="4",
+                    correct=1,
+                )
+            player = models.Player.objects.create(name="bench", password="bench")
+            for engine in options["engine"]:
+                with override_settings(
+                    SESSION_ENGINE=f"django.contrib.sessions.backends.{engine}"
+                ):
+                    client = Client()
+                    session = client.session
+                    session["PLAYER_ID"] = player.pk
+                    session.save()
+                    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+                    for name, url in [
+                        ("home", "/api/"),
+                        ("game", f"/api/simple-game/{collection.pk}/"),
+                    ]:
+                        results.append(
+                            {
+                                "engine": engine,
+                                "view": name,
+                                **measure(lambda: client.get(url), options["repeat"]),
+                            }
+                        )
+        print_table(
+            self.stdout, results, ["engine", "view", "queries", "mean_ms", "p95_ms"]
+        )
+        if options["json"]:
+            write_json(options["json"], results)
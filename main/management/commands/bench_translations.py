@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import translation
+from django.utils.translation import trans_real
+
+from main import views
+from main.bench import print_table, summarize, write_json
+from main.responses import dumps
+
+
+def build_lazy():
+    """
+    The translated parts of the welcome page and its POST responses,
+    resolved on every call, as before the memoisation
+    """
+    return {
+        "fields": views.get_welcome_fields.__wrapped__(),
+        "notifications": views.get_welcome_notifications.__wrapped__(),
+    }
+
+
+def build_memoised():
+    return {
+        "fields": views.get_welcome_fields(),
+        "notifications": views.get_welcome_notifications(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the loading of the translation catalogues and the building and "
+        "encoding of the translated welcome payloads, lazily resolved or "
+        "memoised per language, in every language of LANGUAGES"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=10000)
+        parser.add_argument("--json", help="Write the results to this file")
+
+    def handle(self, *args, **options):
+        results = []
+        for language, _ in settings.LANGUAGES:
+            # As the first request in the language does
+            trans_real._translations.pop(language, None)
+            started = time.perf_counter()
+            trans_real.translation(language)
+            results.append(
+                {
+                    "language": language,
+                    "payload": "catalogue load",
+                    **summarize([time.perf_counter() - started]),
+                }
+            )
+            with translation.override(language):
+                for name, build in (("lazy", build_lazy), ("memoised", build_memoised)):
+                    build()
+                    timings = []
+                    for _ in range(options["repeat"]):
+                        started = time.perf_counter()
+                        dumps(build())
+                        timings.append(time.perf_counter() - started)
+                    results.append(
+                        {
+                            "language": language,
+                            "payload": name,
+                            **summarize(timings),
+                            "sample": str(build()["notifications"]["logged_in"]["text"]),
+                        }
+                    )
+        print_table(
+            self.stdout,
+            results,
+            ["language", "payload", "mean_ms", "p95_ms", "p99_ms", "sample"],
+        )
+        if options["json"]:
+            write_json(options["json"], results)
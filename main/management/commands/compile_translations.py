@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.i18n import compile_catalogues
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the .po catalogues of LOCALE_PATHS into .mo files, like "
+        "compilemessages but without GNU gettext. Run it after editing a .po "
+        "and commit the .mo"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true", help="Also compile the up to date ones"
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail if a .mo is stale, without writing it (for the build)",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            stale = compile_catalogues(dry_run=True)
+            if stale:
+                raise CommandError(f"Stale catalogues: {', '.join(stale)}")
+            return
+        for path in compile_catalogues(force=options["force"]):
+            self.stdout.write(f"Compiled {path}")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from main import models
+from main.game_state import AnswersNotCounted, pack_game, unpack_game
+from main.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert games between the row-based answer log (QuestionAnswer) "
+        "and the packed bitmaps stored on Game"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=["packed", "rows"], required=True)
+        parser.add_argument("--game", type=int, nargs="*", help="Game ids (default: all)")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        target = options["to"]
+        if target == "packed":
+            # Rows are gone after packing: count them in the statistics first
+            refresh_stats()
+        convert = pack_game if target == "packed" else unpack_game
+        games = models.Game.objects.exclude(answer_storage=target).order_by("pk")
+        if options["game"]:
+            games = games.filter(pk__in=options["game"])
+        converted = skipped = 0
+        last_pk = 0
+        while True:
+            chunk = list(games.filter(pk__gt=last_pk).only("pk")[: options["chunk_size"]])
+            if not chunk:
+                break
+            for game in chunk:
+                try:
+                    convert(game)
+                except AnswersNotCounted:
+                    # Answers within STATS_REFRESH_LAG: packed on a later run
+                    skipped += 1
+                else:
+                    converted += 1
+            last_pk = chunk[-1].pk
+            self.stdout.write(f"{converted} game(s) converted")
+        self.stdout.write(f"Done: {converted} game(s) now use {target} answers")
+        if skipped:
+            self.stdout.write(
+                f"{skipped} game(s) skipped: answers not counted in the statistics yet"
+            )
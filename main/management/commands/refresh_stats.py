@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from main.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new QuestionAnswer rows into the per-question and per-collection "
+        "statistics. Meant to be run periodically (e.g. from cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        processed = refresh_stats(chunk_size=options["chunk_size"])
+        self.stdout.write(f"Counted {processed} answer(s)")
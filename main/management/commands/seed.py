@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.bench import load_fixture, make_game_fixture
+
+
+class Command(BaseCommand):
+    help = (
+        "Create players, collections and questions for benchmarks, or write "
+        "them as a fixture in the shape of user.json (--output, for loaddata). "
+        "The same --random-seed gives the same data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--players", type=int, default=100)
+        parser.add_argument("--collections", type=int, default=10)
+        parser.add_argument("--questions", type=int, default=20, help="Per collection")
+        parser.add_argument("--password", default="secret", help="Of every player")
+        parser.add_argument("--random-seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the fixture to this file instead")
+
+    def handle(self, *args, **options):
+        objects = make_game_fixture(
+            options["players"],
+            options["collections"],
+            options["questions"],
+            seed=options["random_seed"],
+            password=options["password"],
+        )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(objects, f, indent=2)
+            self.stdout.write(f"Wrote {len(objects)} objects to {options['output']}")
+            return
+        with transaction.atomic():
+            counts = load_fixture(objects)
+        for label, count in counts.items():
+            self.stdout.write(f"Created {count} {label}")
@@ -0,0 +1,86 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+
+def compress(content, encoding):
+    if encoding == "br":
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def parse_accept_encoding(accept_encoding):
+    """
+    {coding: q}, a malformed q-value counting as 0
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    return qualities
+
+
+def choose_encoding(accept_encoding):
+    """
+    The accepted (q > 0) coding with the highest q-value, brotli winning ties
+    """
+    qualities = parse_accept_encoding(accept_encoding)
+    default = qualities.get("*", 0.0)
+    encoding, best = None, 0.0
+    for coding in ("br", "gzip") if brotli else ("gzip",):
+        q = qualities.get(coding, default)
+        if q > best:
+            encoding, best = coding, q
+    return encoding
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses the (non streaming) JSON and text responses bigger than
+    COMPRESSION_MIN_SIZE with brotli (when installed and accepted) or gzip
+    """
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < settings.COMPRESSION_MIN_SIZE
+            or not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if not encoding:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        # The representation changed, as in django.middleware.gzip
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
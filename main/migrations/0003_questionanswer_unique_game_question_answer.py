@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_answers(apps, schema_editor):
+    QuestionAnswer = apps.get_model("main", "QuestionAnswer")
+    first_ids = (
+        QuestionAnswer.objects.values("game_id", "question_id")
+        .annotate(first_id=Min("id"))
+        .values_list("first_id", flat=True)
+    )
+    QuestionAnswer.objects.exclude(id__in=list(first_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_question_audio_file_question_photo_file_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_answers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='questionanswer',
+            constraint=models.UniqueConstraint(fields=('game', 'question'), name='unique_game_question_answer'),
+        ),
+    ]
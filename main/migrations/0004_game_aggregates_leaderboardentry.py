@@ -0,0 +1,91 @@
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+import django.db.models.deletion
+
+
+def backfill_game_aggregates(apps, schema_editor):
+    Game = apps.get_model("main", "Game")
+    Question = apps.get_model("main", "Question")
+    LeaderboardEntry = apps.get_model("main", "LeaderboardEntry")
+    totals = dict(
+        Question.objects.values("collection_id")
+        .annotate(total=Count("id"))
+        .values_list("collection_id", "total")
+    )
+    games = Game.objects.annotate(
+        the_answered_count=Count("questionanswer"),
+        the_score=Count("questionanswer", filter=Q(questionanswer__correct=True)),
+        last_answer_datetime=Max("questionanswer__created_datetime"),
+    ).order_by("pk")
+    best = {}
+    for game in games:
+        game.answered_count = game.the_answered_count
+        game.score = game.the_score
+        if game.answered_count and game.answered_count >= totals.get(game.collection_id, 0):
+            game.completed_datetime = game.last_answer_datetime
+        game.save(update_fields=["answered_count", "score", "completed_datetime"])
+        if game.completed_datetime:
+            duration = game.completed_datetime - game.created_datetime
+            key = (game.collection_id, game.player_id)
+            current = best.get(key)
+            if not current or (game.score, -duration) > (current[0].score, -current[1]):
+                best[key] = (game, duration)
+    LeaderboardEntry.objects.bulk_create(
+        [
+            LeaderboardEntry(
+                collection_id=game.collection_id,
+                player_id=game.player_id,
+                game=game,
+                score=game.score,
+                duration=duration,
+            )
+            for game, duration in best.values()
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_questionanswer_unique_game_question_answer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='answered_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='completed_datetime',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='score',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_datetime', models.DateTimeField(auto_now_add=True)),
+                ('modified_datetime', models.DateTimeField(auto_now=True)),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('duration', models.DurationField()),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.collection')),
+                ('game', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.player')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['collection', '-score', 'duration'], name='leaderboard_rank'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('collection', 'player'), name='unique_leaderboard_player'),
+        ),
+        migrations.RunPython(backfill_game_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_game_aggregates_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionanswer',
+            name='answer',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, '#1'), (2, '#2'), (3, '#3'), (4, '#4')], null=True),
+        ),
+        migrations.CreateModel(
+            name='CollectionStats',
+            fields=[
+                ('collection', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='main.collection')),
+                ('answers_count', models.PositiveIntegerField(default=0)),
+                ('correct_count', models.PositiveIntegerField(default=0)),
+                ('modified_datetime', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='main.question')),
+                ('answers_count', models.PositiveIntegerField(default=0)),
+                ('correct_count', models.PositiveIntegerField(default=0)),
+                ('answer1_count', models.PositiveIntegerField(default=0)),
+                ('answer2_count', models.PositiveIntegerField(default=0)),
+                ('answer3_count', models.PositiveIntegerField(default=0)),
+                ('answer4_count', models.PositiveIntegerField(default=0)),
+                ('modified_datetime', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatsWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('modified_datetime', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
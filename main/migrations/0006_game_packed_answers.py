@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_questionanswer_answer_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='answer_storage',
+            field=models.CharField(choices=[('rows', 'Rows'), ('packed', 'Packed')], default='rows', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='question_ids',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='answered_bits',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='correct_bits',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='answer_bits',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='answer_times',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
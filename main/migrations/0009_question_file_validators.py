@@ -0,0 +1,29 @@
+# Generated by Django 4.1.6 on 2026-10-19 00:19
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_mediablob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='audio_file',
+            field=models.FileField(blank=True, null=True, upload_to='audio_questions/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['mp3', 'wav'])]),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='photo_file',
+            field=models.ImageField(blank=True, null=True, upload_to='photo_questions/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])]),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='video_file',
+            field=models.FileField(blank=True, null=True, upload_to='video_questions/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['mp4', 'avi', 'mov', 'webm'])]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.6 on 2026-10-19 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_question_file_validators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='counted_bits',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='questionanswer',
+            name='counted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
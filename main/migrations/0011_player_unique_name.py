@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def mark_duplicate_names(apps, schema_editor):
+    Player = apps.get_model("main", "Player")
+    first_ids = (
+        Player.objects.values("name")
+        .annotate(first_id=Min("id"))
+        .values_list("first_id", flat=True)
+    )
+    Player.objects.exclude(id__in=list(first_ids)).update(legacy_duplicate=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_game_counted_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='legacy_duplicate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(condition=models.Q(('legacy_duplicate', False)), fields=('name',), name='unique_player_name'),
+        ),
+    ]
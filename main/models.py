@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 import uuid
 from django.core.validators import FileExtensionValidator
+from .storage import release_files
 
 class BaseModel(models.Model):
     created_datetime = models.DateTimeField(auto_now_add=True)
@@ -23,12 +24,24 @@ class Player(BaseModel):
     name = models.CharField(max_length=255, db_index=True)
     password = models.CharField(max_length=255)
     last_login_datetime = models.DateTimeField(blank=True, null=True)
+    # Registered under the name of an older player before names were unique:
+    # still logs in with its own password (see authenticate_player)
+    legacy_duplicate = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name"],
+                condition=models.Q(legacy_duplicate=False),
+                name="unique_player_name",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Question(models.Model):
+class Question(BaseModel):
     QUESTION_TYPE_CHOICES = [
         ('text', _('Text')),
         ('audio', _('Audio')),
@@ -65,6 +78,8 @@ class Question(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])]
     )
 
+    MEDIA_FIELDS = ['audio_file', 'video_file', 'photo_file']
+
     class Meta:
         ordering = ["order"]
 
@@ -72,36 +87,55 @@ class Question(models.Model):
         return f"Question #{self.order} ({self.get_question_type_display()})"
 
     def save(self, *args, **kwargs):
-        old_type = self.__class__.objects.filter(pk=self.pk).values_list('question_type', flat=True).first() if self.pk else None
-
-        if self.photo_file:
-            new_type = 'photo'
-        elif self.video_file:
-            new_type = 'video'
-        elif self.audio_file:
-            new_type = 'audio'
-        elif self.text:
-            new_type = 'text'
-        else:
-            new_type = 'text'
-
-        if old_type and old_type != new_type:
-            if new_type == 'photo':
-                self.audio_file = None
-                self.video_file = None
-            elif new_type == 'video':
-                self.audio_file = None
-                self.photo_file = None
-            elif new_type == 'audio':
-                self.video_file = None
-                self.photo_file = None
-            elif new_type == 'text':
-                self.audio_file = None
-                self.video_file = None
-                self.photo_file = None
-
-        self.question_type = new_type
-        super().save(*args, **kwargs)
+        # The row locked from reading the files it references to releasing them
+        with transaction.atomic():
+            old_type, self._previous_collection_id, *old_files = (
+                self.__class__.objects.select_for_update()
+                .filter(pk=self.pk)
+                .values_list('question_type', 'collection_id', *self.MEDIA_FIELDS)
+                .first() if self.pk else None
+            ) or (None, None, *[None for _ in self.MEDIA_FIELDS])
+
+            if self.photo_file:
+                new_type = 'photo'
+            elif self.video_file:
+                new_type = 'video'
+            elif self.audio_file:
+                new_type = 'audio'
+            elif self.text:
+                new_type = 'text'
+            else:
+                new_type = 'text'
+
+            if old_type and old_type != new_type:
+                if new_type == 'photo':
+                    self.audio_file = None
+                    self.video_file = None
+                elif new_type == 'video':
+                    self.audio_file = None
+                    self.photo_file = None
+                elif new_type == 'audio':
+                    self.video_file = None
+                    self.photo_file = None
+                elif new_type == 'text':
+                    self.audio_file = None
+                    self.video_file = None
+                    self.photo_file = None
+
+            self.question_type = new_type
+            # Saved by the storage with the row, which counts a reference to them
+            uploaded = [
+                field for field in self.MEDIA_FIELDS
+                if getattr(self, field) and not getattr(self, field)._committed
+            ]
+            super().save(*args, **kwargs)
+            # The files cleared above or replaced by new uploads, and the
+            # reference of the previous upload of the same content
+            release_files(self, {
+                field: old_file
+                for field, old_file in zip(self.MEDIA_FIELDS, old_files)
+                if old_file != getattr(self, field).name or field in uploaded
+            })
 
 
 
@@ -109,12 +143,144 @@ class Game(BaseModel):
     collection = models.ForeignKey("Collection", on_delete=models.CASCADE)
     player = models.ForeignKey("Player", on_delete=models.CASCADE)
     finished = models.BooleanField(default=False)
+    # Games played in a live room (main/rooms.py) are created finished,
+    # so that they are never resumed as solo games
+    room = models.ForeignKey("Room", on_delete=models.CASCADE, blank=True, null=True)
+    # Maintained by main.game.record_answers
+    answered_count = models.PositiveIntegerField(default=0)
+    score = models.PositiveIntegerField(default=0)
+    completed_datetime = models.DateTimeField(blank=True, null=True)
+    # Where the answers live, see main/game_state.py
+    answer_storage = models.CharField(max_length=10, choices=[("rows", "Rows"), ("packed", "Packed")], default="rows")
+    question_ids = models.BinaryField(blank=True, null=True)
+    answered_bits = models.BinaryField(blank=True, null=True)
+    correct_bits = models.BinaryField(blank=True, null=True)
+    answer_bits = models.BinaryField(blank=True, null=True)
+    answer_times = models.BinaryField(blank=True, null=True)
+    # The packed answers already counted in the statistics (see pack_game
+    # and main.stats.refresh_packed_stats)
+    counted_bits = models.BinaryField(blank=True, null=True)
 
     def __str__(self):
         return self.collection.name
 
+    @property
+    def duration(self):
+        if self.completed_datetime:
+            return self.completed_datetime - self.created_datetime
+
+
+class Room(BaseModel):
+    """
+    A live game: the host moves every player to the next question,
+    see main/rooms.py
+    """
+    code = models.CharField(max_length=16, unique=True)
+    collection = models.ForeignKey("Collection", on_delete=models.CASCADE)
+    host = models.ForeignKey("Player", on_delete=models.CASCADE, related_name="hosted_rooms")
+    # Index of the current question in the collection, -1 before the start
+    question_index = models.IntegerField(default=-1)
+    finished_datetime = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return self.code
+
+
+class LeaderboardEntry(BaseModel):
+    """
+    Best completed game of a player in a collection
+    """
+    collection = models.ForeignKey("Collection", on_delete=models.CASCADE)
+    player = models.ForeignKey("Player", on_delete=models.CASCADE)
+    game = models.ForeignKey("Game", on_delete=models.SET_NULL, blank=True, null=True)
+    score = models.PositiveIntegerField(default=0)
+    duration = models.DurationField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["collection", "player"], name="unique_leaderboard_player"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["collection", "-score", "duration"], name="leaderboard_rank"
+            ),
+        ]
+
+    def is_beaten_by(self, score, duration):
+        return score > self.score or (score == self.score and duration < self.duration)
+
 
 class QuestionAnswer(BaseModel):
     game = models.ForeignKey("Game", on_delete=models.CASCADE)
     question = models.ForeignKey("Question", on_delete=models.CASCADE)
-    correct = models.BooleanField(default=False)
\ No newline at end of file
+    answer = models.PositiveSmallIntegerField(choices=[(i + 1, f"#{i + 1}") for i in range(4)], blank=True, null=True)
+    correct = models.BooleanField(default=False)
+    # Restored by unpack_game after it was counted in the statistics, under
+    # an id above the watermark: refresh_stats skips it
+    counted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["game", "question"], name="unique_game_question_answer"
+            ),
+        ]
+
+
+# Statistics (refreshed by main.stats.refresh_stats)
+
+class QuestionStats(models.Model):
+    question = models.OneToOneField("Question", on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    answers_count = models.PositiveIntegerField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    answer1_count = models.PositiveIntegerField(default=0)
+    answer2_count = models.PositiveIntegerField(default=0)
+    answer3_count = models.PositiveIntegerField(default=0)
+    answer4_count = models.PositiveIntegerField(default=0)
+    modified_datetime = models.DateTimeField(auto_now=True)
+
+    @property
+    def correct_rate(self):
+        if self.answers_count:
+            return self.correct_count / self.answers_count
+
+
+class CollectionStats(models.Model):
+    collection = models.OneToOneField("Collection", on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    answers_count = models.PositiveIntegerField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    modified_datetime = models.DateTimeField(auto_now=True)
+
+    @property
+    def correct_rate(self):
+        if self.answers_count:
+            return self.correct_count / self.answers_count
+
+
+class StatsWatermark(models.Model):
+    """
+    Highest QuestionAnswer.id already counted in the statistics
+    """
+    name = models.CharField(max_length=255, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    modified_datetime = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+
+class MediaBlob(BaseModel):
+    """
+    A file of main.storage.ContentAddressedStorage: `name` is derived
+    from the sha256 of the content, `refcount` is the number of saved
+    uploads of it that are still referenced
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from . import models
+from .ratelimit import TokenBucket
+
+login_rate_limiter = TokenBucket(**settings.PLAYER_LOGIN_RATE_LIMIT)
+
+
+def hash_player_password(password):
+    return make_password(password, hasher=settings.PLAYER_PASSWORD_HASHER)
+
+
+def check_player_password(player, password):
+    """
+    Also upgrades plaintext passwords stored before hashing was introduced
+    and hashes made with other settings
+    """
+
+    def setter(raw_password):
+        player.password = hash_player_password(raw_password)
+        player.save(update_fields=["password", "modified_datetime"])
+
+    try:
+        identify_hasher(player.password)
+    except ValueError:
+        if not constant_time_compare(player.password, password):
+            return False
+        setter(password)
+        return True
+    return check_password(
+        password, player.password, setter, preferred=settings.PLAYER_PASSWORD_HASHER
+    )
+
+
+def authenticate_player(name, password):
+    """
+    Returns (player, created): an unknown name registers a new player,
+    a wrong password gives (None, False)
+    """
+    candidates = list(models.Player.objects.filter(name=name).order_by("pk"))
+    if not candidates:
+        try:
+            with transaction.atomic():
+                player = models.Player.objects.create(
+                    name=name,
+                    password=hash_player_password(password),
+                    last_login_datetime=timezone.now(),
+                )
+            return player, True
+        except IntegrityError:
+            # Registered concurrently (unique_player_name): a login then
+            candidates = list(models.Player.objects.filter(name=name).order_by("pk"))
+    for player in candidates:
+        if check_player_password(player, password):
+            player.last_login_datetime = timezone.now()
+            player.save(update_fields=["last_login_datetime"])
+            return player, False
+    return None, False
+
+
+def get_client_ip(request):
+    """
+    REMOTE_ADDR, or behind TRUSTED_PROXY_COUNT proxies the address the
+    outermost one saw: the X-Forwarded-For hops before it come from the
+    client, who can send anything there
+    """
+    count = settings.TRUSTED_PROXY_COUNT
+    if count:
+        hops = [
+            hop.strip()
+            for hop in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+            if hop.strip()
+        ]
+        if len(hops) >= count:
+            return hops[-count]
+    return request.META.get("REMOTE_ADDR")
+
+
+def login_allowed(request, name):
+    ip = get_client_ip(request)
+    # Both buckets are consumed: one limits a client, the other a client
+    # guessing a name's password (without letting anyone else lock it out)
+    by_ip = login_rate_limiter.consume(f"ip:{ip}")
+    by_ip_and_name = login_rate_limiter.consume(f"ip-name:{ip}:{name}")
+    return by_ip and by_ip_and_name
@@ -0,0 +1,38 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    In-memory token buckets, one per key: each holds up to `capacity` tokens
+    and gets `rate` tokens per second back
+    """
+
+    def __init__(self, capacity, rate, max_keys=100000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def consume(self, key, tokens=1):
+        now = time.monotonic()
+        with self.lock:
+            available, updated = self.buckets.get(key, (self.capacity, now))
+            available = min(self.capacity, available + (now - updated) * self.rate)
+            allowed = available >= tokens
+            if allowed:
+                available -= tokens
+            self.buckets[key] = (available, now)
+            if len(self.buckets) > self.max_keys:
+                self.prune(now)
+        return allowed
+
+    def prune(self, now):
+        # Buckets that are full again are the same as no bucket at all
+        full_after = self.capacity / self.rate if self.rate else float("inf")
+        self.buckets = {
+            key: value
+            for key, value in self.buckets.items()
+            if now - value[1] < full_after
+        }
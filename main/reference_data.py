@@ -0,0 +1,92 @@
+"""
+Reference data of the framework's definitions: the option lists of the
+select fields and the level descriptions of the LevelForeignKeyFields.
+
+get_rows() runs a queryset once and keeps its rows, keyed by its SQL (so
+a filter_expr, label_expr... gives entries of its own), for all the
+field_from_field() calls that follow. The entries are dropped when a model
+whose table the query reads is saved or deleted: get_rows() connects
+invalidate() to the signals of these models only, the first time it reads
+their table, so that the other saves don't take the lock. The entries
+expire after REFERENCE_DATA_TIMEOUT seconds anyway: QuerySet.update(),
+bulk_create() and the other processes don't send the signals.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+_rows = {}
+# Incremented when entries are dropped, for what is built from the rows
+# (the filter plans of main/framework.py)
+version = 0
+_keys_by_table = defaultdict(set)
+_lock = threading.Lock()
+_connected_tables = set()
+
+
+def connect(table):
+    """
+    Connects invalidate() to the signals of the models of table (several
+    with proxy models, the through model of a ManyToManyField sends
+    m2m_changed)
+    """
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.db_table == table:
+            uid = f"reference_data_{model._meta.label_lower}"
+            post_save.connect(invalidate, sender=model, dispatch_uid=f"{uid}_saved")
+            post_delete.connect(invalidate, sender=model, dispatch_uid=f"{uid}_deleted")
+            m2m_changed.connect(invalidate, sender=model, dispatch_uid=f"{uid}_m2m")
+
+
+def get_rows(queryset, *models):
+    """
+    The rows of queryset (a values() one), as a list shared by the callers:
+    it must not be modified. models are the ones it reads besides the
+    queryset's joins (those of a Subquery)
+    """
+    key = (queryset.db, str(queryset.query))
+    entry = _rows.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    tables = {alias.table_name for alias in queryset.query.alias_map.values()}
+    tables |= {model._meta.db_table for model in models}
+    for table in tables - _connected_tables:
+        connect(table)
+        _connected_tables.add(table)
+    # Registered before the query, so that a save during it changes the
+    # version, and the rows it may have missed aren't kept
+    with _lock:
+        for table in tables:
+            _keys_by_table[table].add(key)
+        fetched_version = version
+    rows = list(queryset)
+    with _lock:
+        if version == fetched_version:
+            _rows[key] = (time.monotonic() + settings.REFERENCE_DATA_TIMEOUT, rows)
+    return rows
+
+
+def invalidate(sender, **kwargs):
+    """
+    Receiver of post_save, post_delete and m2m_changed of the models read
+    by get_rows(): drops the entries reading the sender's table
+    """
+    global version
+    with _lock:
+        keys = _keys_by_table.pop(sender._meta.db_table, ())
+        for key in keys:
+            _rows.pop(key, None)
+        if keys:
+            version += 1
+
+
+def clear():
+    global version
+    with _lock:
+        _rows.clear()
+        _keys_by_table.clear()
+        version += 1
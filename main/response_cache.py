@@ -0,0 +1,95 @@
+"""
+Cache of whole API responses, for MainView subclasses that declare
+
+    response_cache_vary = ("player", "language", "version")
+    response_cache_timeout = 60
+
+Each listed dimension is part of the key:
+
+- "player": the logged in player
+- "language": request.LANGUAGE_CODE
+- "version": the view's get_version(), as for the ETag
+
+The cache is settings.CACHES["responses"] (see RESPONSE_CACHE_BACKEND).
+A single request rebuilds a missing response while the others wait for it
+(for at most RESPONSE_CACHE_LOCK_TIMEOUT seconds, or RESPONSE_CACHE_SYNC_WAIT
+for the sync views, which hold a worker while they wait), instead of all
+recomputing it at once.
+"""
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+def get_cache():
+    return caches["responses"]
+
+
+def get_cache_key(view, request, version):
+    parts = [view.__class__.__name__]
+    for dimension in view.response_cache_vary:
+        if dimension == "player":
+            parts.append(view.player.pk if view.player else None)
+        elif dimension == "language":
+            parts.append(request.LANGUAGE_CODE)
+        elif dimension == "version":
+            parts.append(version)
+        else:
+            raise ValueError(f"Unknown response cache dimension: {dimension}")
+    parts.append(request.user.pk)
+    return "main:response:" + hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def get_or_compute(key, compute, timeout):
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = key + ":lock"
+    if not cache.add(lock_key, 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT):
+        deadline = time.monotonic() + min(
+            settings.RESPONSE_CACHE_SYNC_WAIT, settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        )
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        # The request holding the lock is too slow: don't wait any longer
+        return compute()
+    try:
+        value = compute()
+        cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+async def aget_or_compute(key, compute, timeout):
+    """
+    get_or_compute(), compute being a coroutine function
+    """
+    cache = get_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        return value
+    lock_key = key + ":lock"
+    if not await cache.aadd(lock_key, 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT):
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            value = await cache.aget(key)
+            if value is not None:
+                return value
+        return await compute()
+    try:
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    finally:
+        await cache.adelete(lock_key)
+    return value
@@ -0,0 +1,80 @@
+"""
+JSON responses of the API views, encoded with orjson when it's installed
+(the stdlib json otherwise), with the same output as
+logicore_django_react_pages' default_json: lazy translations, dates,
+decimals and the rest as str(), generators as lists
+"""
+import datetime
+import json
+import time
+from decimal import Decimal
+from types import GeneratorType
+
+from django.http import HttpResponse
+from django.utils.functional import Promise
+
+from .instrumentation import record_serialization
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    # Dates as str(), like default_json
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if orjson
+    else 0
+)
+
+
+def default_json(x):
+    if isinstance(x, GeneratorType):
+        return list(x)
+    if isinstance(x, (Promise, datetime.date, datetime.time, Decimal)):
+        return str(x)
+    try:
+        return str(x)
+    except Exception:
+        return repr(x)
+
+
+def dumps(data):
+    """
+    bytes (the time it takes is recorded by main/instrumentation.py)
+    """
+    started = time.perf_counter()
+    content = encode(data)
+    record_serialization(time.perf_counter() - started)
+    return content
+
+
+def encode(data):
+    if orjson:
+        try:
+            return orjson.dumps(data, default=default_json, option=ORJSON_OPTIONS)
+        except (TypeError, orjson.JSONEncodeError):
+            # e.g. integers beyond 64 bits, which json handles
+            pass
+    return dumps_stdlib(data)
+
+
+def dumps_stdlib(data):
+    """
+    The bytes of orjson, but for the form of exponents ("1e+16" for "1e16")
+    and NaN: UTF-8, lone surrogates escaped
+    """
+    return json.dumps(
+        data, default=default_json, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8", "backslashreplace")
+
+
+class JsonResponse(HttpResponse):
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,467 @@
+"""
+Live rooms: the host moves hundreds of players through the questions of a
+collection together, over WebSockets (/ws/rooms/<code>/, served by
+milgame/asgi.py).
+
+Every socket subscribes to the room channel (broadcasts: questions,
+results, the final scores) and to a channel of its own (replies).
+Players' answers and the host's commands go to the control channel,
+read by the RoomRunner of the room, which lives in the worker where the
+host is connected. The runner checks and counts the answers in memory
+and writes them to QuestionAnswer (and the counters of the players'
+Game rows) in batches: a batch that fails to be written is kept for the
+next one.
+
+The runner lasts as long as the room: it stops when the room finishes,
+which the host does with "finish", or the runner does itself when the
+host has been gone for ROOM_HOST_TIMEOUT seconds. Players who joined
+before it started are loaded from their Game rows.
+
+Messages, as JSON:
+
+- from a player: {"type": "answer", "questionId": 11, "answer": 2}
+- from the host: {"type": "next"} (starts the room, reveals the current
+  question and shows the next one) and {"type": "finish"}
+- to the sockets: "question", "answer" (the status of an answer), "results",
+  "stats" (host only) and "finished"
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import parse_cookie
+from django.utils import timezone
+
+from . import models
+from .broker import get_broker
+from .game import get_question_data
+
+logger = logging.getLogger("main.rooms")
+
+ROOM_PATH = re.compile(r"^/ws/rooms/(?P<code>[A-Za-z0-9]+)/$")
+
+# Runners of the rooms hosted in this process, by code
+runners = {}
+
+
+def room_channel(code):
+    return f"room:{code}"
+
+
+def control_channel(code):
+    return f"room:{code}:control"
+
+
+def player_channel(code, player_id):
+    return f"room:{code}:player:{player_id}"
+
+
+def publish(channel, data):
+    get_broker().publish(channel, json.dumps(data))
+
+
+class RoomRunner:
+    def __init__(self, room):
+        self.room = room
+        self.code = room.code
+        self.finished = False
+        self.task = None
+        self.subscription = None
+        # Sockets of the host, and since when it has none
+        self.host_connections = 0
+        self.host_left_at = time.monotonic()
+        # Loaded by load()
+        self.questions = []
+        self.games = {}  # {player_id: game_id}
+        self.names = {}
+        self.scores = {}
+        self.answered_counts = {}
+        self.current_answers = {}  # {player_id: answer}, current question
+        self.revealed = False
+        # Answers and games not written yet
+        self.pending = []
+        self.dirty_games = set()
+
+    def load(self):
+        self.questions = list(self.room.collection.question_set.order_by("order"))
+        for game in models.Game.objects.filter(room=self.room).select_related("player"):
+            self.games[game.player_id] = game.pk
+            self.names[game.player_id] = game.player.name
+            self.scores[game.player_id] = game.score
+            self.answered_counts[game.player_id] = game.answered_count
+        question = self.question
+        if question:
+            self.current_answers = dict(
+                models.QuestionAnswer.objects.filter(
+                    game__room=self.room, question=question
+                ).values_list("game__player_id", "answer")
+            )
+
+    @property
+    def question(self):
+        if 0 <= self.room.question_index < len(self.questions):
+            return self.questions[self.room.question_index]
+
+    def question_message(self):
+        return {
+            "type": "question",
+            "index": self.room.question_index + 1,
+            "total": len(self.questions),
+            **get_question_data(self.question),
+        }
+
+    def get_timeout(self):
+        timeouts = []
+        if self.pending:
+            timeouts.append(settings.ROOM_FLUSH_INTERVAL)
+        if not self.host_connections:
+            host_deadline = self.host_left_at + settings.ROOM_HOST_TIMEOUT
+            timeouts.append(max(host_deadline - time.monotonic(), 0))
+        return min(timeouts, default=None)
+
+    async def run(self):
+        # Messages sent while the room is loaded are queued in the
+        # subscription (made by get_runner)
+        try:
+            await sync_to_async(self.load)()
+            while not self.finished:
+                try:
+                    message = await asyncio.wait_for(
+                        self.subscription.get(), self.get_timeout()
+                    )
+                except asyncio.TimeoutError:
+                    message = None
+                try:
+                    if message is None:
+                        await self.handle_timeout()
+                    else:
+                        await self.handle(json.loads(message))
+                except Exception:
+                    # The room goes on with the next message
+                    logger.exception("Room %s failed to handle %s", self.code, message)
+        finally:
+            self.subscription.close()
+            runners.pop(self.code, None)
+
+    async def handle_timeout(self):
+        if self.host_connections or (
+            time.monotonic() - self.host_left_at < settings.ROOM_HOST_TIMEOUT
+        ):
+            await self.flush()
+            return
+        logger.info("Room %s: the host is gone, finishing", self.code)
+        # If it fails, tried again after a flush interval
+        self.host_left_at = (
+            time.monotonic() - settings.ROOM_HOST_TIMEOUT + settings.ROOM_FLUSH_INTERVAL
+        )
+        await self.finish()
+
+    async def handle(self, message):
+        handler = getattr(self, f"handle_{message.get('type')}", None)
+        if handler:
+            await handler(message)
+
+    async def handle_host_connected(self, message):
+        self.host_connections += 1
+
+    async def handle_host_disconnected(self, message):
+        self.host_connections -= 1
+        if not self.host_connections:
+            self.host_left_at = time.monotonic()
+
+    async def handle_join(self, message):
+        player_id = message["playerId"]
+        self.games[player_id] = message["gameId"]
+        self.names[player_id] = message["name"]
+        self.scores.setdefault(player_id, 0)
+        self.answered_counts.setdefault(player_id, 0)
+        if self.question and not self.revealed:
+            publish(player_channel(self.code, player_id), self.question_message())
+        self.publish_stats()
+
+    async def handle_answer(self, message):
+        player_id = message["playerId"]
+        answer = message.get("answer")
+        question = self.question
+        reply = {"type": "answer", "questionId": message.get("questionId")}
+        if (
+            not question
+            or self.revealed
+            or message.get("questionId") != question.pk
+            or player_id not in self.games
+            # As record_answers: 2.0 and True aren't answers
+            or type(answer) is not int
+            or not 1 <= answer <= 4
+        ):
+            reply["status"] = "invalid"
+        elif player_id in self.current_answers:
+            reply["status"] = "duplicate"
+        else:
+            correct = answer == question.correct
+            self.current_answers[player_id] = answer
+            self.answered_counts[player_id] += 1
+            self.scores[player_id] += correct
+            self.pending.append((self.games[player_id], question.pk, answer, correct))
+            self.dirty_games.add(player_id)
+            reply["status"] = "recorded"
+        publish(player_channel(self.code, player_id), reply)
+        if len(self.pending) >= settings.ROOM_FLUSH_SIZE:
+            await self.flush()
+
+    async def handle_next(self, message):
+        if message["playerId"] != self.room.host_id:
+            return
+        self.reveal()
+        if self.room.question_index + 1 >= len(self.questions):
+            await self.finish()
+            return
+        await self.flush()
+        self.room.question_index += 1
+        self.current_answers = {}
+        self.revealed = False
+        await sync_to_async(self.room.save)(update_fields=["question_index", "modified_datetime"])
+        publish(room_channel(self.code), self.question_message())
+        self.publish_stats()
+
+    async def handle_finish(self, message):
+        if message["playerId"] == self.room.host_id:
+            await self.finish()
+
+    def reveal(self):
+        question = self.question
+        if not question or self.revealed:
+            return
+        self.revealed = True
+        counts = [0, 0, 0, 0]
+        for answer in self.current_answers.values():
+            counts[answer - 1] += 1
+        publish(
+            room_channel(self.code),
+            {
+                "type": "results",
+                "questionId": question.pk,
+                "correctAnswer": question.correct,
+                "counts": counts,
+            },
+        )
+
+    def publish_stats(self):
+        publish(
+            player_channel(self.code, self.room.host_id),
+            {
+                "type": "stats",
+                "players": len(self.games),
+                "answers": len(self.current_answers),
+            },
+        )
+
+    def scoreboard(self):
+        return [
+            {"player_id": player_id, "player_name": self.names[player_id], "score": score}
+            for player_id, score in sorted(
+                self.scores.items(), key=lambda item: (-item[1], self.names[item[0]])
+            )
+        ]
+
+    async def finish(self):
+        self.reveal()
+        now = timezone.now()
+        if not await self.flush(completed_datetime=now):
+            # Still running: "finish" or the host timeout tries again
+            return
+        self.room.finished_datetime = now
+        await sync_to_async(self.room.save)(update_fields=["finished_datetime", "modified_datetime"])
+        self.finished = True
+        publish(
+            room_channel(self.code),
+            {
+                "type": "finished",
+                "scores": self.scoreboard()[: settings.LEADERBOARD_SIZE],
+                "players": len(self.games),
+            },
+        )
+
+    async def flush(self, completed_datetime=None):
+        """
+        Writes the pending answers and counters. Returns False when that
+        failed: they stay pending
+        """
+        # The host sees the answers coming at the pace of the writes
+        if self.pending:
+            self.publish_stats()
+        answers, self.pending = self.pending, []
+        dirty_games, self.dirty_games = self.dirty_games, set()
+        player_ids = set(self.games) if completed_datetime else dirty_games
+        games = [
+            models.Game(
+                pk=self.games[player_id],
+                answered_count=self.answered_counts[player_id],
+                score=self.scores[player_id],
+                completed_datetime=completed_datetime,
+            )
+            for player_id in player_ids
+        ]
+        if answers or games:
+            try:
+                await sync_to_async(write_answers)(
+                    answers, games, bool(completed_datetime)
+                )
+            except Exception:
+                logger.exception(
+                    "Room %s failed to write %s answers", self.code, len(answers)
+                )
+                # Before the answers which came meanwhile
+                self.pending[:0] = answers
+                self.dirty_games |= dirty_games
+                return False
+        return True
+
+
+def write_answers(answers, games, completed):
+    """
+    answers: [(game_id, question_id, answer, correct), ...]
+    games: Game instances with the new counters
+    """
+    now = timezone.now()
+    fields = ["answered_count", "score", "modified_datetime"]
+    if completed:
+        fields.append("completed_datetime")
+    for game in games:
+        game.modified_datetime = now
+    with transaction.atomic():
+        models.QuestionAnswer.objects.bulk_create(
+            [
+                models.QuestionAnswer(
+                    game_id=game_id, question_id=question_id, answer=answer, correct=correct
+                )
+                for game_id, question_id, answer, correct in answers
+            ],
+            ignore_conflicts=True,
+            batch_size=settings.ROOM_FLUSH_SIZE,
+        )
+        models.Game.objects.bulk_update(games, fields, batch_size=settings.ROOM_FLUSH_SIZE)
+
+
+def get_runner(room):
+    runner = runners.get(room.code)
+    if not runner:
+        runner = runners[room.code] = RoomRunner(room)
+        # Subscribed before the task starts: nothing published from now on
+        # (e.g. the host's connection) is missed
+        runner.subscription = get_broker().subscribe(control_channel(room.code))
+        runner.task = asyncio.ensure_future(runner.run())
+    return runner
+
+
+def join_room(room, player):
+    game, _ = models.Game.objects.get_or_create(
+        room=room,
+        player=player,
+        defaults={"collection_id": room.collection_id, "finished": True},
+    )
+    return game
+
+
+def get_scope_player(scope):
+    cookies = parse_cookie(get_header(scope, b"cookie"))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    player_id = session.get("PLAYER_ID")
+    if player_id:
+        return models.Player.objects.filter(pk=int(player_id)).first()
+
+
+def get_header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin1")
+    return ""
+
+
+def origin_allowed(scope):
+    """
+    Browsers send the cookies of the site with cross-site WebSockets too
+    """
+    origin = get_header(scope, b"origin")
+    if not origin:
+        return True
+    if origin in settings.CSRF_TRUSTED_ORIGINS:
+        return True
+    return origin.split("://", 1)[-1] == get_header(scope, b"host")
+
+
+async def websocket_application(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    match = ROOM_PATH.match(scope["path"])
+    if not match or not origin_allowed(scope):
+        await send({"type": "websocket.close", "code": 4403})
+        return
+    player = await sync_to_async(get_scope_player)(scope)
+    room = await (
+        models.Room.objects.filter(code=match["code"], finished_datetime__isnull=True)
+        .select_related("collection")
+        .afirst()
+    )
+    if not player or not room:
+        await send({"type": "websocket.close", "code": 4403 if not player else 4404})
+        return
+
+    subscription = get_broker().subscribe(
+        room_channel(room.code),
+        player_channel(room.code, player.pk),
+        maxsize=0 if player.pk == room.host_id else settings.ROOM_SOCKET_QUEUE_SIZE,
+    )
+    await send({"type": "websocket.accept"})
+    is_host = player.pk == room.host_id
+    if is_host:
+        get_runner(room)
+        publish(control_channel(room.code), {"type": "host_connected"})
+    else:
+        game = await sync_to_async(join_room)(room, player)
+        publish(
+            control_channel(room.code),
+            {"type": "join", "playerId": player.pk, "gameId": game.pk, "name": player.name},
+        )
+
+    async def forward():
+        while True:
+            text = await subscription.get()
+            if text is None:
+                # Too slow to keep up, the client may reconnect
+                await send({"type": "websocket.close", "code": 1013})
+                return
+            await send({"type": "websocket.send", "text": text})
+            if json.loads(text).get("type") == "finished":
+                await send({"type": "websocket.close", "code": 1000})
+                return
+
+    sender = asyncio.ensure_future(forward())
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if sender.done():
+                break
+            try:
+                data = json.loads(message.get("text") or "")
+            except ValueError:
+                continue
+            if not isinstance(data, dict) or data.get("type") not in ("answer", "next", "finish"):
+                continue
+            publish(control_channel(room.code), {**data, "playerId": player.pk})
+    finally:
+        sender.cancel()
+        subscription.close()
+        if is_host:
+            publish(control_channel(room.code), {"type": "host_disconnected"})
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import models
+from .game import invalidate_correct_answers
+from .storage import release_files
+
+
+@receiver(post_save, sender=models.Question)
+@receiver(post_delete, sender=models.Question)
+def question_changed(sender, instance, **kwargs):
+    collection_ids = {
+        instance.collection_id, getattr(instance, "_previous_collection_id", None)
+    } - {None}
+    invalidate_correct_answers(*collection_ids)
+    # The collection's modified_datetime versions the pages of its
+    # questions (see MainView.get_version)
+    models.Collection.objects.filter(pk__in=collection_ids).update(
+        modified_datetime=timezone.now()
+    )
+
+
+@receiver(post_delete, sender=models.Question)
+def question_deleted(sender, instance, **kwargs):
+    release_files(
+        instance,
+        {field: getattr(instance, field).name for field in instance.MEDIA_FIELDS},
+    )
@@ -0,0 +1,188 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from . import models
+
+WATERMARK_NAME = "question_answers"
+
+ANSWER_COUNTERS = {
+    "answers_count": Count("id"),
+    "correct_count": Count("id", filter=Q(correct=True)),
+    **{
+        f"answer{i}_count": Count("id", filter=Q(answer=i))
+        for i in range(1, 5)
+    },
+}
+
+
+def add_counters(model, key, rows, counters):
+    """
+    Adds the aggregated `rows` ({pk: {counter: n}}) to the stats rows
+    of `model` with one SELECT, one bulk UPDATE and one bulk INSERT
+    """
+    existing = model.objects.in_bulk(list(rows.keys()))
+    created = []
+    for pk, values in rows.items():
+        stats = existing.get(pk)
+        if not stats:
+            created.append(model(**{key: pk}, **values))
+            continue
+        for counter in counters:
+            setattr(stats, counter, getattr(stats, counter) + values[counter])
+        stats.modified_datetime = values["modified_datetime"]
+    model.objects.bulk_update(existing.values(), [*counters, "modified_datetime"])
+    model.objects.bulk_create(created)
+
+
+def refresh_stats_chunk(last_id, upper_id):
+    answers = models.QuestionAnswer.objects.filter(
+        id__gt=last_id, id__lte=upper_id, counted=False
+    )
+    question_rows = {
+        row.pop("question_id"): row
+        for row in answers.values("question_id").annotate(**ANSWER_COUNTERS).order_by()
+    }
+    collection_rows = {
+        row.pop("collection_id"): row
+        for row in answers.filter(question__collection__isnull=False)
+        .values(collection_id=F("question__collection_id"))
+        .annotate(
+            answers_count=ANSWER_COUNTERS["answers_count"],
+            correct_count=ANSWER_COUNTERS["correct_count"],
+        )
+        .order_by()
+    }
+    now = timezone.now()
+    for rows in [question_rows, collection_rows]:
+        for row in rows.values():
+            row["modified_datetime"] = now
+    add_counters(models.QuestionStats, "question_id", question_rows, ANSWER_COUNTERS)
+    add_counters(
+        models.CollectionStats,
+        "collection_id",
+        collection_rows,
+        ["answers_count", "correct_count"],
+    )
+    return sum(row["answers_count"] for row in question_rows.values())
+
+
+def refresh_packed_stats(chunk_size):
+    """
+    Folds the answers recorded into packed games (GAME_ANSWER_STORAGE
+    "packed", no QuestionAnswer rows) into the statistics: the games whose
+    answered_bits differ from their counted_bits, chunk by chunk, each
+    chunk setting the counted bits of the answers it counts in the same
+    transaction. The Game rows are locked, so no lag is needed.
+    Returns the number of answers counted
+    """
+    from .game_state import PackedGameState, get_answer, get_bit, set_bit
+
+    processed = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            games = list(
+                models.Game.objects.select_for_update()
+                .filter(
+                    pk__gt=last_pk, answer_storage="packed", answered_bits__isnull=False
+                )
+                .exclude(answered_bits=F("counted_bits"))
+                .order_by("pk")[:chunk_size]
+            )
+            if not games:
+                break
+            last_pk = games[-1].pk
+            answers = []
+            for game in games:
+                state = PackedGameState(game)
+                for i, question_id in enumerate(state.question_ids):
+                    if get_bit(state.answered_bits, i) and not get_bit(
+                        state.counted_bits, i
+                    ):
+                        answers.append(
+                            (
+                                question_id,
+                                get_answer(state.answer_bits, i),
+                                get_bit(state.correct_bits, i),
+                            )
+                        )
+                        set_bit(state.counted_bits, i)
+                game.counted_bits = bytes(state.counted_bits)
+            collection_ids = dict(
+                models.Question.objects.filter(
+                    pk__in={question_id for question_id, _, _ in answers}
+                ).values_list("pk", "collection_id")
+            )
+            now = timezone.now()
+            question_rows = {}
+            collection_rows = {}
+            for question_id, answer, correct in answers:
+                # Deleted since, as their QuestionAnswer rows would be
+                if question_id not in collection_ids:
+                    continue
+                row = question_rows.setdefault(
+                    question_id,
+                    {**{k: 0 for k in ANSWER_COUNTERS}, "modified_datetime": now},
+                )
+                row["answers_count"] += 1
+                row["correct_count"] += correct
+                if answer:
+                    row[f"answer{answer}_count"] += 1
+                collection_id = collection_ids[question_id]
+                if collection_id:
+                    row = collection_rows.setdefault(
+                        collection_id,
+                        {
+                            "answers_count": 0,
+                            "correct_count": 0,
+                            "modified_datetime": now,
+                        },
+                    )
+                    row["answers_count"] += 1
+                    row["correct_count"] += correct
+            add_counters(
+                models.QuestionStats, "question_id", question_rows, ANSWER_COUNTERS
+            )
+            add_counters(
+                models.CollectionStats,
+                "collection_id",
+                collection_rows,
+                ["answers_count", "correct_count"],
+            )
+            models.Game.objects.bulk_update(games, ["counted_bits"])
+            processed += sum(row["answers_count"] for row in question_rows.values())
+    return processed
+
+
+def refresh_stats(chunk_size=None):
+    """
+    Folds the answers recorded since the last run into QuestionStats and
+    CollectionStats, chunk by chunk of QuestionAnswer ids. Each chunk moves
+    the watermark in the same transaction, so a run can be interrupted and
+    resumed at any point. Answers younger than STATS_REFRESH_LAG are left
+    for the next run, so that rows of still open transactions aren't skipped.
+    Then the answers of the packed games (refresh_packed_stats).
+    Returns the number of answers counted
+    """
+    chunk_size = chunk_size or settings.STATS_REFRESH_CHUNK_SIZE
+    max_id = models.QuestionAnswer.objects.filter(
+        created_datetime__lt=timezone.now()
+        - timedelta(seconds=settings.STATS_REFRESH_LAG)
+    ).aggregate(max_id=Max("id"))["max_id"]
+    processed = 0
+    while max_id:
+        with transaction.atomic():
+            watermark, _ = models.StatsWatermark.objects.select_for_update().get_or_create(
+                name=WATERMARK_NAME
+            )
+            if watermark.last_id >= max_id:
+                break
+            upper_id = min(watermark.last_id + chunk_size, max_id)
+            processed += refresh_stats_chunk(watermark.last_id, upper_id)
+            watermark.last_id = upper_id
+            watermark.save()
+    return processed + refresh_packed_stats(chunk_size)
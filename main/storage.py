@@ -0,0 +1,104 @@
+"""
+ContentAddressedStorage (DEFAULT_FILE_STORAGE): media files stored by the
+sha256 of their content, as "<upload_to>/<2 hex>/<sha256><ext>", with a
+reference count in main.models.MediaBlob.
+
+Saving content that is already stored is a single UPDATE of the count, no
+file is written. The count is taken in the transaction of the model saving
+the file, so a rolled back save doesn't keep it. release() is called once
+that transaction is committed for the files a Question stops referencing
+(a type change clears them, a new upload replaces them, the question is
+deleted): a blob which isn't referenced anymore is deleted.
+
+The MediaBlob row, locked by the UPDATE of save() or release() until
+their transaction ends, serialises them: release() deletes the file
+before unlocking it, and save() writes the file whenever it's missing.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def get_sha256(content):
+    """
+    The hex digest of a File, as main/uploads.py computed it while
+    receiving it, or by reading it
+    """
+    sha256 = getattr(content, "sha256", None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_blob_name(self, name, sha256):
+        dirname, filename = posixpath.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        return posixpath.join(dirname, sha256[:2], sha256 + ext)
+
+    def save(self, name, content, max_length=None):
+        from .models import MediaBlob
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        sha256 = get_sha256(content)
+        blob_name = self.get_blob_name(name, sha256)
+        with transaction.atomic():
+            while not MediaBlob.objects.filter(name=blob_name).update(
+                refcount=F("refcount") + 1
+            ):
+                try:
+                    with transaction.atomic():
+                        MediaBlob.objects.create(
+                            name=blob_name, sha256=sha256, size=content.size, refcount=1
+                        )
+                    break
+                except IntegrityError:
+                    # Created meanwhile by a concurrent upload of the same content
+                    pass
+            # Even with a row: a rolled back release() may have deleted it
+            if not self.exists(blob_name):
+                saved_name = self._save(blob_name, content)
+                if saved_name != blob_name:
+                    # Stored meanwhile by a concurrent upload of the same content
+                    self.delete(saved_name)
+        return blob_name
+
+    def release(self, name):
+        """
+        One reference less to the file `name`, deleted when it was the last
+        one. Files stored before this storage (without a MediaBlob) are left
+        as they are.
+        """
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            MediaBlob.objects.filter(name=name, refcount__gt=0).update(
+                refcount=F("refcount") - 1
+            )
+            deleted, _ = MediaBlob.objects.filter(name=name, refcount=0).delete()
+            # Before the row is unlocked: a concurrent save() of the same
+            # content waits, then finds the file missing and writes it again
+            if deleted:
+                self.delete(name)
+
+
+def release_files(instance, names):
+    """
+    Releases the files {field name: file name} that `instance` referenced,
+    once the transaction is committed
+    """
+    for field_name, name in names.items():
+        storage = instance._meta.get_field(field_name).storage
+        if name and hasattr(storage, "release"):
+            transaction.on_commit(lambda storage=storage, name=name: storage.release(name))
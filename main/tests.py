@@ -1,3 +1,2356 @@
-from django.test import TestCase
+import asyncio
+import base64
+import binascii
+import copy
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ImproperlyConfigured, RequestDataTooBig
+from django.db import IntegrityError, connection
+from django.db.models import Q, QuerySet
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse, QueryDict
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import isolate_apps
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from . import (
+    archive,
+    async_views,
+    events,
+    framework,
+    game_state,
+    i18n,
+    instrumentation,
+    middleware,
+    models,
+    reference_data,
+    response_cache,
+    responses,
+    rooms,
+    stats,
+    tracing,
+    views,
+)
+from .bench import make_definition, make_node_definition, make_node_models
+from .broker import get_broker
+from .cache_backends import LocalRedisCache
+from .framework import (
+    UnindexedFilterWarning,
+    apply_fields_included_and_required,
+    compile_filter_field,
+    compile_validator,
+    read_field,
+    read_filter_fields,
+    walk_the_tree,
+    write_fields,
+)
+from .game import game_channel, get_leaderboard, record_answers, start_game
+from .game_state import AnswersNotCounted, pack_game, unpack_game
+from .players import (
+    authenticate_player,
+    check_player_password,
+    hash_player_password,
+    login_rate_limiter,
+)
+from .ratelimit import TokenBucket
+from .stats import WATERMARK_NAME, refresh_stats
+from .uploads import DECODE_CHUNK_SIZE, decode_data_url
+from .instrumentation import QueryBudgetExceeded, RequestMetrics, registry
+
+
+def create_session(player):
+    """
+    The key of a new session of the logged in player
+    """
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session["PLAYER_ID"] = player.pk
+    session.save()
+    return session.session_key
+
+
+def log_in(client, player):
+    client.cookies[settings.SESSION_COOKIE_NAME] = create_session(player)
+
+
+class GameFixtureMixin:
+    """
+    A "Collection" of question_count questions ("Question 0"...) whose
+    correct answer is `correct`, and a player
+    """
+
+    question_count = 3
+    correct = 1
+    player_name = "player"
+
+    def setUp(self):
+        super().setUp()
+        self.collection = models.Collection.objects.create(name="Collection")
+        self.questions = [
+            models.Question.objects.create(
+                collection=self.collection,
+                text=f"Question {i}",
+                order=i,
+                correct=self.correct,
+            )
+            for i in range(self.question_count)
+        ]
+        self.player = models.Player.objects.create(
+            name=self.player_name, password="password"
+        )
+
+
+@override_settings(QUERY_BUDGETS_ENFORCED=True)
+class QueryBudgetTests(GameFixtureMixin, TestCase):
+    """
+    The views within their query_budget: a request over it raises
+    QueryBudgetExceeded
+    """
+
+    def setUp(self):
+        super().setUp()
+        log_in(self.client, self.player)
+
+    def answer(self, question):
+        return self.client.post(
+            f"/api/simple-game/{self.collection.pk}/",
+            json.dumps({"data": {"questionId": question.pk, "answer": 1}}),
+            content_type="application/json",
+        )
+
+    def test_home(self):
+        self.assertEqual(self.client.get("/api/").status_code, 200)
+
+    def test_game(self):
+        url = f"/api/simple-game/{self.collection.pk}/"
+        self.assertEqual(self.client.get(url).json()["template"], "Game")
+        for question in self.questions:
+            self.assertEqual(self.answer(question).status_code, 200)
+        self.assertEqual(self.client.get(url).json()["template"], "GameResults")
+
+    @override_settings(SERVER_TIMING=True)
+    def test_load_from_bible(self):
+        response = self.client.post(
+            "/api/load-from-bible-0d66a7dd-a69d-4a8d-ae59-7b379ceb9c12/",
+            json.dumps(
+                {"name": "Loaded", "question": [{"order": 1, "text": "Q", "correct": 2}]}
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("queries", response["Server-Timing"])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_no_server_timing(self):
+        self.assertFalse(self.client.get("/api/").has_header("Server-Timing"))
+
+    def test_over_budget(self):
+        with mock.patch.object(views.HomeView, "query_budget", 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/")
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    @override_settings(METRICS_TOKEN="token")
+    def test_metrics(self):
+        self.client.get("/api/")
+        self.assertEqual(self.client.get("/metrics/").status_code, 404)
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer token")
+        self.assertEqual(response.status_code, 200)
+        # AsyncHomeView with ASYNC_VIEWS
+        self.assertRegex(
+            response.content.decode(),
+            r'milgame_requests_total\{view="(Async)?HomeView",method="GET"\} 1',
+        )
+
+
+class ValidatorTests(TestCase):
+    """
+    compile_validator and the errors of the load from Bible API
+    """
+
+    fields = {
+        "type": "Fields",
+        "fields": [
+            {
+                "k": "name",
+                "type": "TextField",
+                "required": True,
+                "validators": [{"type": "maxLength", "value": 5}],
+            },
+            {
+                "k": "size",
+                "type": "NumberField",
+                "required": False,
+                "validators": [
+                    {"type": "minNumber", "value": 1},
+                    {"type": "choices", "value": [1, 2]},
+                ],
+            },
+            {
+                "k": "kind",
+                "type": "SelectField",
+                "required": False,
+                "is_choices": True,
+                "options": [{"value": "a", "label": "A"}],
+            },
+            {
+                "k": "tags",
+                "type": "SelectField",
+                "required": False,
+                "multiple": True,
+                "options": [
+                    {"label": "Group", "options": [{"value": 1, "label": "One"}]}
+                ],
+            },
+            {
+                "k": "items",
+                "type": "ForeignKeyListField",
+                "required": True,
+                "fields": [{"k": "text", "type": "TextField", "required": True}],
+            },
+        ],
+    }
+
+    def validate(self, data):
+        return compile_validator(self.fields)(data)
+
+    def test_valid(self):
+        self.assertEqual(
+            self.validate(
+                {
+                    "name": "name",
+                    "size": "2",
+                    "kind": {"value": "a"},
+                    "tags": [{"value": "1"}],
+                    "items": [{"text": "text"}],
+                }
+            ),
+            [],
+        )
+        self.assertEqual(self.validate({"name": "name", "kind": "a", "items": []}), [])
+
+    def test_errors(self):
+        self.assertEqual(self.validate([]), [{"path": [], "type": "invalid"}])
+        self.assertEqual(
+            self.validate({"size": "big", "kind": 1, "items": [{"text": ""}, 1]}),
+            [
+                {"path": ["name"], "type": "required"},
+                {"path": ["size"], "type": "invalid"},
+                {"path": ["kind"], "type": "invalid"},
+                {"path": ["items", 0, "text"], "type": "required"},
+                {"path": ["items", 1], "type": "invalid"},
+            ],
+        )
+        self.assertEqual(
+            self.validate(
+                {
+                    "name": "too long",
+                    "size": 3,
+                    "kind": "b",
+                    "tags": [{"value": 1}, {"value": 2}],
+                    "items": {},
+                }
+            ),
+            [
+                {"path": ["name"], "type": "maxLength", "value": 5},
+                {"path": ["size"], "type": "choices", "value": [1, 2]},
+                {"path": ["kind"], "type": "choices"},
+                {"path": ["tags"], "type": "choices"},
+                {"path": ["items"], "type": "invalid"},
+            ],
+        )
+        self.assertEqual(
+            self.validate({"name": "name", "size": 0, "tags": {"value": 1}}),
+            [
+                {"path": ["size"], "type": "minNumber", "value": 1},
+                {"path": ["size"], "type": "choices", "value": [1, 2]},
+                {"path": ["tags"], "type": "invalid"},
+                {"path": ["items"], "type": "required"},
+            ],
+        )
+
+    @override_settings(SERVER_TIMING=True)
+    def test_load_from_bible(self):
+        response = self.client.post(
+            "/api/load-from-bible-0d66a7dd-a69d-4a8d-ae59-7b379ceb9c12/",
+            json.dumps(
+                {
+                    "name": "Loaded",
+                    "question": [
+                        {"order": 1, "text": "Q", "correct": 5},
+                        {"order": "first", "text": "Q", "correct": 1},
+                    ],
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"],
+            [
+                {
+                    "path": ["question", 0, "correct"],
+                    "type": "choices",
+                    "value": [1, 2, 3, 4],
+                },
+                {"path": ["question", 1, "order"], "type": "invalid"},
+            ],
+        )
+        self.assertFalse(models.Collection.objects.exists())
+
+
+class ReferenceDataTests(TestCase):
+    """
+    The invalidation of the reference data by the models it reads only
+    """
+
+    def setUp(self):
+        reference_data.clear()
+        self.addCleanup(reference_data.clear)
+        self.collection = models.Collection.objects.create(name="Collection")
+
+    def get_names(self):
+        return reference_data.get_rows(
+            models.Collection.objects.values("name").order_by("pk")
+        )
+
+    def test_invalidate(self):
+        self.assertEqual(self.get_names(), [{"name": "Collection"}])
+        models.Collection.objects.create(name="Other")
+        self.assertEqual(
+            self.get_names(), [{"name": "Collection"}, {"name": "Other"}]
+        )
+
+    def test_invalidate_while_fetching(self):
+        fetch_all = QuerySet._fetch_all
+        saved = []
+
+        def fetch_all_and_save(queryset):
+            fetch_all(queryset)
+            if not saved:
+                saved.append(models.Collection.objects.create(name="Other"))
+
+        with mock.patch.object(QuerySet, "_fetch_all", fetch_all_and_save):
+            # Read before the save
+            self.assertEqual(self.get_names(), [{"name": "Collection"}])
+        self.assertEqual(
+            self.get_names(), [{"name": "Collection"}, {"name": "Other"}]
+        )
+
+    def test_other_models(self):
+        self.get_names()
+        with mock.patch.object(reference_data, "_lock") as lock:
+            player = models.Player.objects.create(name="player", password="password")
+            models.Game.objects.create(player=player, collection=self.collection)
+            lock.__enter__.assert_not_called()
+            self.collection.save()
+            lock.__enter__.assert_called()
+
+
+class FilterTests(TestCase):
+    """
+    The filter plans: the readers of the GET parameters and their Q
+    """
+
+    fields = {
+        "type": "Fields",
+        "fields": [
+            {
+                "k": "collection",
+                "type": "Fields",
+                "fields": [
+                    {"k": "name", "type": "TextField", "label": "Name"},
+                ],
+            },
+            {
+                "k": "question_type",
+                "type": "SelectField",
+                "label": "Type",
+                "options": [{"value": "text", "label": "Text"}],
+            },
+        ],
+    }
+
+    def read(self, field, query_string, k_path=()):
+        return compile_filter_field(field, k_path)(QueryDict(query_string))
+
+    def test_fields(self):
+        select = {"k": "kind", "type": "SelectField"}
+        self.assertEqual(self.read(select, "kind=a"), {"kind": "a"})
+        self.assertEqual(self.read(select, "kind="), {})
+        self.assertEqual(
+            self.read({**select, "multiple": True, "qs_k": "kinds"}, "kind=1,2"),
+            {"kinds__in": [1, 2]},
+        )
+        self.assertEqual(
+            self.read({"k": "day", "type": "DateField"}, "day=2023-02-01"),
+            {"day": date(2023, 2, 1)},
+        )
+        self.assertEqual(
+            self.read(
+                {"k": "month", "type": "MonthField", "qs_k": "day__month"},
+                "month=2023-02",
+            ),
+            {"day__year": 2023, "day__month": 2},
+        )
+        self.assertEqual(
+            self.read({"k": "done", "type": "BooleanField"}, "done=yes"), {"done": True}
+        )
+        self.assertEqual(
+            self.read({"k": "done", "type": "BooleanField"}, ""), {"done": False}
+        )
+        with self.assertRaises(ImproperlyConfigured):
+            compile_filter_field({"k": "file", "type": "Image1Field"})
+
+    def test_malformed(self):
+        kinds = {"k": "kind", "type": "SelectField", "multiple": True}
+        day = {"k": "day", "type": "DateField"}
+        month = {"k": "month", "type": "MonthField"}
+        for field, query_string in [
+            (kinds, "kind=1,a"),
+            (day, "day=2023-02-30"),
+            (day, "day=yesterday"),
+            (day, "day=2023-02-01&day=2023-02-02"),
+            (month, "month=2023-13"),
+            (month, "month=2023-01&month=2023-02"),
+            ({"k": "q", "type": "TextField"}, "q=a&q=b"),
+        ]:
+            with self.subTest(query_string):
+                self.assertEqual(self.read(field, query_string), {})
+        self.assertEqual(self.read(kinds, "kind=1&kind=2,3"), {"kind__in": [1, 2, 3]})
+
+    def test_malformed_form(self):
+        fields = {
+            "type": "Fields",
+            "fields": [
+                {
+                    "k": "collection",
+                    "type": "SelectField",
+                    "multiple": True,
+                    "options": [{"value": 1, "label": "Collection"}],
+                },
+                {"k": "name", "type": "TextField", "qs_k": "text"},
+            ],
+        }
+        form, q = read_filter_fields(
+            fields, QueryDict("collection=a&name=x"), models.Question
+        )
+        self.assertIsNone(form["data"]["collection"])
+        self.assertEqual(q, Q(text__icontains="x"))
+
+    def test_plans_eviction(self):
+        def read():
+            for _ in range(20):
+                # A new definition every time
+                read_filter_fields(
+                    copy.deepcopy(self.fields), QueryDict(""), models.Question
+                )
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        with mock.patch("main.framework.FILTER_PLANS_SIZE", 2):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertLessEqual(len(framework.filter_plans), 2)
+
+    def test_text(self):
+        text = {"k": "q", "type": "TextField", "search_fields": ["text", "answer1"]}
+        self.assertEqual(self.read(text, "q=+"), {})
+        self.assertEqual(
+            self.read(text, "q=abc", ["collection"]),
+            {
+                "collection__q": Q(collection__text__icontains="abc")
+                | Q(collection__answer1__icontains="abc")
+            },
+        )
+
+    def test_read_filter_fields(self):
+        collection = models.Collection.objects.create(name="Animals")
+        other = models.Collection.objects.create(name="Plants")
+        question = models.Question.objects.create(
+            collection=collection, text="Plants", correct=1
+        )
+        models.Question.objects.create(collection=other, text="Animals", correct=1)
+        form, q = read_filter_fields(
+            self.fields,
+            QueryDict("name=anim&question_type=text"),
+            models.Question,
+        )
+        self.assertEqual(
+            form["data"], {"collection": {"name": "anim"}, "question_type": None}
+        )
+        self.assertEqual(list(models.Question.objects.filter(q)), [question])
+
+    @override_settings(DEBUG=True)
+    def test_check_filter_indexes(self):
+        metrics = RequestMetrics()
+        token = instrumentation._current_metrics.set(metrics)
+        self.addCleanup(instrumentation._current_metrics.reset, token)
+        with self.assertWarns(UnindexedFilterWarning):
+            read_filter_fields(self.fields, QueryDict("name=x"), models.Question)
+        # The EXPLAIN isn't counted in the query budget
+        self.assertEqual(metrics.queries, 0)
+
+
+def deepcopy_walk_the_tree(tree, f, parents=None):
+    """
+    walk_the_tree as it was before path copying: every node copied, f
+    changing it in place
+    """
+    if not parents:
+        parents = []
+    fields = tree.get("fields")
+    tree = {k: v for k, v in tree.items()}
+    if fields:
+        tree["fields"] = [
+            deepcopy_walk_the_tree(field, f, [*parents, tree]) for field in fields
+        ]
+    return f(tree, parents)
+
+
+def deepcopy_apply_fields_included_and_required(
+    definition, fields_included_and_required, required_by_default
+):
+    """
+    apply_fields_included_and_required as it was before path copying
+    """
+    definition = copy.deepcopy(definition)
+
+    def is_included(k):
+        return k and (
+            k in required_by_default
+            or fields_included_and_required.get(k, {}).get("available")
+        )
+
+    def is_required(k):
+        return k and (
+            k in required_by_default
+            or fields_included_and_required.get(k, {}).get("required")
+        )
+
+    def spread_required(node, required):
+        if node.get("fields"):
+            return {
+                **node,
+                "fields": [spread_required(f, required) for f in node["fields"]],
+            }
+        if node:
+            node["required"] = required
+        return node
+
+    def walk(node):
+        k = node.get("k")
+        position_k = node.get("position_k")
+        fields = node.get("fields")
+        if is_included(position_k):
+            return spread_required(node, is_required(position_k))
+        if is_included(k) and not fields:
+            return spread_required(node, is_required(k))
+        if fields:
+            fields = [f for f in [walk(f) for f in fields] if f]
+            if not fields:
+                return None
+            return {**node, "fields": fields}
+
+    return walk(definition)
+
+
+class TreeTransformTests(SimpleTestCase):
+    """
+    The path copying walk_the_tree and apply_fields_included_and_required
+    give what the deep copying versions did, and share the rest
+    """
+
+    def setUp(self):
+        self.definition = make_definition(fields=200, group_size=5)
+        self.original = copy.deepcopy(self.definition)
+
+    def tearDown(self):
+        # Never modified
+        self.assertEqual(self.definition, self.original)
+
+    def test_walk_the_tree(self):
+        calls = []
+
+        def make_not_required(field, parents):
+            calls.append((field.get("k"), [parent.get("k") for parent in parents]))
+            if field.get("required"):
+                field = {**field, "required": False}
+            return field
+
+        def make_not_required_in_place(field, parents):
+            calls.append((field.get("k"), [parent.get("k") for parent in parents]))
+            if field.get("required"):
+                field["required"] = False
+            return field
+
+        result = walk_the_tree(self.definition, make_not_required)
+        new_calls, calls[:] = calls[:], []
+        self.assertEqual(
+            result,
+            deepcopy_walk_the_tree(self.definition, make_not_required_in_place),
+        )
+        self.assertEqual(new_calls, calls)
+
+    def test_walk_the_tree_shares(self):
+        self.assertIs(
+            walk_the_tree(self.definition, lambda node, _: node), self.definition
+        )
+
+        def rename_f0(field, _):
+            return {**field, "label": "Renamed"} if field.get("k") == "f0" else field
+
+        result = walk_the_tree(self.definition, rename_f0)
+        first, *others = result["fields"]
+        self.assertEqual(first["fields"][0]["fields"][0]["label"], "Renamed")
+        self.assertIs(first["fields"][1], self.definition["fields"][0]["fields"][1])
+        for new, old in zip(others, self.definition["fields"][1:]):
+            self.assertIs(new, old)
+
+    def test_apply_fields_included_and_required(self):
+        available = {"available": True}
+        required = {"available": True, "required": True}
+        for included, required_by_default in [
+            ({}, []),
+            ({}, ["f0", "p3"]),
+            ({"p0": available, "p1": required}, []),
+            ({"f7": required, "f8": available}, []),
+            ({"s1": available, "f60": available}, ["p39"]),
+            ({f"p{i}": available for i in range(40)}, []),
+        ]:
+            with self.subTest(included=included, by_default=required_by_default):
+                self.assertEqual(
+                    apply_fields_included_and_required(
+                        self.definition, included, required_by_default
+                    ),
+                    deepcopy_apply_fields_included_and_required(
+                        self.definition, included, required_by_default
+                    ),
+                )
+
+    def test_apply_fields_included_and_required_shares(self):
+        # "required" as the group says already: nothing to copy in p0
+        self.definition = walk_the_tree(
+            self.definition,
+            lambda node, _: {**node, "required": False} if "k" in node else node,
+        )
+        self.original = copy.deepcopy(self.definition)
+        section = self.definition["fields"][0]
+        included = {
+            "p0": {"available": True, "required": False},
+            "p1": {"available": True, "required": False},
+        }
+        result = apply_fields_included_and_required(self.definition, included, [])
+        self.assertEqual(len(result["fields"]), 1)
+        self.assertEqual(len(result["fields"][0]["fields"]), 2)
+        self.assertIs(result["fields"][0]["fields"][0], section["fields"][0])
+        self.assertIs(result["fields"][0]["fields"][1], section["fields"][1])
+        # Everything included, as it is
+        included = {f"p{i}": {"available": True, "required": False} for i in range(40)}
+        self.assertIs(
+            apply_fields_included_and_required(self.definition, included, []),
+            self.definition,
+        )
+
+
+class TracingTests(SimpleTestCase):
+    """
+    main.tracing, disabled and enabled
+    """
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(tracing.TraceFormatter())
+        level, handlers = tracing.logger.level, tracing.logger.handlers
+        tracing.logger.handlers = [handler]
+        self.addCleanup(setattr, tracing.logger, "handlers", handlers)
+        self.addCleanup(tracing.logger.setLevel, level)
+        self.obj = SimpleNamespace(parent=SimpleNamespace(name="Parent"))
+        self.field = {
+            "type": "TextField",
+            "k": "name",
+            "original_from_field": "parent.name",
+        }
+
+    def trace(self):
+        with tracing.span("outer", model="Question"):
+            tracing.event("start", count=1)
+            with tracing.span("inner", obj=object()):
+                self.assertEqual(read_field(self.obj, self.field), "Parent")
+
+    def test_disabled(self):
+        tracing.logger.setLevel(logging.WARNING)
+        self.assertIs(tracing.span("outer"), tracing.NULL_SPAN)
+        with mock.patch.object(tracing, "event", wraps=tracing.event) as event:
+            self.trace()
+        # read_field doesn't even build the fields of its event
+        self.assertEqual(event.call_count, 1)
+        self.assertEqual(self.stream.getvalue(), "")
+
+    def test_enabled(self):
+        tracing.logger.setLevel(logging.DEBUG)
+        self.trace()
+        start, follow, inner, outer = [
+            json.loads(line) for line in self.stream.getvalue().splitlines()
+        ]
+        self.assertEqual(outer["span"], "outer")
+        self.assertEqual(outer["model"], "Question")
+        self.assertIsNone(outer["parent_id"])
+        self.assertEqual((start["event"], start["count"]), ("start", 1))
+        self.assertEqual(start["span_id"], outer["span_id"])
+        self.assertEqual(inner["span"], "inner")
+        self.assertEqual(inner["parent_id"], outer["span_id"])
+        self.assertTrue(inner["obj"].startswith("<object object"))
+        self.assertEqual(follow["event"], "read_field.follow")
+        self.assertEqual((follow["k"], follow["attribute"]), ("name", "parent"))
+        self.assertEqual(follow["span_id"], inner["span_id"])
+        self.assertGreaterEqual(outer["duration_ms"], inner["duration_ms"])
+        for record in [start, follow, inner, outer]:
+            self.assertIsInstance(record["time"], float)
+
+
+class SeedTests(TestCase):
+    """
+    The seed command and its fixture, on the migrated tables
+    """
+
+    def test_seed(self):
+        call_command(
+            "seed", players=2, collections=1, questions=3, stdout=io.StringIO()
+        )
+        self.assertEqual(models.Player.objects.count(), 2)
+        self.assertEqual(models.Question.objects.count(), 3)
+
+    def test_loaddata(self):
+        path = os.path.join(tempfile.mkdtemp(), "fixture.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command(
+            "seed",
+            players=2,
+            collections=1,
+            questions=3,
+            output=path,
+            stdout=io.StringIO(),
+        )
+        call_command("loaddata", path, verbosity=0)
+        self.assertEqual(models.Player.objects.count(), 2)
+        self.assertEqual(
+            models.Question.objects.filter(created_datetime__isnull=False).count(), 3
+        )
+
+
+class WriteFieldsTests(TransactionTestCase):
+    """
+    write_fields through two levels of ForeignKeyListField, on the models
+    of the framework benchmarks (a reverse accessor "children" at every
+    level)
+    """
+
+    def setUp(self):
+        apps_override = isolate_apps("main")
+        apps_override.enable()
+        self.addCleanup(apps_override.disable)
+        self.bench_models = make_node_models(width=1, depth=2)
+        tables = [
+            self.bench_models["option"],
+            self.bench_models["tag"],
+            *self.bench_models["nodes"],
+        ]
+        with connection.schema_editor() as editor:
+            for model in tables:
+                editor.create_model(model)
+        self.addCleanup(self.drop_tables, tables)
+        reference_data.clear()
+        self.addCleanup(reference_data.clear)
+
+    def drop_tables(self, tables):
+        with connection.schema_editor() as editor:
+            for model in reversed(tables):
+                editor.delete_model(model)
+
+    def tree(self, node):
+        children = getattr(node, "children", None)
+        return [
+            node.f0,
+            [self.tree(child) for child in children.order_by("pk")]
+            if children
+            else [],
+        ]
+
+    def test_nested(self):
+        option = self.bench_models["option"].objects.create(name="Option")
+        node = {"option": {"value": option.pk}, "tags": []}
+        root_model = self.bench_models["nodes"][0]
+        root = write_fields(
+            make_node_definition(width=1, depth=2),
+            root_model(),
+            {
+                **node,
+                "f0": "root",
+                "children": [
+                    {
+                        **node,
+                        "f0": "child",
+                        "children": [
+                            {**node, "f0": f"grandchild {i}"} for i in range(2)
+                        ],
+                    }
+                ],
+            },
+        )
+        self.assertEqual(
+            self.tree(root_model.objects.get(pk=root.pk)),
+            ["root", [["child", [["grandchild 0", []], ["grandchild 1", []]]]]],
+        )
+
+
+class ConditionalGetTests(GameFixtureMixin, TestCase):
+    """
+    The ETag of the versioned views and their 304
+    """
+
+    question_count = 1
+
+    def setUp(self):
+        super().setUp()
+        log_in(self.client, self.player)
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        return response["ETag"]
+
+    def test_home(self):
+        response = self.client.get("/api/")
+        etag = response["ETag"]
+        self.assertFalse(response.has_header("Last-Modified"))
+        self.assertNotModified("/api/", etag)
+        # Within the same second
+        new = models.Collection.objects.create(name="New")
+        etag = self.assertModified("/api/", etag)
+        new.delete()
+        etag = self.assertModified("/api/", etag)
+        self.assertNotModified("/api/", etag)
+        # Without an ETag, If-Modified-Since alone never gives a 304
+        response = self.client.get(
+            "/api/", HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_game(self):
+        url = f"/api/simple-game/{self.collection.pk}/"
+        # Started by this GET: no version yet
+        self.assertFalse(self.client.get(url).has_header("ETag"))
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModified(url, etag)
+        self.questions[0].text = "Changed"
+        self.questions[0].save()
+        self.assertModified(url, etag)
+
+
+LOCAL_REDIS_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "responses": {"BACKEND": "main.cache_backends.LocalRedisCache"},
+}
+
+
+@override_settings(
+    CACHES=LOCAL_REDIS_CACHES,
+    RESPONSE_CACHE_LOCK_TIMEOUT=1,
+    RESPONSE_CACHE_SYNC_WAIT=1,
+)
+class ResponseCacheTests(SimpleTestCase):
+    """
+    main.response_cache over the LocalRedisCache fake
+    """
+
+    def setUp(self):
+        self.cache = response_cache.get_cache()
+        self.cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return f"value {self.calls}"
+
+    async def acompute(self):
+        self.calls += 1
+        await asyncio.sleep(0.1)
+        return f"value {self.calls}"
+
+    def test_hit(self):
+        self.assertIsInstance(self.cache, LocalRedisCache)
+        for _ in range(2):
+            self.assertEqual(
+                response_cache.get_or_compute("key", self.compute, 60), "value 1"
+            )
+        self.assertEqual(self.calls, 1)
+        self.assertFalse(self.cache.has_key("key:lock"))
+
+    def test_contention(self):
+        results = []
+
+        def get():
+            results.append(response_cache.get_or_compute("key", self.compute, 60))
+
+        threads = [threading.Thread(target=get) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value 1"] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_async_contention(self):
+        async def main():
+            return await asyncio.gather(
+                *(
+                    response_cache.aget_or_compute("key", self.acompute, 60)
+                    for _ in range(5)
+                )
+            )
+
+        self.assertEqual(asyncio.run(main()), ["value 1"] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_lock_timeout(self):
+        # A request that took the lock and never finished (Redis timeouts are
+        # whole seconds)
+        self.assertTrue(self.cache.add("key:lock", 1, 1))
+        start = time.monotonic()
+        self.assertEqual(
+            response_cache.get_or_compute("key", self.compute, 60), "value 1"
+        )
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+        # Built without the lock: not cached
+        self.assertIsNone(self.cache.get("key"))
+        # By now the lock has expired
+        self.assertEqual(
+            response_cache.get_or_compute("key", self.compute, 60), "value 2"
+        )
+        self.assertEqual(self.cache.get("key"), "value 2")
+
+    @override_settings(RESPONSE_CACHE_SYNC_WAIT=0.1)
+    def test_sync_wait(self):
+        self.assertTrue(self.cache.add("key:lock", 1, 60))
+        start = time.monotonic()
+        response_cache.get_or_compute("key", self.compute, 60)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_key(self):
+        def get_key(player_pk, language, version=None):
+            view = views.WelcomeView()
+            view.player = player_pk and models.Player(pk=player_pk)
+            request = RequestFactory().get("/api/welcome/")
+            request.LANGUAGE_CODE = language
+            request.user = AnonymousUser()
+            return response_cache.get_cache_key(view, request, version)
+
+        self.assertEqual(get_key(1, "en"), get_key(1, "en"))
+        # WelcomeView doesn't vary on the version
+        self.assertEqual(get_key(1, "en"), get_key(1, "en", 2))
+        keys = {get_key(1, "en"), get_key(2, "en"), get_key(None, "en")}
+        keys |= {get_key(1, "ru"), get_key(2, "ru"), get_key(None, "ru")}
+        self.assertEqual(len(keys), 6)
+
+
+class CompressionTests(SimpleTestCase):
+    """
+    main.middleware.CompressionMiddleware
+    """
+
+    def get_response(self, accept_encoding, content=b"x" * 2048, **headers):
+        response = HttpResponse(content, content_type="application/json")
+        for name, value in headers.items():
+            response[name] = value
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return middleware.CompressionMiddleware(lambda r: response)(request)
+
+    def test_choose_encoding(self):
+        with mock.patch.object(middleware, "brotli", None):
+            self.assertEqual(middleware.choose_encoding("gzip, deflate, br"), "gzip")
+            self.assertEqual(middleware.choose_encoding("*"), "gzip")
+        with mock.patch.object(middleware, "brotli", True):
+            for accept_encoding, encoding in [
+                ("gzip, deflate, br", "br"),
+                ("GZIP;Q=0.5", "gzip"),
+                ("br;q=0, gzip", "gzip"),
+                ("br;q=0.5, gzip;q=0.8", "gzip"),
+                ("*, br;q=0", "gzip"),
+                ("gzip;q=0", None),
+                ("gzip;q=0.0, br;q=0", None),
+                ("*;q=0", None),
+                ("gzip;q=nonsense", None),
+                ("identity", None),
+                ("", None),
+            ]:
+                with self.subTest(accept_encoding):
+                    self.assertEqual(
+                        middleware.choose_encoding(accept_encoding), encoding
+                    )
+
+    def test_gzip(self):
+        with mock.patch.object(middleware, "brotli", None):
+            response = self.get_response("gzip, br", ETag='"abc"')
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), b"x" * 2048)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        # Weakened, as the representation changed
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    @skipUnless(middleware.brotli, "brotli isn't installed")
+    def test_brotli(self):
+        response = self.get_response("gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(middleware.brotli.decompress(response.content), b"x" * 2048)
+
+    def test_refused(self):
+        response = self.get_response("br;q=0, gzip;q=0", ETag='"abc"')
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, b"x" * 2048)
+        # Another client may get it compressed
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["ETag"], '"abc"')
+
+    @override_settings(COMPRESSION_MIN_SIZE=1024)
+    def test_min_size(self):
+        response = self.get_response("gzip", content=b"x" * 1023)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertFalse(response.has_header("Vary"))
+        response = self.get_response("gzip", content=b"x" * 1024)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_encoders(self):
+        """
+        orjson and the stdlib fallback give the same bytes
+        """
+        data = {
+            "text": "Вопрос \"1\"\\\n\t\x01\u2028 é",
+            "numbers": [0, -1, 2**63 - 1, 0.1, 123456789.123, True, None],
+            "date": date(2020, 1, 2),
+            "datetime": datetime(2020, 1, 2, 3, 4, 5),
+            "decimal": Decimal("1.10"),
+            "lazy": gettext_lazy("Home"),
+            "nested": {1: [(2, 3)], "": {}},
+        }
+        self.assertEqual(responses.encode(data), responses.dumps_stdlib(data))
+        self.assertEqual(
+            responses.encode({"generator": (i for i in range(3))}),
+            responses.dumps_stdlib({"generator": (i for i in range(3))}),
+        )
+        # Which orjson refuses: escaped, as json would
+        self.assertEqual(responses.encode("\ud800"), b'"\\ud800"')
+
+
+def reload_urls():
+    importlib.reload(import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@override_settings(ASYNC_VIEWS=True)
+class AsyncViewsTests(GameFixtureMixin, TestCase):
+    """
+    The async variants of the game views (main/async_views.py)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Runs last, once ASYNC_VIEWS is back to its value
+        cls.addClassCleanup(reload_urls)
+        super().setUpClass()
+        reload_urls()
+
+    question_count = 2
+
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/simple-game/{self.collection.pk}/"
+
+    def test_urls(self):
+        self.assertIs(resolve("/api/").func.view_class, async_views.AsyncHomeView)
+        self.assertIs(
+            resolve(self.url).func.view_class, async_views.AsyncSimpleGameView
+        )
+
+    async def post_answer(self, question, answer):
+        return await self.async_client.post(
+            self.url,
+            json.dumps({"data": {"questionId": question.pk, "answer": answer}}),
+            content_type="application/json",
+        )
+
+    async def test_home(self):
+        response = await self.async_client.get("/api/")
+        self.assertEqual(response.json()["navigate"], "/welcome/")
+        await sync_to_async(log_in)(self.async_client, self.player)
+        response = await self.async_client.get("/api/")
+        self.assertEqual(
+            response.json()["other_games"],
+            [{"name": "Collection", "pk": self.collection.pk}],
+        )
+        # AsyncClient takes the headers themselves (Django < 4.2)
+        response = await self.async_client.get(
+            "/api/", **{"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_game(self):
+        await sync_to_async(log_in)(self.async_client, self.player)
+        # Not started yet
+        response = await self.post_answer(self.questions[0], 1)
+        self.assertEqual(response.status_code, 400)
+        data = (await self.async_client.get(self.url)).json()
+        self.assertEqual(data["template"], "Game")
+        self.assertEqual((data["index"], data["total"]), (1, 2))
+        self.assertEqual(data["text"], "Question 0")
+        self.assertEqual(
+            data["events_url"], f"/api/simple-game/{self.collection.pk}/events/"
+        )
+
+        response = await self.post_answer(self.questions[0], 1)
+        self.assertEqual(response.json()["correctAnswer"], 1)
+        data = (await self.async_client.get(self.url)).json()
+        self.assertEqual((data["index"], data["text"]), (2, "Question 1"))
+
+        await self.post_answer(self.questions[1], 2)
+        data = (await self.async_client.get(self.url)).json()
+        self.assertEqual(data["template"], "GameResults")
+        self.assertEqual((data["score"], data["total"]), (1, 2))
+        self.assertEqual(data["leaderboard"][0]["player_name"], "player")
+
+
+class AnswersTests(GameFixtureMixin, TestCase):
+    """
+    SimpleGameAnswersView and main.game.record_answers
+    """
+
+    correct = 2
+
+    def setUp(self):
+        super().setUp()
+        log_in(self.client, self.player)
+        self.client.get(f"/api/simple-game/{self.collection.pk}/")
+        self.game = models.Game.objects.get(player=self.player)
+
+    def post(self, body, **headers):
+        return self.client.post(
+            f"/api/simple-game/{self.collection.pk}/answers/",
+            json.dumps(body),
+            content_type="application/json",
+            **headers,
+        )
+
+    def submit(self, *answers, **headers):
+        response = self.post(
+            {
+                "data": {
+                    "answers": [
+                        {"questionId": question.pk, "answer": answer, "clientSeq": i}
+                        for i, (question, answer) in enumerate(answers)
+                    ]
+                }
+            },
+            **headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        return [result["status"] for result in response.json()["results"]]
+
+    def test_record(self):
+        response = self.post(
+            {"data": {"answers": [{"questionId": self.questions[0].pk, "answer": 2}]}}
+        )
+        [result] = response.json()["results"]
+        self.assertEqual(result["status"], "recorded")
+        self.assertTrue(result["correct"])
+        self.assertEqual(result["correctAnswer"], 2)
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.answered_count, self.game.score), (1, 1))
+
+    def test_duplicates(self):
+        first, second = self.questions[:2]
+        self.assertEqual(
+            self.submit((first, 2), (first, 1), (second, 1)),
+            ["recorded", "duplicate", "recorded"],
+        )
+        self.assertEqual(self.submit((first, 3)), ["duplicate"])
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.answered_count, self.game.score), (2, 1))
+
+    def test_concurrent_insert(self):
+        # Stored by another writer between the read of the answers and the insert
+        question = self.questions[0]
+        models.QuestionAnswer.objects.create(
+            game=self.game, question=question, answer=3, correct=False
+        )
+        with mock.patch.object(game_state.RowGameState, "answered", return_value={}):
+            [result] = self.post(
+                {"data": {"answers": [{"questionId": question.pk, "answer": 2}]}}
+            ).json()["results"]
+        self.assertEqual(result["status"], "duplicate")
+        self.assertFalse(result["correct"])
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.answered_count, 0)
+
+    def test_invalid(self):
+        question = self.questions[0]
+        answers = [True, 1.0, 0, 5, "2", None]
+        self.assertEqual(
+            self.submit(*[(question, answer) for answer in answers]),
+            ["invalid"] * len(answers),
+        )
+        [result] = self.post(
+            {"data": {"answers": [{"questionId": -1, "answer": 2}]}}
+        ).json()["results"]
+        self.assertEqual(result["status"], "invalid")
+        self.assertFalse(models.QuestionAnswer.objects.exists())
+
+    def test_malformed(self):
+        for body in [
+            {"data": {"answers": {"questionId": 1}}},
+            {"data": {"answers": [1, 2]}},
+            {"data": []},
+            {"answers": []},
+        ]:
+            self.assertEqual(self.post(body).status_code, 400, body)
+        response = self.client.post(
+            f"/api/simple-game/{self.collection.pk}/answers/",
+            "{",
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_idempotency_key(self):
+        question = self.questions[0]
+        key = {"HTTP_IDEMPOTENCY_KEY": "k1"}
+        self.assertEqual(self.submit((question, 2), **key), ["recorded"])
+        # A retry gets the first response back
+        self.assertEqual(self.submit((question, 2), **key), ["recorded"])
+        key = {"HTTP_IDEMPOTENCY_KEY": "k2"}
+        self.assertEqual(self.submit((question, 2), **key), ["duplicate"])
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.answered_count, 1)
+
+
+class LeaderboardTests(GameFixtureMixin, TestCase):
+    """
+    The score counters of the games and the best game per player
+    """
+
+    def play(self, answers, player=None):
+        game = models.Game.objects.create(
+            player=player or self.player, collection=self.collection
+        )
+        record_answers(
+            game,
+            [
+                {"questionId": question.pk, "answer": answer}
+                for question, answer in zip(self.questions, answers)
+            ],
+        )
+        game.refresh_from_db()
+        return game
+
+    def test_counters(self):
+        game = self.play([1, 2])
+        self.assertEqual((game.answered_count, game.score), (2, 1))
+        self.assertIsNone(game.completed_datetime)
+        self.assertFalse(models.LeaderboardEntry.objects.exists())
+        record_answers(game, [{"questionId": self.questions[2].pk, "answer": 1}])
+        game.refresh_from_db()
+        self.assertEqual((game.answered_count, game.score), (3, 2))
+        self.assertIsNotNone(game.completed_datetime)
+
+    def test_best_game(self):
+        first = self.play([1, 2, 2])
+        self.assertEqual(models.LeaderboardEntry.objects.get().game, first)
+        better = self.play([1, 1, 2])
+        self.assertEqual(models.LeaderboardEntry.objects.get().game, better)
+        self.play([2, 2, 2])
+        entry = models.LeaderboardEntry.objects.get()
+        self.assertEqual((entry.game, entry.score), (better, 2))
+
+    def test_ranking(self):
+        other = models.Player.objects.create(name="other", password="password")
+        self.play([1, 2, 2])
+        self.play([1, 1, 1], player=other)
+        leaderboard = get_leaderboard(self.collection.pk)
+        self.assertEqual(
+            [(row["player_name"], row["score"]) for row in leaderboard],
+            [("other", 3), ("player", 1)],
+        )
+
+    def test_backfill(self):
+        # Games played before 0004: answers only
+        game, unfinished = [
+            models.Game.objects.create(player=self.player, collection=self.collection)
+            for _ in range(2)
+        ]
+        for question, answer in zip(self.questions, [1, 1, 2]):
+            models.QuestionAnswer.objects.create(
+                game=game, question=question, answer=answer, correct=answer == 1
+            )
+        models.QuestionAnswer.objects.create(
+            game=unfinished, question=self.questions[0], answer=1, correct=True
+        )
+        migration = import_module(
+            "main.migrations.0004_game_aggregates_leaderboardentry"
+        )
+        migration.backfill_game_aggregates(apps, None)
+        game.refresh_from_db()
+        unfinished.refresh_from_db()
+        self.assertEqual((game.answered_count, game.score), (3, 2))
+        self.assertIsNotNone(game.completed_datetime)
+        self.assertEqual(unfinished.answered_count, 1)
+        self.assertIsNone(unfinished.completed_datetime)
+        entry = models.LeaderboardEntry.objects.get()
+        self.assertEqual((entry.game, entry.score), (game, 2))
+
+
+@override_settings(STATS_REFRESH_LAG=-10)
+class StatsTests(GameFixtureMixin, TestCase):
+    """
+    refresh_stats: QuestionStats and CollectionStats from the answers past
+    the watermark
+    """
+
+    question_count = 2
+
+    def answer(self, *answers):
+        player = models.Player.objects.create(
+            name=f"player{models.Player.objects.count()}", password="password"
+        )
+        game = models.Game.objects.create(player=player, collection=self.collection)
+        for question, answer in zip(self.questions, answers):
+            models.QuestionAnswer.objects.create(
+                game=game, question=question, answer=answer, correct=answer == 1
+            )
+
+    def get_watermark(self):
+        return models.StatsWatermark.objects.get(name=WATERMARK_NAME).last_id
+
+    def test_counters(self):
+        self.answer(1, 1)
+        self.answer(2, 1)
+        self.answer(1, 3)
+        self.assertEqual(refresh_stats(chunk_size=4), 6)
+        question_stats = models.QuestionStats.objects.get(question=self.questions[0])
+        self.assertEqual(
+            (
+                question_stats.answers_count,
+                question_stats.correct_count,
+                question_stats.answer1_count,
+                question_stats.answer2_count,
+            ),
+            (3, 2, 2, 1),
+        )
+        collection_stats = models.CollectionStats.objects.get()
+        self.assertEqual(
+            (collection_stats.answers_count, collection_stats.correct_count), (6, 4)
+        )
+        self.assertEqual(
+            self.get_watermark(), models.QuestionAnswer.objects.latest("id").id
+        )
+        # Counted once
+        self.assertEqual(refresh_stats(), 0)
+        self.answer(1, 1)
+        self.assertEqual(refresh_stats(), 2)
+        self.assertEqual(models.CollectionStats.objects.get().answers_count, 8)
+
+    def test_interrupted(self):
+        for _ in range(3):
+            self.answer(1, 2)
+        original = stats.refresh_stats_chunk
+        calls = []
+
+        def failing_chunk(last_id, upper_id):
+            calls.append(last_id)
+            if len(calls) == 2:
+                raise RuntimeError("interrupted")
+            return original(last_id, upper_id)
+
+        with mock.patch("main.stats.refresh_stats_chunk", failing_chunk):
+            with self.assertRaises(RuntimeError):
+                refresh_stats(chunk_size=2)
+        # The first chunk and its watermark were committed together
+        self.assertEqual(models.CollectionStats.objects.get().answers_count, 2)
+        self.assertEqual(refresh_stats(chunk_size=2), 4)
+        self.assertEqual(models.CollectionStats.objects.get().answers_count, 6)
+        question_stats = models.QuestionStats.objects.get(question=self.questions[0])
+        self.assertEqual(question_stats.correct_count, 3)
+
+    @override_settings(GAME_ANSWER_STORAGE="packed")
+    def test_packed(self):
+        # Packed from the start: no QuestionAnswer rows
+        game = start_game(self.player, self.collection)
+        record_answers(
+            game,
+            [
+                {"questionId": self.questions[0].pk, "answer": 1},
+                {"questionId": self.questions[1].pk, "answer": 3},
+            ],
+        )
+        self.answer(2, 1)
+        self.assertEqual(refresh_stats(chunk_size=1), 4)
+        question_stats = models.QuestionStats.objects.get(question=self.questions[1])
+        self.assertEqual(
+            (
+                question_stats.answers_count,
+                question_stats.correct_count,
+                question_stats.answer1_count,
+                question_stats.answer3_count,
+            ),
+            (2, 1, 1, 1),
+        )
+        collection_stats = models.CollectionStats.objects.get()
+        self.assertEqual(
+            (collection_stats.answers_count, collection_stats.correct_count), (4, 2)
+        )
+        # Counted once, also once unpacked
+        self.assertEqual(refresh_stats(), 0)
+        unpack_game(game)
+        self.assertEqual(refresh_stats(), 0)
+        self.assertEqual(models.CollectionStats.objects.get().answers_count, 4)
+
+    @override_settings(STATS_REFRESH_LAG=60)
+    def test_lag(self):
+        # Left for a later run: an older row may still be uncommitted
+        self.answer(1, 1)
+        self.assertEqual(refresh_stats(), 0)
+        self.assertFalse(models.QuestionStats.objects.exists())
+
+
+@override_settings(STATS_REFRESH_LAG=-10)
+class ArchiveTests(GameFixtureMixin, TestCase):
+    """
+    archive_answers and its recovery from an interrupted chunk
+    """
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        super().setUp()
+        self.old_game, self.new_game = [
+            models.Game.objects.create(player=self.player, collection=self.collection)
+            for _ in range(2)
+        ]
+        for game in [self.old_game, self.new_game]:
+            for question in self.questions:
+                models.QuestionAnswer.objects.create(
+                    game=game, question=question, answer=1, correct=True
+                )
+        models.Game.objects.filter(pk=self.old_game.pk).update(
+            completed_datetime=timezone.now() - timedelta(days=100)
+        )
+
+    def archived(self):
+        return list(archive.iter_archived_answers(self.archive_dir))
+
+    def archive_answers(self, **kwargs):
+        return archive.archive_answers(days=90, archive_dir=self.archive_dir, **kwargs)
+
+    def test_archive(self):
+        self.assertEqual(self.archive_answers(chunk_size=2), 3)
+        self.assertEqual(
+            sorted(row["question_id"] for row in self.archived()),
+            sorted(question.pk for question in self.questions),
+        )
+        self.assertEqual(
+            {row["game_id"] for row in self.archived()}, {self.old_game.pk}
+        )
+        self.assertFalse(self.old_game.questionanswer_set.exists())
+        self.assertEqual(self.new_game.questionanswer_set.count(), 3)
+        # Counted before they were moved
+        self.assertEqual(models.CollectionStats.objects.get().answers_count, 6)
+        self.assertEqual(self.archive_answers(), 0)
+
+    def test_recover_writing(self):
+        # Interrupted while appending to the file of the month
+        answers = list(
+            self.old_game.questionanswer_set.values(
+                "id", "game_id", "question_id", "answer", "correct", "created_datetime"
+            )
+        )
+        archive.archive_chunk(self.archive_dir, answers[:1])
+        [path] = [
+            os.path.join(self.archive_dir, name)
+            for name in os.listdir(self.archive_dir)
+            if name.endswith(".gz")
+        ]
+        size = os.path.getsize(path)
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write('{"id": 1, "half')
+        ids = [a["id"] for a in answers[1:]]
+        archive.write_state(
+            self.archive_dir, {"phase": "writing", "ids": ids, "files": {path: size}}
+        )
+        archive.recover(self.archive_dir)
+        self.assertEqual(os.path.getsize(path), size)
+        self.assertIsNone(archive.read_state(self.archive_dir))
+        self.assertEqual(self.old_game.questionanswer_set.count(), 2)
+        self.archive_answers()
+        self.assertEqual(
+            sorted(row["id"] for row in self.archived()), [a["id"] for a in answers]
+        )
+
+    def test_recover_written(self):
+        # Interrupted after the files were written, before the delete
+        ids = list(self.old_game.questionanswer_set.values_list("id", flat=True))
+        archive.write_state(self.archive_dir, {"phase": "written", "ids": ids})
+        archive.recover(self.archive_dir)
+        self.assertFalse(self.old_game.questionanswer_set.exists())
+        self.assertIsNone(archive.read_state(self.archive_dir))
+
+
+class UploadTests(SimpleTestCase):
+    """
+    decode_data_url and StreamingUploadHandler: content, size and sha256
+    of the files, and UPLOAD_MAX_FILE_SIZE
+    """
+
+    def data_url(self, content, mime="image/png", line_length=None):
+        encoded = base64.b64encode(content).decode()
+        if line_length:
+            lines = range(0, len(encoded), line_length)
+            encoded = "\n".join(encoded[i : i + line_length] for i in lines)
+        return f"data:{mime};base64,{encoded}"
+
+    def test_decode(self):
+        # Around the chunk boundaries, with and without line breaks
+        chunk = DECODE_CHUNK_SIZE * 3 // 4
+        for size in [1, 2, 3, 100, chunk - 1, chunk, chunk + 1, chunk * 3 + 2]:
+            content = os.urandom(size)
+            for line_length in [None, 76]:
+                file = decode_data_url(self.data_url(content, line_length=line_length))
+                self.assertEqual(file.name, "image.png")
+                self.assertEqual(file.read(), content)
+                self.assertEqual(file.size, size)
+                self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+
+    def test_name(self):
+        self.assertIsNone(decode_data_url(""))
+        file = decode_data_url(self.data_url(b"abc", mime="audio/mp3"), "answer")
+        self.assertEqual(file.name, "answer.mp3")
+
+    def test_invalid(self):
+        with self.assertRaises(binascii.Error):
+            decode_data_url("data:image/png;base64,AAA")
+
+    @override_settings(UPLOAD_MAX_FILE_SIZE=1000)
+    def test_size_limit(self):
+        self.assertEqual(decode_data_url(self.data_url(b"x" * 1000)).size, 1000)
+        with self.assertRaises(RequestDataTooBig):
+            decode_data_url(self.data_url(b"x" * 1001))
+
+    def test_memory(self):
+        data_url = self.data_url(os.urandom(8 * 1024 * 1024))
+        tracemalloc.start()
+        decode_data_url(data_url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # A chunk at a time, the file only spooled in memory up to
+        # FILE_UPLOAD_MAX_MEMORY_SIZE
+        self.assertLess(peak, settings.FILE_UPLOAD_MAX_MEMORY_SIZE + 1024 * 1024)
+
+    def test_multipart(self):
+        content = os.urandom(300 * 1024)
+        request = RequestFactory().post(
+            "/", {"file": SimpleUploadedFile("video.mp4", content)}
+        )
+        file = request.FILES["file"]
+        self.assertTrue(hasattr(file, "temporary_file_path"))
+        self.assertEqual(file.size, len(content))
+        self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+
+    @override_settings(UPLOAD_MAX_FILE_SIZE=1000)
+    def test_multipart_size_limit(self):
+        request = RequestFactory().post(
+            "/", {"file": SimpleUploadedFile("video.mp4", b"x" * 1001)}
+        )
+        with self.assertRaises(RequestDataTooBig):
+            request.FILES
+
+
+class MediaTests(TestCase):
+    """
+    The reference counts of the content addressed media files
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.question = models.Question.objects.create(text="Question", correct=1)
+
+    def upload(self, question, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            question.audio_file = SimpleUploadedFile("sound.mp3", content)
+            question.save()
+        return question.audio_file.name
+
+    def refcounts(self):
+        return dict(models.MediaBlob.objects.values_list("name", "refcount"))
+
+    def test_same_content(self):
+        name = self.upload(self.question, b"sound")
+        self.assertEqual(self.upload(self.question, b"sound"), name)
+        self.assertEqual(self.upload(self.question, b"sound"), name)
+        self.assertEqual(self.refcounts(), {name: 1})
+        other = models.Question.objects.create(text="Other", correct=1)
+        self.assertEqual(self.upload(other, b"sound"), name)
+        self.assertEqual(self.refcounts(), {name: 2})
+
+    def test_replace(self):
+        old_name = self.upload(self.question, b"old sound")
+        new_name = self.upload(self.question, b"new sound")
+        self.assertEqual(self.refcounts(), {new_name: 1})
+        self.assertFalse(self.question.audio_file.storage.exists(old_name))
+        self.assertTrue(self.question.audio_file.storage.exists(new_name))
+        # A type change clears it
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.audio_file = None
+            self.question.save()
+        self.assertEqual(self.refcounts(), {})
+        self.assertEqual(self.question.question_type, "text")
+
+    def test_delete(self):
+        name = self.upload(self.question, b"sound")
+        other = models.Question.objects.create(text="Other", correct=1)
+        self.upload(other, b"sound")
+        storage = self.question.audio_file.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.delete()
+        self.assertEqual(self.refcounts(), {name: 1})
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(self.refcounts(), {})
+        self.assertFalse(storage.exists(name))
+
+    def test_rolled_back(self):
+        name = self.upload(self.question, b"sound")
+        other = models.Question.objects.create(text="Other", correct=1)
+        # The UPDATE of the row fails after the storage saved the file
+        with mock.patch.object(
+            models.Question, "_do_update", side_effect=IntegrityError
+        ), self.assertRaises(IntegrityError):
+            self.upload(other, b"sound")
+        self.assertEqual(self.refcounts(), {name: 1})
+        # A missing file is written again
+        self.question.audio_file.storage.delete(name)
+        self.upload(other, b"sound")
+        self.assertEqual(self.refcounts(), {name: 2})
+        self.assertTrue(self.question.audio_file.storage.exists(name))
+
+
+class TranslationTests(SimpleTestCase):
+    """
+    The staleness of the compiled catalogues
+    """
+
+    PO = 'msgid ""\nmsgstr ""\n"Language: fr\\n"\n\nmsgid "Yes"\nmsgstr "Oui"\n'
+
+    def setUp(self):
+        locale_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, locale_dir)
+        os.makedirs(os.path.join(locale_dir, "fr", "LC_MESSAGES"))
+        self.po_path = os.path.join(locale_dir, "fr", "LC_MESSAGES", "django.po")
+        with open(self.po_path, "w", encoding="utf-8") as f:
+            f.write(self.PO)
+        settings_override = override_settings(LOCALE_PATHS=[locale_dir])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_committed_catalogues(self):
+        locale_dir = os.path.join(settings.BASE_DIR, "locale")
+        with override_settings(LOCALE_PATHS=[locale_dir]):
+            po_paths = list(i18n.get_po_paths())
+            self.assertTrue(po_paths)
+            self.assertFalse(any(i18n.is_stale(path) for path in po_paths))
+
+    def test_stale(self):
+        self.assertTrue(i18n.is_stale(self.po_path))
+        self.assertEqual(i18n.compile_catalogues(), [self.po_path[:-3] + ".mo"])
+        self.assertFalse(i18n.is_stale(self.po_path))
+        with open(self.po_path[:-3] + ".mo", "rb") as f:
+            self.assertEqual(i18n.gettext.GNUTranslations(f).gettext("Yes"), "Oui")
+        # As a checkout leaves it
+        os.utime(self.po_path, (0, 2**31 - 1))
+        self.assertFalse(i18n.is_stale(self.po_path))
+        self.assertEqual(i18n.compile_catalogues(), [])
+        with open(self.po_path, "a", encoding="utf-8") as f:
+            f.write('\nmsgid "No"\nmsgstr "Non"\n')
+        self.assertTrue(i18n.is_stale(self.po_path))
+
+    def test_check(self):
+        with self.assertRaisesMessage(CommandError, self.po_path[:-3] + ".mo"):
+            call_command("compile_translations", check=True)
+        # Not written
+        self.assertTrue(i18n.is_stale(self.po_path))
+        call_command("compile_translations", stdout=io.StringIO())
+        call_command("compile_translations", check=True)
+
+    def test_lazy(self):
+        """
+        Nothing is compiled or loaded at startup, a language is loaded by
+        its first request
+        """
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import django; django.setup();"
+                "from django.utils.translation import trans_real;"
+                "print(*trans_real._translations)",
+            ],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        # At most the default one, by a translation evaluated at import
+        self.assertLessEqual(set(result.stdout.split()), {settings.LANGUAGE_CODE})
+
+
+@override_settings(STATS_REFRESH_LAG=-10)
+class PackedGameTests(GameFixtureMixin, TestCase):
+    """
+    pack_game and unpack_game keep the answers, and the statistics count
+    every answer once
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.game = models.Game.objects.create(
+            player=self.player, collection=self.collection
+        )
+
+    def answer(self, question, answer):
+        record_answers(self.game, [{"questionId": question.pk, "answer": answer}])
+
+    def get_answers(self):
+        return sorted(
+            self.game.questionanswer_set.values_list("question_id", "answer", "correct")
+        )
+
+    def get_times(self):
+        return sorted(
+            self.game.questionanswer_set.values_list("created_datetime", flat=True)
+        )
+
+    def get_totals(self):
+        stats = models.CollectionStats.objects.get()
+        return stats.answers_count, stats.correct_count
+
+    def test_round_trip(self):
+        self.answer(self.questions[0], 1)
+        self.answer(self.questions[1], 2)
+        answers = self.get_answers()
+        times = self.get_times()
+        refresh_stats()
+        self.game = pack_game(self.game)
+        self.assertEqual(self.game.answer_storage, "packed")
+        self.assertFalse(self.game.questionanswer_set.exists())
+        self.game = unpack_game(self.game)
+        self.assertEqual(self.game.answer_storage, "rows")
+        self.assertEqual(self.get_answers(), answers)
+        # Kept to the millisecond
+        restored = self.get_times()
+        for before, after in zip(times, restored):
+            self.assertLess(abs(after - before), timedelta(milliseconds=1))
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.answered_count, self.game.score), (2, 1))
+
+    def test_not_counted(self):
+        self.answer(self.questions[0], 1)
+        with self.assertRaises(AnswersNotCounted):
+            pack_game(self.game)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.answer_storage, "rows")
+        self.assertEqual(self.game.questionanswer_set.count(), 1)
+
+    def test_stats(self):
+        self.answer(self.questions[0], 1)
+        self.answer(self.questions[1], 2)
+        refresh_stats()
+        self.game = pack_game(self.game)
+        # Recorded in the packed representation, not counted yet
+        self.answer(self.questions[2], 1)
+        self.game = unpack_game(self.game)
+        self.assertEqual(
+            sorted(self.game.questionanswer_set.values_list("question_id", "counted")),
+            [(question.pk, i < 2) for i, question in enumerate(self.questions)],
+        )
+        self.assertEqual(refresh_stats(), 1)
+        self.assertEqual(self.get_totals(), (3, 2))
+        # Packed and unpacked again: still counted once
+        self.game = unpack_game(pack_game(self.game))
+        refresh_stats()
+        self.assertEqual(self.get_totals(), (3, 2))
+        question_stats = models.QuestionStats.objects.get(question=self.questions[0])
+        self.assertEqual(question_stats.answers_count, 1)
+
+
+LEAN_API_SCRIPT = """
+import json, sys
+from wsgiref.util import setup_testing_defaults
+
+from milgame.wsgi_lean import application
+from django.apps import apps
+
+
+def get(path):
+    environ = {"PATH_INFO": path}
+    setup_testing_defaults(environ)
+    statuses = []
+    body = b"".join(application(environ, lambda status, _: statuses.append(status)))
+    return statuses[0], body.decode()
+
+
+json.dump(
+    {
+        "admin": apps.is_installed("django.contrib.admin"),
+        "welcome": get("/api/welcome/"),
+    },
+    sys.stdout,
+)
+"""
+
+
+class LeanApiTests(SimpleTestCase):
+    """
+    milgame/wsgi_lean.py, in a fresh process (the settings are read once)
+    """
+
+    def test_serves_api(self):
+        environ = {k: v for k, v in os.environ.items() if k != "MILGAME_LEAN_API"}
+        result = subprocess.run(
+            [sys.executable, "-c", LEAN_API_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=environ,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        output = json.loads(result.stdout)
+        self.assertFalse(output["admin"])
+        status, body = output["welcome"]
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(json.loads(body)["template"], "WelcomeView")
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        self.player = models.Player.objects.create(name="player", password="password")
+
+    def get_store(self, session_key=None):
+        return import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+
+    def test_logout(self):
+        log_in(self.client, self.player)
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.get("/api/logout/")
+        self.assertFalse(self.get_store().exists(session_key))
+        # The old cookie doesn't log in anymore
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        self.assertEqual(self.client.get("/api/").json()["navigate"], "/welcome/")
+
+    def test_login(self):
+        session = self.get_store()
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        authenticate = mock.patch.object(
+            views, "authenticate_player", return_value=(self.player, False)
+        )
+        with authenticate:
+            self.client.post(
+                "/api/welcome/",
+                json.dumps({"data": {"name": "player", "password": "password"}}),
+                content_type="application/json",
+            )
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertNotEqual(session_key, session.session_key)
+        self.assertEqual(self.get_store(session_key)["PLAYER_ID"], self.player.pk)
+
+    def test_signed_cookies_secret_key(self):
+        def import_settings(**env):
+            return subprocess.run(
+                [sys.executable, "-c", "import milgame.settings"],
+                env={**os.environ, "MILGAME_SESSION_BACKEND": "signed_cookies", **env},
+                capture_output=True,
+                text=True,
+            )
+
+        environ = {k: v for k, v in os.environ.items() if k != "MILGAME_SECRET_KEY"}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            result = import_settings()
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("ImproperlyConfigured", result.stderr)
+        self.assertEqual(import_settings(MILGAME_SECRET_KEY="secret").returncode, 0)
+
+
+@override_settings(PLAYER_PASSWORD_ITERATIONS=1000)
+class PlayerTests(TestCase):
+    """
+    Player passwords, registration and the login throttling
+    """
+
+    def setUp(self):
+        login_rate_limiter.buckets.clear()
+
+    def log_in(self, name, password, **headers):
+        return self.client.post(
+            "/api/welcome/",
+            json.dumps({"data": {"name": name, "password": password}}),
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_hasher(self):
+        encoded = hash_player_password("secret")
+        self.assertTrue(encoded.startswith("player_pbkdf2_sha256$1000$"))
+        player = models.Player.objects.create(name="player", password=encoded)
+        self.assertTrue(check_player_password(player, "secret"))
+        self.assertFalse(check_player_password(player, "wrong"))
+
+    def test_upgrade(self):
+        # Stored in plaintext, or with other settings: rehashed on login
+        for password in ["secret", make_password("secret", hasher="pbkdf2_sha256")]:
+            player = models.Player.objects.create(
+                name=f"player{models.Player.objects.count()}", password=password
+            )
+            self.assertTrue(check_player_password(player, "secret"))
+            player.refresh_from_db()
+            self.assertTrue(player.password.startswith("player_pbkdf2_sha256$1000$"))
+        player = models.Player.objects.create(name="plain", password="secret")
+        self.assertFalse(check_player_password(player, "wrong"))
+        player.refresh_from_db()
+        self.assertEqual(player.password, "secret")
+
+    def test_authenticate(self):
+        player, created = authenticate_player("player", "secret")
+        self.assertTrue(created)
+        self.assertEqual(authenticate_player("player", "secret"), (player, False))
+        self.assertEqual(authenticate_player("player", "wrong"), (None, False))
+        self.assertEqual(models.Player.objects.count(), 1)
+
+    def test_unique_name(self):
+        models.Player.objects.create(name="player", password="secret")
+        with self.assertRaises(IntegrityError):
+            models.Player.objects.create(name="player", password="other")
+
+    def test_concurrent_registration(self):
+        # Registered by another request between the lookup and the insert
+        models.Player.objects.create(
+            name="player", password=hash_player_password("secret")
+        )
+        original = models.Player.objects.filter
+        lookups = []
+
+        def filter(*args, **kwargs):
+            lookups.append(kwargs)
+            if len(lookups) == 1:
+                return original(pk=None)
+            return original(*args, **kwargs)
+
+        with mock.patch.object(models.Player.objects, "filter", filter):
+            player, created = authenticate_player("player", "secret")
+        self.assertFalse(created)
+        self.assertEqual(player.name, "player")
+        self.assertEqual(models.Player.objects.count(), 1)
+
+    def test_legacy_duplicates(self):
+        first = models.Player.objects.create(name="player", password="first")
+        second = models.Player.objects.create(
+            name="player", password="second", legacy_duplicate=True
+        )
+        self.assertEqual(authenticate_player("player", "second"), (second, False))
+        self.assertEqual(authenticate_player("player", "first"), (first, False))
+
+    def create_player(self):
+        models.Player.objects.create(
+            name="player", password=hash_player_password("secret")
+        )
+
+    def test_throttled(self):
+        self.create_player()
+        statuses = [
+            self.log_in("player", "wrong", REMOTE_ADDR="10.0.0.1").status_code
+            for _ in range(11)
+        ]
+        self.assertEqual(statuses, [200] * 10 + [429])
+        # The same client on another name
+        response = self.log_in("other", "secret", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 429)
+        # The owner of the name, from elsewhere, isn't locked out
+        response = self.log_in("player", "secret", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.json()["navigate"], "/")
+
+    def test_forwarded_for(self):
+        # Without a trusted proxy, X-Forwarded-For changes nothing
+        self.create_player()
+        statuses = [
+            self.log_in(
+                "player",
+                "wrong",
+                REMOTE_ADDR="10.0.0.1",
+                HTTP_X_FORWARDED_FOR=f"1.1.1.{i}",
+            ).status_code
+            for i in range(11)
+        ]
+        self.assertEqual(statuses[-1], 429)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_trusted_proxy(self):
+        # The client's own X-Forwarded-For hops come before the proxy's one
+        self.create_player()
+
+        def log_in(spoofed):
+            return self.log_in(
+                "player",
+                "wrong",
+                REMOTE_ADDR="10.0.0.1",
+                HTTP_X_FORWARDED_FOR=f"{spoofed}, 192.0.2.1",
+            ).status_code
+
+        statuses = [log_in(f"1.1.1.{i}") for i in range(11)]
+        self.assertEqual(statuses[-1], 429)
+        # Another client behind the same proxy
+        response = self.log_in(
+            "player", "wrong", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="192.0.2.2"
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("main.ratelimit.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_consume(self):
+        bucket = TokenBucket(capacity=3, rate=0.5)
+        self.assertEqual([bucket.consume("a") for _ in range(4)], [True] * 3 + [False])
+        # Per key
+        self.assertTrue(bucket.consume("b"))
+        self.now += 2
+        self.assertEqual([bucket.consume("a") for _ in range(2)], [True, False])
+        self.now += 100
+        # Back to the capacity, no more
+        self.assertEqual([bucket.consume("a") for _ in range(4)], [True] * 3 + [False])
+
+    def test_prune(self):
+        bucket = TokenBucket(capacity=2, rate=1, max_keys=2)
+        bucket.consume("a")
+        self.now += 5
+        bucket.consume("b")
+        bucket.consume("c")
+        # "a" is full again: dropped
+        self.assertEqual(set(bucket.buckets), {"b", "c"})
+
+
+class GameEventsTests(GameFixtureMixin, TestCase):
+    """
+    The event stream of a solo game, through the ASGI application
+    """
+
+    question_count = 2
+
+    def setUp(self):
+        super().setUp()
+        self.game = start_game(self.player, self.collection)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={create_session(self.player)}"
+        self.channel = game_channel(self.game.pk)
+
+    async def connect(self, cookie=None):
+        stream = ApplicationCommunicator(
+            events.game_events_application,
+            {
+                "type": "http",
+                "method": "GET",
+                "path": f"/api/simple-game/{self.collection.pk}/events/",
+                "headers": [
+                    (b"host", b"testserver"),
+                    (b"cookie", (cookie or self.cookie).encode()),
+                ],
+            },
+        )
+        await stream.send_input({"type": "http.request", "body": b""})
+        return stream
+
+    async def receive_event(self, stream):
+        output = await stream.receive_output(1)
+        self.assertEqual(output["type"], "http.response.body")
+        event, data = output["body"].decode().split("\n", 1)
+        self.assertTrue(data.startswith("data: ") and data.endswith("\n\n"))
+        return event.removeprefix("event: "), json.loads(data[len("data: ") :])
+
+    def answer(self, question, answer):
+        # Published on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            record_answers(self.game, [{"questionId": question.pk, "answer": answer}])
+
+    async def test_stream(self):
+        stream = await self.connect()
+        start = await stream.receive_output(1)
+        self.assertEqual(start["status"], 200)
+        self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+        self.assertEqual((await stream.receive_output(1))["body"], b"retry: 3000\n\n")
+        event, data = await self.receive_event(stream)
+        self.assertEqual(
+            (event, data["index"], data["text"]), ("question", 1, "Question 0")
+        )
+        self.assertIn(self.channel, get_broker().subscriptions)
+
+        await sync_to_async(self.answer)(self.questions[0], 1)
+        self.assertEqual(
+            await self.receive_event(stream),
+            (
+                "answer",
+                {
+                    "questionId": self.questions[0].pk,
+                    "correctAnswer": 1,
+                    "correct": True,
+                },
+            ),
+        )
+        event, data = await self.receive_event(stream)
+        self.assertEqual(
+            (event, data["index"], data["text"]), ("question", 2, "Question 1")
+        )
+
+        await stream.send_input({"type": "http.disconnect"})
+        await stream.wait(1)
+        self.assertNotIn(self.channel, get_broker().subscriptions)
+
+    async def test_results(self):
+        stream = await self.connect()
+        for _ in range(3):
+            await stream.receive_output(1)
+        events = []
+        for question, answer in [(self.questions[0], 1), (self.questions[1], 2)]:
+            await sync_to_async(self.answer)(question, answer)
+            events += [(await self.receive_event(stream))[0] for _ in range(2)]
+        self.assertEqual(events, ["answer", "question", "answer", "results"])
+        # The end of the stream
+        self.assertEqual(
+            await stream.receive_output(1),
+            {"type": "http.response.body", "body": b""},
+        )
+        await stream.wait(1)
+        self.assertNotIn(self.channel, get_broker().subscriptions)
+
+    async def test_unauthorized(self):
+        stream = await self.connect(cookie=f"{settings.SESSION_COOKIE_NAME}=nope")
+        self.assertEqual((await stream.receive_output(1))["status"], 401)
+        await stream.wait(1)
+
+
+class RoomTests(GameFixtureMixin, TestCase):
+    """
+    Live rooms, through the WebSocket application
+    """
+
+    question_count = 2
+    player_name = "host"
+
+    def setUp(self):
+        super().setUp()
+        self.host = self.player
+        self.alice, self.bob = [
+            models.Player.objects.create(name=name, password="password")
+            for name in ["alice", "bob"]
+        ]
+        self.room = models.Room.objects.create(
+            code="ROOM", collection=self.collection, host=self.host
+        )
+        self.session_keys = {
+            player: create_session(player)
+            for player in [self.host, self.alice, self.bob]
+        }
+        self.sockets = []
+
+    async def asyncTearDown(self):
+        for socket in self.sockets:
+            await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+            await socket.wait(1)
+
+    async def connect(self, player):
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.session_keys[player]}"
+        socket = ApplicationCommunicator(
+            rooms.websocket_application,
+            {
+                "type": "websocket",
+                "path": f"/ws/rooms/{self.room.code}/",
+                "headers": [(b"cookie", cookie.encode())],
+            },
+        )
+        self.sockets.append(socket)
+        await socket.send_input({"type": "websocket.connect"})
+        self.assertEqual((await socket.receive_output(1))["type"], "websocket.accept")
+        return socket
+
+    async def send(self, socket, **message):
+        await socket.send_input(
+            {"type": "websocket.receive", "text": json.dumps(message)}
+        )
+
+    async def receive(self, socket, message_type):
+        # Skipping the others ("stats"...)
+        while True:
+            output = await socket.receive_output(1)
+            self.assertEqual(output["type"], "websocket.send")
+            message = json.loads(output["text"])
+            if message["type"] == message_type:
+                return message
+
+    async def answer(self, socket, question, answer):
+        await self.send(socket, type="answer", questionId=question.pk, answer=answer)
+        return (await self.receive(socket, "answer"))["status"]
+
+    async def test_game(self):
+        # Joins before the host: loaded from the Game rows
+        alice = await self.connect(self.alice)
+        host = await self.connect(self.host)
+        bob = await self.connect(self.bob)
+        await self.send(host, type="next")
+        for socket in [alice, bob]:
+            self.assertEqual((await self.receive(socket, "question"))["index"], 1)
+        self.assertEqual(await self.answer(alice, self.questions[0], 1), "recorded")
+        self.assertEqual(await self.answer(bob, self.questions[0], 2), "recorded")
+        self.assertEqual(await self.answer(bob, self.questions[0], 1), "duplicate")
+        await self.send(host, type="next")
+        results = await self.receive(alice, "results")
+        self.assertEqual(results["counts"], [1, 1, 0, 0])
+        self.assertEqual((await self.receive(alice, "question"))["index"], 2)
+        self.assertEqual(await self.answer(alice, self.questions[1], 1), "recorded")
+        self.assertEqual(await self.answer(bob, self.questions[0], 1), "invalid")
+        await self.send(host, type="finish")
+        finished = await self.receive(bob, "finished")
+        self.assertEqual(
+            [(row["player_name"], row["score"]) for row in finished["scores"]],
+            [("alice", 2), ("bob", 0)],
+        )
+        output = await bob.receive_output(1)
+        self.assertEqual(output, {"type": "websocket.close", "code": 1000})
+
+        await sync_to_async(self.room.refresh_from_db)()
+        self.assertIsNotNone(self.room.finished_datetime)
+        games = await sync_to_async(list)(
+            models.Game.objects.filter(room=self.room).values_list(
+                "player__name", "answered_count", "score"
+            )
+        )
+        self.assertEqual(sorted(games), [("alice", 2, 2), ("bob", 1, 0)])
+        answers = models.QuestionAnswer.objects.filter(game__room=self.room)
+        self.assertEqual(await answers.acount(), 3)
+
+    async def test_invalid_answers(self):
+        host = await self.connect(self.host)
+        alice = await self.connect(self.alice)
+        await self.send(host, type="next")
+        await self.receive(alice, "question")
+        for answer in [2.0, True, 0, 5, "1", None]:
+            self.assertEqual(
+                await self.answer(alice, self.questions[0], answer), "invalid"
+            )
+        self.assertEqual(await self.answer(alice, self.questions[0], 2), "recorded")
+        await self.send(host, type="next")
+        results = await self.receive(alice, "results")
+        self.assertEqual(results["counts"], [0, 1, 0, 0])
+        self.assertEqual((await self.receive(alice, "question"))["index"], 2)
+
+    @override_settings(ROOM_HOST_TIMEOUT=0.2)
+    async def test_host_gone(self):
+        host = await self.connect(self.host)
+        alice = await self.connect(self.alice)
+        await self.send(host, type="next")
+        await self.receive(alice, "question")
+        self.assertEqual(await self.answer(alice, self.questions[0], 1), "recorded")
+        await host.send_input({"type": "websocket.disconnect", "code": 1001})
+        await host.wait(1)
+        self.sockets.remove(host)
+        # Finished by the runner
+        await self.receive(alice, "finished")
+        await sync_to_async(self.room.refresh_from_db)()
+        self.assertIsNotNone(self.room.finished_datetime)
+        self.assertNotIn(self.room.code, rooms.runners)
+        self.assertEqual(
+            await models.QuestionAnswer.objects.filter(game__room=self.room).acount(), 1
+        )
+
+    @override_settings(ROOM_FLUSH_SIZE=1)
+    async def test_failed_flush(self):
+        host = await self.connect(self.host)
+        alice = await self.connect(self.alice)
+        await self.send(host, type="next")
+        await self.receive(alice, "question")
+        original = rooms.write_answers
+        calls = []
+
+        def write_answers(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise RuntimeError("The database is down")
+            return original(*args)
+
+        with mock.patch.object(rooms, "write_answers", write_answers):
+            with self.assertLogs("main.rooms", "ERROR") as logs:
+                status = await self.answer(alice, self.questions[0], 1)
+                self.assertEqual(status, "recorded")
+                # Flushed once replied, logged once the write failed
+                while not logs.records:
+                    await asyncio.sleep(0.01)
+            # Kept, and written with the end of the room
+            await self.send(host, type="finish")
+            await self.receive(alice, "finished")
+        answer = await models.QuestionAnswer.objects.filter(game__room=self.room).aget()
+        self.assertEqual(answer.question_id, self.questions[0].pk)
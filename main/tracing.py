@@ -0,0 +1,76 @@
+"""
+Debug tracing of the framework's walkers, on the "main.tracing" logger.
+
+Spans (with tracing.span(...)) log their duration, their fields and their
+parent span; events log a point within the current span. Both only do
+work when the logger is enabled for DEBUG (MILGAME_TRACE=1 in the
+settings): otherwise span() returns a shared no-op context manager, and
+the loops check is_enabled() before building an event's fields.
+
+TraceFormatter writes a record as a JSON line.
+"""
+import contextlib
+import contextvars
+import itertools
+import json
+import logging
+import time
+
+logger = logging.getLogger("main.tracing")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+NULL_SPAN = contextlib.nullcontext()
+
+
+def is_enabled():
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+def event(name, **fields):
+    if is_enabled():
+        logger.debug(
+            name, extra={"trace": {"event": name, "span_id": _current_span.get(), **fields}}
+        )
+
+
+@contextlib.contextmanager
+def _span(name, fields):
+    span_id = next(_span_ids)
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+        duration_ms = (time.perf_counter() - started) * 1000
+        logger.debug(
+            "%s %.3f ms",
+            name,
+            duration_ms,
+            extra={
+                "trace": {
+                    "span": name,
+                    "span_id": span_id,
+                    "parent_id": parent_id,
+                    "duration_ms": round(duration_ms, 3),
+                    **fields,
+                }
+            },
+        )
+
+
+def span(name, **fields):
+    if not is_enabled():
+        return NULL_SPAN
+    return _span(name, fields)
+
+
+class TraceFormatter(logging.Formatter):
+    def format(self, record):
+        trace = getattr(record, "trace", None)
+        if trace is None:
+            return super().format(record)
+        return json.dumps({"time": record.created, **trace}, default=repr)
@@ -0,0 +1,85 @@
+"""
+Uploads of question media without holding the files in memory:
+
+- StreamingUploadHandler (FILE_UPLOAD_HANDLERS) writes every multipart
+  file straight to a temporary file
+- decode_data_url() decodes a base64 data URL (Image2Field) chunk by chunk
+  into a temporary file, instead of decoding it whole
+
+Both enforce UPLOAD_MAX_FILE_SIZE as the data comes, and set the sha256
+hex digest of the content on the file (file.sha256).
+"""
+import base64
+import hashlib
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+# base64 characters decoded at a time (a multiple of 4)
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+def check_size(size):
+    if size > settings.UPLOAD_MAX_FILE_SIZE:
+        raise RequestDataTooBig(
+            f"Uploaded file is larger than {settings.UPLOAD_MAX_FILE_SIZE} bytes"
+        )
+
+
+class StreamingUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        check_size(self.size)
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+def decode_data_url(data, name=None):
+    """
+    "data:image/png;base64,..." as a File named "<name>.png", or None when
+    data is empty
+    """
+    if not data:
+        return None
+    # No split(): it would copy the whole payload
+    separator = data.index(";base64,")
+    _name, ext = data[:separator].split("/")
+    if not name:
+        name = _name.split(":")[-1]
+    start = separator + len(";base64,")
+
+    file = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    sha256 = hashlib.sha256()
+    size = 0
+    pending = ""
+    for offset in range(start, len(data), DECODE_CHUNK_SIZE):
+        # Without whitespace, which would shift the 4 character groups
+        chunk = "".join((pending + data[offset : offset + DECODE_CHUNK_SIZE]).split())
+        usable = len(chunk) - len(chunk) % 4
+        pending = chunk[usable:]
+        decoded = base64.b64decode(chunk[:usable])
+        size += len(decoded)
+        check_size(size)
+        sha256.update(decoded)
+        file.write(decoded)
+    if pending:
+        # Not a whole group: raises binascii.Error, as b64decode of the whole
+        base64.b64decode(pending)
+    file.seek(0)
+    result = File(file, name="{}.{}".format(name, ext))
+    result.size = size
+    result.sha256 = sha256.hexdigest()
+    return result
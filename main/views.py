@@ -1,16 +1,56 @@
+import functools
+import hashlib
 import json
-from django.contrib.postgres.aggregates import ArrayAgg
+from django.conf import settings
+from django.core.cache import cache
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
-from django.db.models import Q, Max
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.decorators import method_decorator
-from logicore_django_react_pages.views import ApiView, JsonResponse
-from .framework import read_fields, write_fields
+from django.utils.http import quote_etag
+from logicore_django_react_pages.views import ApiView
+from .framework import (
+    apply_model_to_fields,
+    compile_validator,
+    read_fields,
+    write_fields,
+)
+from .game import (
+    get_correct_answers,
+    get_leaderboard,
+    get_question_data,
+    record_answers,
+    start_game,
+)
+from .game_state import get_game_state
+from .i18n import per_language
+from .players import authenticate_player, login_allowed
+from .response_cache import get_cache_key, get_or_compute
+from .responses import JsonResponse, dumps
 from django.utils import timezone
+from django.utils.crypto import get_random_string
 from . import models
 from django.utils.translation import gettext_lazy as _
 
 
+def get_user_data(request):
+    if request.user.is_anonymous:
+        return None
+    return {
+        "id": request.user.id,
+        "username": request.user.username,
+        "first_name": request.user.first_name,
+        "last_name": request.user.last_name,
+        "email": request.user.email,
+    }
+
+
+def get_events_url(collection):
+    return f"/api/simple-game/{collection.pk}/events/"
+
+
 class MainView(ApiView):
     def dispatch(self, request, *args, **kwargs):
         self.player = None
@@ -19,9 +59,79 @@ class MainView(ApiView):
             self.player = models.Player.objects.filter(pk=int(player_id)).first()
         return super().dispatch(request, *args, **kwargs)
 
+    # Declarative response cache, see main/response_cache.py
+    response_cache_vary = None
+    response_cache_timeout = 60
+    # Most queries a request may run, or {method: queries},
+    # see main/instrumentation.py
+    query_budget = None
+
+    def get(self, request, *args, **kwargs):
+        # As ApiView.get, with the faster JSON encoding,
+        # a 304 when the version of the page hasn't changed
+        # and the response cache
+        version = self.get_version(request, *args, **kwargs)
+        etag = self.get_etag(request, version)
+        if etag:
+            response = get_conditional_response(request, etag=etag)
+            if response:
+                return self.set_etag(response, etag)
+        if self.response_cache_vary is None:
+            content = dumps(self.get_response_data(request, *args, **kwargs))
+        else:
+            content = get_or_compute(
+                get_cache_key(self, request, version),
+                lambda: dumps(self.get_response_data(request, *args, **kwargs)),
+                self.response_cache_timeout,
+            )
+        response = HttpResponse(content, content_type="application/json")
+        return self.set_etag(response, etag)
+
+    def get_response_data(self, request, *args, **kwargs):
+        data = {
+            "title": self.title,
+            "wrapper": self.WRAPPER,
+            "template": self.TEMPLATE,
+            "user": get_user_data(request),
+        }
+        data.update(self.get_data(request, *args, **kwargs))
+        return data
+
     def get_data(self, request, *args, **kwargs):
         return {"player_name": self.player.name if self.player else None}
 
+    def get_version(self, request, *args, **kwargs):
+        """
+        Something cheaper than get_data() that changes whenever its result
+        would, or None if the page can't be cached
+        """
+        return None
+
+    def get_etag(self, request, version):
+        """
+        The ETag of a version, for this player, user and language. No
+        Last-Modified: a version isn't a date that only moves forward
+        (deleting the newest collection lowers the latest modified_datetime)
+        and HTTP dates are whole seconds
+        """
+        if version is None:
+            return None
+        key = (
+            self.__class__.__name__,
+            request.LANGUAGE_CODE,
+            self.player.pk if self.player else None,
+            request.user.pk,
+            version,
+        )
+        return quote_etag(hashlib.md5(repr(key).encode()).hexdigest())
+
+    def set_etag(self, response, etag):
+        if etag:
+            response["ETag"] = etag
+            # Cached by the browser, checked every time
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 
 class Error404ApiView(MainView):
     in_menu = False
@@ -29,45 +139,84 @@ class Error404ApiView(MainView):
     title = "Error: Page not found"
     WRAPPER = "MainWrapper"
     TEMPLATE = "PageNotFound"
+    response_cache_vary = ("language",)
+    response_cache_timeout = 60 * 60
 
     def get_data(self, request, *args, **kwargs):
         return {}
 
 
+@per_language
+def get_welcome_fields():
+    return {
+        "type": "Fields",
+        "fields": [
+            {"type": "TextField", "k": "name", "label": _("name").capitalize()},
+            {
+                "type": "TextField",
+                "k": "password",
+                "label": _("password").capitalize(),
+                "subtype": "password",
+            },
+        ],
+    }
+
+
+@per_language
+def get_welcome_notifications():
+    return {
+        "missing": {"type": "danger", "text": _("Please enter a name and a password")},
+        "throttled": {
+            "type": "warning",
+            "text": _("Too many attempts, please try again later"),
+        },
+        "wrong_password": {"type": "danger", "text": _("Wrong password")},
+        "logged_in": {"type": "success", "text": _("Logged in")},
+    }
+
+
 class WelcomeView(MainView):
     url_name = "home"
     url_path = "/welcome/"
     WRAPPER = "MainWrapper"
     TEMPLATE = "WelcomeView"
     title = "Home"
+    response_cache_vary = ("player", "language")
+    response_cache_timeout = 60 * 60
 
     def get_data(self, request, *args, **kwargs):
         return {
             **super().get_data(request, *args, **kwargs),
-            "fields": {
-                "type": "Fields",
-                "fields": [
-                    {"type": "TextField", "k": "name", "label": _("name").capitalize()},
-                    {
-                        "type": "TextField",
-                        "k": "password",
-                        "label": _("password").capitalize(),
-                        "subtype": "password",
-                    },
-                ],
-            },
+            "fields": get_welcome_fields(),
             "submitButtonWidget": "WelcomeSubmit",
         }
 
     def post(self, request, *args, **kwargs):
         if not self.player:
             data = json.loads(request.body)["data"]
-            player, created = models.Player.objects.get_or_create(**data)
+            name = (data.get("name") or "").strip()
+            password = data.get("password") or ""
+            if not name or not password:
+                return JsonResponse(
+                    {"notification": get_welcome_notifications()["missing"]}
+                )
+            if not login_allowed(request, name):
+                return JsonResponse(
+                    {"notification": get_welcome_notifications()["throttled"]},
+                    status=429,
+                )
+            player, created = authenticate_player(name, password)
+            if not player:
+                return JsonResponse(
+                    {"notification": get_welcome_notifications()["wrong_password"]}
+                )
+            # A new session key: one set before the login isn't trusted
+            request.session.cycle_key()
             request.session["PLAYER_ID"] = player.pk
         return JsonResponse(
             {
                 "navigate": "/",
-                "notification": {"type": "success", "text": _("Logged in")},
+                "notification": get_welcome_notifications()["logged_in"],
             }
         )
 
@@ -78,6 +227,19 @@ class HomeView(MainView):
     WRAPPER = "MainWrapper"
     TEMPLATE = "HomeView"
     title = "Home"
+    response_cache_vary = ("player", "language", "version")
+    query_budget = 5
+
+    def get_version(self, request, *args, **kwargs):
+        if not self.player:
+            return None
+        collections = models.Collection.objects.aggregate(
+            modified=Max("modified_datetime"), count=Count("pk")
+        )
+        games = models.Game.objects.filter(player=self.player).aggregate(
+            created=Max("created_datetime"), count=Count("pk")
+        )
+        return (*collections.values(), *games.values())
 
     def get_data(self, request, *args, **kwargs):
         if not self.player:
@@ -115,8 +277,8 @@ class LogoutView(MainView):
     title = "Home"
 
     def get_data(self, request, *args, **kwargs):
-        if request.session.get("PLAYER_ID", None):
-            del request.session["PLAYER_ID"]
+        # Deletes the stored session: its cookie is no longer valid
+        request.session.flush()
         return {"navigate": "/welcome/"}
 
 
@@ -126,14 +288,13 @@ class SimpleGameView(MainView):
     WRAPPER = "MainWrapper"
     TEMPLATE = None
     title = "Welcome to the game"
+    # Starting a game, answering its last question
+    query_budget = {"GET": 9, "POST": 12}
 
     def get_data(self, request, *args, **kwargs):
         if not self.player:
             return {"navigate": "/welcome/"}
         
-        if "GAME_STATE" in request.session:
-            del request.session["GAME_STATE"]
-        
         collection = models.Collection.objects.filter(id=self.kwargs["id"]).first()
         if not collection:
             return {"template": "PageNotFound"}
@@ -145,46 +306,87 @@ class SimpleGameView(MainView):
                 finished=False,
             )
         except models.Game.DoesNotExist:
-            game = models.Game.objects.create(
+            game = start_game(self.player, collection)
+
+        return self.get_progress_data(game, collection, request.build_absolute_uri)
+
+    def get_version(self, request, *args, **kwargs):
+        # A game not started yet is started by get_data()
+        if not self.player:
+            return None
+        return self.get_game_version_queryset().first()
+
+    def get_game_version_queryset(self):
+        # The progress of the game, the last change to the collection
+        # (see main/signals.py) and to its leaderboard
+        return (
+            models.Game.objects.filter(
                 player=self.player,
-                collection=collection,
+                collection_id=self.kwargs["id"],
                 finished=False,
             )
-
-        answered_ids = game.questionanswer_set.values_list("question_id", flat=True)
-        unanswered = (
-            collection.question_set.filter(~Q(pk__in=answered_ids))
-            .order_by("order")
+            .annotate(
+                leaderboard_modified=Subquery(
+                    models.LeaderboardEntry.objects.filter(
+                        collection_id=OuterRef("collection_id")
+                    )
+                    .order_by("-modified_datetime")
+                    .values("modified_datetime")[:1]
+                )
+            )
+            .values_list(
+                "pk",
+                "answered_count",
+                "modified_datetime",
+                "collection__modified_datetime",
+                "leaderboard_modified",
+            )
         )
+
+    def get_progress_data(self, game, collection, build_absolute_uri):
+        """
+        The current question of the game, or its results
+        (also pushed to the game's event stream, see main/events.py)
+        """
+        if game.completed_datetime:
+            return self.get_results_data(game, collection)
+
+        correct_answers = get_correct_answers(collection.pk)
+        state = get_game_state(game)
+        unanswered = state.unanswered_questions(collection, correct_answers)
         
         if unanswered.exists():
             question = unanswered.first()
-            total = collection.question_set.count()
+            total = state.question_count(correct_answers)
             data = {
                 "template": "Game",
                 "player_name": self.player.name,
                 "name": collection.name,
                 "index": total - unanswered.count() + 1,
                 "total": total,
-                "pk": question.pk,
-                "text": question.text,
-                "answer1": question.answer1,
-                "answer2": question.answer2,
-                "answer3": question.answer3,
-                "answer4": question.answer4,
-                "question_type": question.question_type,
-                "photo_file": request.build_absolute_uri(question.photo_file.url) if question.photo_file else None,
-                "audio_file": request.build_absolute_uri(question.audio_file.url) if question.audio_file else None,
-                "video_file": request.build_absolute_uri(question.video_file.url) if question.video_file else None,
+                **get_question_data(question, build_absolute_uri),
+                # Served by the ASGI entry point only
+                "events_url": get_events_url(collection) if settings.ASYNC_VIEWS else None,
             }
             
             return data
         else:
-            return {
-                "template": "GameResults",
-                "player_name": self.player.name,
-                "name": collection.name,
-            }
+            return self.get_results_data(game, collection)
+
+    def get_results_data(self, game, collection):
+        duration = game.duration
+        return {
+            "template": "GameResults",
+            "player_name": self.player.name,
+            "name": collection.name,
+            "score": game.score,
+            "total": game.answered_count,
+            "duration": duration.total_seconds() if duration else None,
+            "leaderboard": [
+                {**entry, "duration": entry["duration"].total_seconds()}
+                for entry in get_leaderboard(collection.pk)
+            ],
+        }
 
     def post(self, request, *args, **kwargs):
         if not self.player:
@@ -204,30 +406,129 @@ class SimpleGameView(MainView):
             return HttpResponse("Game wasn't started", status=400)
         # Game is normal
         data = json.loads(request.body)["data"]
-        answered_ids = game.questionanswer_set.values_list("question_id", flat=True)
-        unanswered = (
-            collection.question_set.filter(~Q(pk__in=answered_ids), pk=data["questionId"])
-            .order_by("order")
-            .values("pk", "text", "answer1", "answer2", "answer3", "answer4", "correct")
-            .first()
+        [result] = record_answers(
+            game, [{"questionId": data["questionId"], "answer": data["answer"]}]
         )
-        if unanswered:
-            correct = unanswered["correct"] == data["answer"]
-            models.QuestionAnswer.objects.create(
-                game=game,
-                question_id=unanswered["pk"],
-                correct=correct,
-            )
+        if result["status"] == "recorded":
             return JsonResponse({
                 "navigate_url": f"{lang}/simple-game/{collection.id}/",
                 "action": "highlightCorrect",
-                "correctAnswer": unanswered["correct"],
+                "correctAnswer": result["correctAnswer"],
             })
         return JsonResponse({
             "navigate": f"{lang}/simple-game/{collection.id}/",
         })
 
 
+class SimpleGameAnswersView(MainView):
+    url_name = "simple-game-answers"
+    url_path = "/simple-game/<int:id>/answers/"
+
+    def get_data(self, request, *args, **kwargs):
+        return {}
+
+    def post(self, request, *args, **kwargs):
+        # {"data": {"answers": [{"questionId": 11, "answer": 1, "clientSeq": 1}, ...]}}
+        # with an optional "Idempotency-Key" header (or "idempotencyKey" in data)
+        if not self.player:
+            return HttpResponse("Unauthorized", status=401)
+        try:
+            data = json.loads(request.body)["data"]
+            answers = data.get("answers", [])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return HttpResponse("Invalid request", status=400)
+        if not isinstance(answers, list) or not all(
+            isinstance(item, dict) for item in answers
+        ):
+            return HttpResponse("Invalid answers", status=400)
+        idempotency_key = request.headers.get("Idempotency-Key") or data.get(
+            "idempotencyKey"
+        )
+        cache_key = None
+        if idempotency_key:
+            cache_key = f"main:answers:{self.player.pk}:{self.kwargs['id']}:{idempotency_key}"
+            response_data = cache.get(cache_key)
+            if response_data is not None:
+                return JsonResponse(response_data)
+
+        game = (
+            models.Game.objects.filter(
+                player=self.player,
+                collection_id=self.kwargs["id"],
+                finished=False,
+            )
+            .order_by("-pk")
+            .first()
+        )
+        if not game:
+            return HttpResponse("Game wasn't started", status=400)
+        response_data = {"results": record_answers(game, answers)}
+        if cache_key:
+            cache.set(
+                cache_key, response_data, settings.ANSWERS_IDEMPOTENCY_KEY_TIMEOUT
+            )
+        return JsonResponse(response_data)
+
+
+class RoomsView(MainView):
+    url_name = "rooms"
+    url_path = "/rooms/"
+
+    def get_data(self, request, *args, **kwargs):
+        if not self.player:
+            return {"navigate": "/welcome/"}
+        return {
+            "rooms": list(
+                models.Room.objects.filter(
+                    host=self.player, finished_datetime__isnull=True
+                ).values("code", "collection_id", "question_index")
+            ),
+        }
+
+    def post(self, request, *args, **kwargs):
+        # {"data": {"collectionId": 1}}, the host then connects to socket_url
+        if not self.player:
+            return HttpResponse("Unauthorized", status=401)
+        data = json.loads(request.body)["data"]
+        collection = models.Collection.objects.filter(id=data.get("collectionId")).first()
+        if not collection:
+            return HttpResponse("Not found", status=404)
+        while True:
+            code = get_random_string(6, "ABCDEFGHJKLMNPQRSTUVWXYZ23456789")
+            if not models.Room.objects.filter(code=code).exists():
+                break
+        room = models.Room.objects.create(code=code, collection=collection, host=self.player)
+        return JsonResponse({"code": room.code, "socket_url": f"/ws/rooms/{room.code}/"})
+
+
+def get_bible_fields():
+    return {
+        "type": "Fields",
+        "fields": [
+            {"from_field": "name"},
+            {
+                "type": "ForeignKeyListField",
+                "k": "question",
+                "fields": [
+                    {"from_field": "id"},
+                    {"from_field": "text"},
+                    {"from_field": "answer1"},
+                    {"from_field": "answer2"},
+                    {"from_field": "answer3"},
+                    {"from_field": "answer4"},
+                    {"from_field": "correct"},
+                    {"from_field": "order"},
+                ],
+            },
+        ],
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def get_bible_validator():
+    return compile_validator(apply_model_to_fields(get_bible_fields(), models.Collection))
+
+
 @method_decorator(csrf_exempt, name="dispatch")
 class LoadFromBibleView(ApiView):
     url_name = "load-from-bible"
@@ -238,28 +539,11 @@ class LoadFromBibleView(ApiView):
 
     def post(self, request, *args, **kwargs):
         # curl -XPOST http://127.0.0.1:8000/api/load-from-bible-0d66a7dd-a69d-4a8d-ae59-7b379ceb9c12/ -d'{"name": "test1", "question": [{"order": 1, "text": "one", "answer1": "two", "answer2": "three", "answer3": "four", "answer4": "five", "correct": 3}]}'
-        obj = write_fields(
-            {
-                "type": "Fields",
-                "fields": [
-                    {"from_field": "name"},
-                    {
-                        "type": "ForeignKeyListField",
-                        "k": "question",
-                        "fields": [
-                            {"from_field": "id"},
-                            {"from_field": "text"},
-                            {"from_field": "answer1"},
-                            {"from_field": "answer2"},
-                            {"from_field": "answer3"},
-                            {"from_field": "answer4"},
-                            {"from_field": "correct"},
-                            {"from_field": "order"},
-                        ],
-                    },
-                ],
-            },
-            models.Collection(),
-            json.loads(request.body),
-        )
+        data = json.loads(request.body)
+        # All the errors at once, before writing anything
+        errors = get_bible_validator()(data)
+        if errors:
+            return JsonResponse({"errors": errors}, status=400)
+        with transaction.atomic():
+            obj = write_fields(get_bible_fields(), models.Collection(), data)
         return JsonResponse({"id": obj.id})
\ No newline at end of file
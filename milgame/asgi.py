@@ -2,6 +2,10 @@
 ASGI config for milgame project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The game views are served by their async variants (main/async_views.py),
+the WebSockets of live rooms by main/rooms.py and the game event
+streams by main/events.py,
+see milgame/asgi_server.py to run it.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -12,5 +16,18 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'milgame.settings')
+os.environ.setdefault('MILGAME_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# These need the apps loaded
+from main.events import GAME_EVENTS_PATH, game_events_application  # noqa: E402
+from main.rooms import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        return await websocket_application(scope, receive, send)
+    if scope["type"] == "http" and GAME_EVENTS_PATH.match(scope["path"]):
+        return await game_events_application(scope, receive, send)
+    return await django_application(scope, receive, send)
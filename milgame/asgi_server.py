@@ -0,0 +1,41 @@
+"""
+Runs milgame.asgi with uvicorn:
+
+    python -m milgame.asgi_server
+
+A single worker process keeps many slow (mobile) connections open at once:
+reading requests and writing responses doesn't hold a thread, only the
+database work does (Django runs it in a thread of its own).
+Tuned with the MILGAME_ASGI_* env variables below.
+"""
+import os
+
+import uvicorn
+
+CONFIG = {
+    "host": os.environ.get("MILGAME_ASGI_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("MILGAME_ASGI_PORT", 8000)),
+    # Add workers for more CPU, not for more concurrent clients
+    "workers": int(os.environ.get("MILGAME_ASGI_WORKERS", 1)),
+    # Above this many open connections and tasks, answer 503 instead of queueing
+    # (room sockets count too, a worker is meant for 1000 of them)
+    "limit_concurrency": int(os.environ.get("MILGAME_ASGI_LIMIT_CONCURRENCY", 2000)),
+    "backlog": int(os.environ.get("MILGAME_ASGI_BACKLOG", 2048)),
+    # Mobile clients are slow to send their next request on a kept-alive connection
+    "timeout_keep_alive": int(os.environ.get("MILGAME_ASGI_KEEP_ALIVE", 30)),
+    "proxy_headers": True,
+    "forwarded_allow_ips": os.environ.get("MILGAME_ASGI_FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    "lifespan": "off",
+    "ws": "auto",
+    "ws_ping_interval": 20,
+    "ws_ping_timeout": 20,
+    "access_log": os.environ.get("MILGAME_ASGI_ACCESS_LOG", "") == "1",
+}
+
+
+def main():
+    uvicorn.run("milgame.asgi:application", **CONFIG)
+
+
+if __name__ == "__main__":
+    main()
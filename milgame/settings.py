@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -20,7 +22,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = '3ue_-s*v69g5r^fp)g&saf0n=@jf9hl67c344xdy7*)dcv^#=l'
+# Set MILGAME_SECRET_KEY in production: the committed key is for development
+SECRET_KEY = os.environ.get('MILGAME_SECRET_KEY', '3ue_-s*v69g5r^fp)g&saf0n=@jf9hl67c344xdy7*)dcv^#=l')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
@@ -44,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.instrumentation.InstrumentationMiddleware',
+    'main.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -75,6 +80,22 @@ TEMPLATES = [
 WSGI_APPLICATION = 'milgame.wsgi.application'
 
 
+# Lean startup, for the API lambda (milgame/wsgi_lean.py): without the admin
+# (served by milgame/wsgi.py), messages and staticfiles, a cold start imports
+# a lot less (see bench_importtime)
+LEAN_API = os.environ.get('MILGAME_LEAN_API', '') == '1'
+LEAN_API_EXCLUDED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'adminsortable2',
+]
+if LEAN_API:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in LEAN_API_EXCLUDED_APPS]
+    MIDDLEWARE.remove('django.contrib.messages.middleware.MessageMiddleware')
+    TEMPLATES[0]['OPTIONS']['context_processors'].remove('django.contrib.messages.context_processors.messages')
+
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
@@ -96,6 +117,18 @@ DATABASES = {
 }
 
 
+# Sessions only hold PLAYER_ID: by default keep them in the cache, backed by
+# the database, so that most requests don't cost a session SELECT. Any of "db",
+# "cached_db", "cache", "file" and "signed_cookies" can be chosen with the env
+# variable. A signed cookie can't be revoked on logout, and anyone with the
+# SECRET_KEY can forge one: it requires a MILGAME_SECRET_KEY
+SESSION_BACKEND = os.environ.get('MILGAME_SESSION_BACKEND', 'cached_db')
+if SESSION_BACKEND == 'signed_cookies' and not os.environ.get('MILGAME_SECRET_KEY'):
+    raise ImproperlyConfigured('MILGAME_SESSION_BACKEND=signed_cookies requires MILGAME_SECRET_KEY')
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + SESSION_BACKEND
+SESSION_SAVE_EVERY_REQUEST = False
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -114,6 +147,27 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'main.hashers.PlayerPBKDF2PasswordHasher',
+]
+
+# Player passwords: the cost is tuned so that a sign-in stays within
+# PLAYER_LOGIN_LATENCY_BUDGET_MS under bursts (see bench_login)
+PLAYER_PASSWORD_HASHER = 'player_pbkdf2_sha256'
+PLAYER_PASSWORD_ITERATIONS = int(os.environ.get('MILGAME_PLAYER_PASSWORD_ITERATIONS', 120000))
+PLAYER_LOGIN_LATENCY_BUDGET_MS = 250
+# A client (and a client on a player name) gets 10 attempts, then one every
+# 6 seconds
+PLAYER_LOGIN_RATE_LIMIT = {"capacity": 10, "rate": 1 / 6}
+# Reverse proxies in front of the app which append to X-Forwarded-For: the
+# client address is the hop the outermost one added. 0: REMOTE_ADDR
+TRUSTED_PROXY_COUNT = int(os.environ.get('MILGAME_TRUSTED_PROXY_COUNT', 0))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
@@ -144,7 +198,125 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles_build', 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, '/media/')
+# Stored by content hash, with a reference count (main/storage.py)
+DEFAULT_FILE_STORAGE = 'main.storage.ContentAddressedStorage'
+
+# Uploads are streamed to temporary files, hashed and size checked on the
+# fly, and so are the base64 files of the framework (see main/uploads.py)
+FILE_UPLOAD_HANDLERS = ['main.uploads.StreamingUploadHandler']
+UPLOAD_MAX_FILE_SIZE = int(os.environ.get('MILGAME_UPLOAD_MAX_FILE_SIZE', 200 * 1024 * 1024))
 
 FRONTEND_DEV_MODE = 1
 
 LOCALE_PATHS = [BASE_DIR + '/locale/']
+
+# Caches. The whole responses of some API views (main/response_cache.py)
+# go to "responses": "locmem", "file", "redis" or "fakeredis"
+# (Django's redis backend over an in-process fake server, for tests)
+
+RESPONSE_CACHE_BACKEND = os.environ.get('MILGAME_RESPONSE_CACHE', 'locmem')
+RESPONSE_CACHES = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'responses'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('MILGAME_REDIS_URL', 'redis://127.0.0.1:6379'),
+    },
+    'fakeredis': {
+        'BACKEND': 'main.cache_backends.LocalRedisCache',
+    },
+}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': RESPONSE_CACHES[RESPONSE_CACHE_BACKEND],
+}
+# Longest wait for another request to build a missing response. A sync
+# worker is blocked while it waits, so it gives up sooner and builds it itself
+RESPONSE_CACHE_LOCK_TIMEOUT = 5
+RESPONSE_CACHE_SYNC_WAIT = 0.5
+
+# Reference data of the forms and filters (main/reference_data.py), dropped
+# on model signals, and at the latest after this many seconds
+REFERENCE_DATA_TIMEOUT = 300
+
+# Debug tracing of the framework's walkers (main/tracing.py), as JSON lines
+# on stderr. Off unless MILGAME_TRACE=1: a disabled span costs a level check
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'trace': {'()': 'main.tracing.TraceFormatter'},
+    },
+    'handlers': {
+        'trace': {'class': 'logging.StreamHandler', 'formatter': 'trace'},
+    },
+    'loggers': {
+        'main.tracing': {
+            'handlers': ['trace'],
+            'level': 'DEBUG' if os.environ.get('MILGAME_TRACE', '') == '1' else 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Instrumentation (main/instrumentation.py): queries and timings per view,
+# in a Server-Timing header (in DEBUG, or with MILGAME_SERVER_TIMING=1: it
+# tells anyone how long the database takes) and at /metrics/ (Prometheus),
+# which requires "Authorization: Bearer <METRICS_TOKEN>" (only served in
+# DEBUG without one)
+
+SERVER_TIMING = DEBUG or os.environ.get('MILGAME_SERVER_TIMING', '') == '1'
+METRICS_TOKEN = os.environ.get('MILGAME_METRICS_TOKEN', '')
+# Raise instead of logging when a view goes over its query_budget (the tests)
+QUERY_BUDGETS_ENFORCED = False
+
+# Response compression (main/middleware.py)
+
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+
+# Game
+
+CORRECT_ANSWERS_CACHE_TIMEOUT = 300
+ANSWERS_IDEMPOTENCY_KEY_TIMEOUT = 24 * 60 * 60
+LEADERBOARD_SIZE = 10
+# "rows" (a QuestionAnswer per answer) or "packed" (bitmaps on Game), for new games
+GAME_ANSWER_STORAGE = os.environ.get('MILGAME_GAME_ANSWER_STORAGE', 'rows')
+GAME_ANSWER_TIMINGS = True
+# Serve the game views with their async variants (main/async_views.py),
+# turned on by milgame/asgi.py
+ASYNC_VIEWS = os.environ.get('MILGAME_ASYNC_VIEWS', '') == '1'
+# Seconds between keep-alive comments on the game event streams (main/events.py)
+GAME_EVENTS_HEARTBEAT = 15
+
+# Live rooms (main/rooms.py)
+
+ROOM_BROKER = 'main.broker.LocalBroker'
+# Answers are written every ROOM_FLUSH_INTERVAL seconds or ROOM_FLUSH_SIZE answers
+ROOM_FLUSH_INTERVAL = 1.0
+ROOM_FLUSH_SIZE = 500
+# Messages a player's socket may lag behind before it's disconnected
+ROOM_SOCKET_QUEUE_SIZE = 100
+# Seconds without the host before the room is finished
+ROOM_HOST_TIMEOUT = 300
+
+# Statistics
+
+STATS_REFRESH_CHUNK_SIZE = 50000
+STATS_REFRESH_LAG = 60
+
+# Archive of old answers (see main/archive.py)
+
+ANSWER_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
+ANSWER_ARCHIVE_DAYS = 90
+ANSWER_ARCHIVE_CHUNK_SIZE = 10000
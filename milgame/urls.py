@@ -13,18 +13,37 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, re_path
 from logicore_django_react.urls import react_reload_and_static_urls, react_html_template_urls
 from main import views # required
-from logicore_django_react_pages.views import all_api_urls
-from django.conf.urls.i18n import i18n_patterns
+from main.instrumentation import metrics_view
 from django.conf import settings
+if settings.ASYNC_VIEWS:
+    from main import async_views # replaces the game views
+from logicore_django_react_pages.views import ApiView, all_subclasses
+from django.conf.urls.i18n import i18n_patterns
 from django.conf.urls.static import static
 
-urlpatterns = [
-    *i18n_patterns(path('admin/', admin.site.urls), prefix_default_language=False),
-    *all_api_urls(),
+
+def api_urls():
+    # As all_api_urls(), the async variants only when they're turned on
+    # (importing main.async_views, as the tests do, isn't enough)
+    return i18n_patterns(*(
+        path(f"api{view.url_path}", view.as_view())
+        for view in all_subclasses(ApiView)
+        if hasattr(view, "url_path")
+        and (settings.ASYNC_VIEWS or view.__module__ != "main.async_views")
+    ), prefix_default_language=False)
+
+
+urlpatterns = []
+if apps.is_installed('django.contrib.admin'): # not in the lean API mode
+    from django.contrib import admin
+    urlpatterns += i18n_patterns(path('admin/', admin.site.urls), prefix_default_language=False)
+urlpatterns += [
+    path('metrics/', metrics_view),
+    *api_urls(),
     *i18n_patterns(re_path(r"api/.*", views.Error404ApiView.as_view()), prefix_default_language=False),
 ]
 if settings.DEBUG:
@@ -0,0 +1,12 @@
+"""
+WSGI config of the API lambda: milgame/wsgi.py without the admin
+(see LEAN_API in settings), for faster cold starts.
+"""
+
+import os
+
+os.environ.setdefault('MILGAME_LEAN_API', '1')
+
+from milgame.wsgi import application  # noqa
+
+app = application